@@ -0,0 +1,245 @@
+from array import array
+from bisect import bisect_left
+
+from TokenInfo import TokenInfo
+
+
+# typecode of the quantized weights by number of bits
+WEIGHT_TYPECODES = {8: "B", 16: "H"}
+# number of postings between two skip pointers
+SKIP_INTERVAL = 128
+
+
+def vbyte_encode(docs) -> bytes:
+    """
+    Encode the gaps between the sorted document numbers with variable byte coding.
+    Every gap is written in groups of 7 bits, the last group of a gap has the high bit set.
+    """
+    data = bytearray()
+    previous = 0
+    for doc in docs:
+        gap = doc - previous
+        previous = doc
+        while gap >= 128:
+            data.append(gap & 127)
+            gap >>= 7
+        data.append(gap | 128)
+    return bytes(data)
+
+
+def skips_encode(docs) -> bytes:
+    """
+    Get the skip pointers of the sorted document numbers encoded by vbyte_encode().
+    Every SKIP_INTERVAL postings there is a skip pointer, with the document number before the posting
+    and the byte offset of its gap, so a search can jump over the blocks of smaller documents without decoding them.
+    The skip pointers are written as a table of 32 bits integers, all the documents and then all the offsets.
+    """
+    skip_docs = array("i")
+    skip_offsets = array("i")
+    offset = 0
+    previous = 0
+    for position, doc in enumerate(docs):
+        if position and position % SKIP_INTERVAL == 0:
+            skip_docs.append(previous)
+            skip_offsets.append(offset)
+        gap = doc - previous
+        previous = doc
+        offset += 1
+        while gap >= 128:
+            offset += 1
+            gap >>= 7
+    return skip_docs.tobytes() + skip_offsets.tobytes()
+
+
+def vbyte_decode(data):
+    """Decode the document numbers encoded by vbyte_encode(), one at a time."""
+    doc = 0
+    gap = 0
+    shift = 0
+    for byte in data:
+        if byte < 128:
+            gap |= byte << shift
+            shift += 7
+        else:
+            doc += gap | (byte - 128) << shift
+            yield doc
+            gap = 0
+            shift = 0
+
+
+def quantize(weights, max_weight:float, weight_bits:int) -> array:
+    """Quantize the weights to integers of weight_bits bits, relative to the max weight of the token."""
+    levels = (1 << weight_bits) - 1
+    scale = levels / max_weight if max_weight > 0 else 0
+    return array(WEIGHT_TYPECODES[weight_bits], [min(levels, round(weight * scale)) for weight in weights])
+
+
+class CompressedPostingsCursor:
+    """
+    Class used to walk the compressed postings of a token in order of document, jumping with the skip pointers.
+
+    ...
+
+    Attributes
+    ----------
+    doc : int
+        The document of the current posting, None after the last posting.
+    weight : float
+        The weight of the current posting.
+
+    Methods
+    -------
+    next()
+        Move to the next posting.
+    next_geq()
+        Move to the first posting with a document greater than or equal to the one given.
+    """
+    __slots__ = ("_data", "_skip_docs", "_skip_offsets", "_weights", "_scale", "_doc_freq", "_position", "_offset", "_doc")
+
+    def __init__(self, data, skip_docs, skip_offsets, weights, scale:float, doc_freq:int):
+        self._data = data
+        self._skip_docs = skip_docs
+        self._skip_offsets = skip_offsets
+        self._weights = weights
+        self._scale = scale
+        self._doc_freq = doc_freq
+        self._position = -1
+        self._offset = 0
+        self._doc = 0
+        self.next()
+
+    @property
+    def doc(self):
+        return self._doc if self._position < self._doc_freq else None
+
+    @property
+    def weight(self) -> float:
+        return self._weights[self._position] * self._scale
+
+    def next(self):
+        """Move to the next posting, decoding its gap, and get its document."""
+        self._position += 1
+        if self._position >= self._doc_freq:
+            return None
+
+        data = self._data
+        offset = self._offset
+        gap = 0
+        shift = 0
+        byte = data[offset]
+        while byte < 128:
+            gap |= byte << shift
+            shift += 7
+            offset += 1
+            byte = data[offset]
+        self._offset = offset + 1
+        self._doc += gap | (byte - 128) << shift
+        return self._doc
+
+    def next_geq(self, target:int):
+        """
+        Move to the first posting with a document greater than or equal to target, and get its document.
+        The blocks with all the documents smaller than target are skipped, only the last block is decoded.
+
+        Returns
+        -------
+        int
+            The document, None if there is none.
+        """
+        if self._position >= self._doc_freq:
+            return None
+        if self._doc >= target:
+            return self._doc
+
+        # the last skip pointer with a document smaller than target, the blocks before it are not decoded
+        skip = bisect_left(self._skip_docs, target) - 1
+        if skip >= 0 and (skip + 1) * SKIP_INTERVAL - 1 > self._position:
+            self._position = (skip + 1) * SKIP_INTERVAL - 1
+            self._doc = self._skip_docs[skip]
+            self._offset = self._skip_offsets[skip]
+
+        doc = self.next()
+        while doc is not None and doc < target:
+            doc = self.next()
+        return doc
+
+
+class CompressedPostings:
+    """
+    Class used to read the compressed postings of a token, without decompressing them all at once.
+    The data has the skip pointers, then the quantized weights and then the encoded document numbers.
+
+    ...
+
+    Attributes
+    ----------
+    docs : iterator
+        The numbers of the documents, decoded while they are read.
+    weights : iterator
+        The weight of the token on every document, dequantized while they are read.
+
+    Methods
+    -------
+    cursor()
+        Get a cursor over the postings, that can skip to a document.
+    """
+    __slots__ = ("_doc_ids", "_data", "_doc_freq", "_max_weight", "_weight_bits")
+
+    def __init__(self, doc_ids:list, data, doc_freq:int, max_weight:float, weight_bits:int):
+        """
+        Parameters
+        ----------
+        doc_ids : list
+            The document ids by document number, shared by all the postings of the index.
+        data : memoryview
+            The skip pointers, the quantized weights and the encoded document numbers.
+        doc_freq : int
+            The number of postings.
+        max_weight : float
+            The max weight of the token, used to dequantize the weights.
+        weight_bits : int
+            The number of bits of the quantized weights.
+        """
+        self._doc_ids = doc_ids
+        self._data = data
+        self._doc_freq = doc_freq
+        self._max_weight = max_weight
+        self._weight_bits = weight_bits
+
+    def _skips_size(self) -> int:
+        """The size in bytes of the skip pointers."""
+        return 8 * (max(0, self._doc_freq - 1) // SKIP_INTERVAL)
+
+    def _weights_end(self) -> int:
+        """The offset in bytes of the encoded document numbers, after the quantized weights."""
+        return self._skips_size() + self._doc_freq * self._weight_bits // 8
+
+    def _quantized(self):
+        """The quantized weights."""
+        return self._data[self._skips_size():self._weights_end()].cast(WEIGHT_TYPECODES[self._weight_bits])
+
+    @property
+    def docs(self):
+        return vbyte_decode(self._data[self._weights_end():])
+
+    @property
+    def weights(self):
+        scale = self._max_weight / ((1 << self._weight_bits) - 1)
+        return map(scale.__mul__, self._quantized())
+
+    def cursor(self) -> CompressedPostingsCursor:
+        """Get a cursor over the postings, that can skip to a document."""
+        skips = self._data[:self._skips_size()].cast("i")
+        number_of_skips = len(skips) // 2
+        return CompressedPostingsCursor(self._data[self._weights_end():], skips[:number_of_skips], skips[number_of_skips:],
+                                        self._quantized(), self._max_weight / ((1 << self._weight_bits) - 1), self._doc_freq)
+
+    def __len__(self):
+        return self._doc_freq
+
+    def __iter__(self):
+        for doc, weight in zip(self.docs, self.weights):
+            yield TokenInfo(self._doc_ids[doc], weight)
+
+    def __repr__(self):
+        return ";".join(str(info) for info in self)
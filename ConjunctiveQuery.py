@@ -0,0 +1,128 @@
+import heapq
+import time
+
+from Query import Query
+from Timers import timers
+
+
+class ConjunctiveQuery(Query):
+    """
+    Class used to search the documents that have all the tokens of queries (AND).
+    The postings are intersected starting from the token with the fewest documents, the postings of the
+    other tokens skip ahead to its next document, so few postings of the common tokens are read.
+    The documents found have the same scores as Query gives them, ties included.
+
+    ...
+
+    Methods
+    -------
+    _intersect()
+        Score the documents that have all the tokens.
+    lookup_idf()
+        Search the documents that have all the tokens of the query. Using idf.
+    lookup_bm25()
+        Search the documents that have all the tokens of the query. Using bm25.
+    """
+    def _intersect(self, query_terms:list, postings:dict, top_k:int) -> list:
+        """
+        Score the documents that have all the tokens, and sort them by score.
+
+        Parameters
+        ----------
+        query_terms : list
+            The tokens and their query weights, in the order the scores are summed.
+        postings : dict
+            The postings of every token.
+        top_k : int
+            The number of documents to return, all the documents found if None.
+        """
+        if not postings or not all(len(token_postings) for token_postings in postings.values()):
+            return []
+
+        start_time = time.perf_counter()
+        cursors = {token: token_postings.cursor() for token, token_postings in postings.items()}
+        order = sorted(cursors, key=lambda token: len(postings[token]))
+        lead = cursors[order[0]]
+        others = [cursors[token] for token in order[1:]]
+
+        prox_by_doc = {}
+        doc = lead.doc
+        while doc is not None:
+            found = doc
+            for cursor in others:
+                found = cursor.next_geq(doc)
+                if found != doc:
+                    break
+
+            if found is None:
+                break
+            if found != doc:
+                doc = lead.next_geq(found)
+                continue
+
+            # a repeated document id can have more than one posting on the same token
+            weights = {}
+            for token, cursor in cursors.items():
+                weights[token] = []
+                while cursor.doc == doc:
+                    weights[token].append(cursor.weight)
+                    cursor.next()
+
+            score = 0
+            for token, query_weight in query_terms:
+                for weight in weights[token]:
+                    score += query_weight * weight
+            prox_by_doc[doc] = score
+            doc = lead.doc
+        timers.record("query.score", time.perf_counter() - start_time)
+
+        with timers.timer("query.rank"):
+            doc_ids = self._index.doc_ids
+            if top_k is None:
+                ranked = sorted(prox_by_doc.items(), key=lambda t: t[1], reverse=True)
+            else:
+                ranked = heapq.nlargest(top_k, prox_by_doc.items(), key=lambda t: t[1])
+            return [(doc_ids[doc], prox) for doc, prox in ranked]
+
+    def lookup_idf(self, top_k:int = None, pruning:bool = False) -> list:
+        """
+        Search the documents that have all the tokens of the query. Using idf.
+
+        Parameters
+        ----------
+        top_k : int
+            The number of documents to return, all the documents found if None.
+        pruning : bool
+            Not used, the intersection only scores the documents with all the tokens.
+
+        Returns
+        -------
+        list
+            The list of relevant tokens.
+        """
+        self._tokenize()
+        with timers.timer("query.fetch"):
+            self._process()
+            postings = {token: self._index.get_token_search(token) for token in self._query_vector}
+        return self._intersect(list(self._query_vector.items()), postings, top_k)
+
+    def lookup_bm25(self, top_k:int = None, pruning:bool = False) -> list:
+        """
+        Search the documents that have all the tokens of the query. Using bm25.
+
+        Parameters
+        ----------
+        top_k : int
+            The number of documents to return, all the documents found if None.
+        pruning : bool
+            Not used, the intersection only scores the documents with all the tokens.
+
+        Returns
+        -------
+        list
+            The list of relevant tokens.
+        """
+        tokens = self._tokenize()
+        with timers.timer("query.fetch"):
+            postings = {token: self._index.get_token_search(token) for token in tokens}
+        return self._intersect([(token, 1) for token in tokens], postings, top_k)
@@ -3,6 +3,7 @@ import sys
 from csv import reader
 from os import path
 from itertools import islice
+from zlib import crc32
 
 
 class CorpusReader:
@@ -15,52 +16,112 @@ class CorpusReader:
 	----------
 	number_of_read_docs : int
 		The number of read docs.
+	doc_rows : dict
+		The row of the data file of every document read, when the documents are split in shards.
 
 	Methods
 	-------
 	process()
-		Process the data file.
+		Process the next documents of the data file.
 		Return a dict with the data.
+	batches()
+		Generator over the data file, one dict of documents at a time.
+	close()
+		Close the data file.
 	"""
-	def __init__(self, data_file_path:str):
+	def __init__(self, data_file_path:str, shard:int = 0, shards:int = 1):
 		"""
 		Parameters
 		----------
 		data_file_path : str
 			The data file path.
+		shard : int
+			The shard read, only its documents are processed.
+		shards : int
+			The number of shards the documents are split in, by a hash of the document id.
 		"""
 		self._data_file_path = data_file_path
+		self._shard = shard
+		self._shards = shards
 		self._doc_index = 0
 		self._number_of_read_docs = 0
+		self._doc_rows = {}
+		self._file = None
+		self._csv_reader = None
+		self._reached_end = False
 
 	@property
 	def number_of_read_docs(self):
 		return self._number_of_read_docs
 
+	@property
+	def doc_rows(self):
+		return self._doc_rows
+
+	def _open(self) -> None:
+		"""Open the data file and skip the header, the cursor is kept between calls."""
+		if not path.exists(self._data_file_path) or not path.isfile(self._data_file_path):
+			sys.exit("Data file not found!")
+
+		# newline="" lets the csv module handle newlines embedded on quoted fields,
+		# so one record is always one document, regardless of the physical lines
+		self._file = open(self._data_file_path, "r", newline="")
+		self._csv_reader = reader(self._file)
+		next(self._csv_reader, None)
+
+	def close(self) -> None:
+		"""Close the data file."""
+		if self._file is not None:
+			self._file.close()
+			self._file = None
+			self._csv_reader = None
+
 	def process(self, number_of_files_to_read) -> tuple:
 		"""
-		Process the data file.
+		Process the next documents of the data file.
 
 		Returns
 		-------
 		tuple
 			A dict with the data as well as a boolean value checking if we have reached the end of file.
 		"""
-		if not path.exists(self._data_file_path) or not path.isfile(self._data_file_path):
-			sys.exit("Data file not found!")
+		if self._reached_end:
+			return {}, True
+
+		if self._csv_reader is None:
+			self._open()
 
 		proc_dict = {}
 		read_docs = 0
-		with open(self._data_file_path, "r") as filereader:
-			for i in range(self._doc_index + 1):
-				next(filereader)
-
-			csv_reader = reader(filereader)
-			for line in islice(csv_reader, number_of_files_to_read):
-				if line[0] != "" and line[3] != "" and line[8] != "":
-					proc_dict[line[0]] = line[3] + " " + line[8]
-					self._number_of_read_docs += 1
-				read_docs += 1
-
-		self._doc_index += number_of_files_to_read
-		return proc_dict, number_of_files_to_read != read_docs
+		for line in islice(self._csv_reader, number_of_files_to_read):
+			# crc32 is the same on every process, unlike hash(), so a document is always on the same shard
+			if line[0] != "" and line[3] != "" and line[8] != "" and \
+				(self._shards == 1 or crc32(line[0].encode()) % self._shards == self._shard):
+				proc_dict[line[0]] = line[3] + " " + line[8]
+				self._number_of_read_docs += 1
+				# the rows order the documents of all the shards as a single index numbers them
+				if self._shards > 1 and line[0] not in self._doc_rows:
+					self._doc_rows[line[0]] = self._doc_index + read_docs
+			read_docs += 1
+
+		self._doc_index += read_docs
+		if number_of_files_to_read != read_docs:
+			self._reached_end = True
+			self.close()
+		return proc_dict, self._reached_end
+
+	def batches(self, number_of_files_to_read):
+		"""
+		Generator over the data file, the file is read in a single pass.
+
+		Yields
+		------
+		dict
+			The data of the next documents.
+		"""
+		while True:
+			proc_dict, reached_end = self.process(number_of_files_to_read)
+			if proc_dict:
+				yield proc_dict
+			if reached_end:
+				break
@@ -0,0 +1,137 @@
+from concurrent.futures import ProcessPoolExecutor
+from math import log2
+
+from QueryReader import QueryReader
+from Timers import timers
+
+
+# number of queries evaluated at a time by a worker process
+CHUNK_SIZE = 100
+
+_worker_query_reader = None
+
+
+def _init_worker(query_reader:QueryReader) -> None:
+    """Keep the query reader on the worker process, so it is only sent once."""
+    global _worker_query_reader
+    _worker_query_reader = query_reader
+    # a forked worker starts with a copy of the histograms of the parent, only its own are sent back
+    timers.reset()
+
+
+def _evaluate_worker(rankings:list, cutoffs:list) -> tuple:
+    """Evaluate a chunk of queries on a worker process, the stages timed on the worker are sent back."""
+    results = []
+    for query_id, docs in rankings:
+        with timers.timer("query.evaluate"):
+            results.append((query_id, evaluate_query(_worker_query_reader, query_id, docs, cutoffs)))
+    histograms = timers.histograms
+    timers.reset()
+    return results, histograms
+
+
+def evaluate_query(query_reader:QueryReader, query_id, docs:list, cutoffs:list) -> dict:
+    """
+    Evaluate the ranked documents of a query at every cutoff, in a single pass over the ranking.
+
+    Parameters
+    ----------
+    query_reader : QueryReader
+        The queries, with the relevance of the documents.
+    query_id : str
+        The query id.
+    docs : list
+        The ranked document ids.
+    cutoffs : list
+        The numbers of retrieved documents the metrics are calculated for.
+
+    Returns
+    -------
+    dict
+        The precision, recall, f-measure, average precision and ndcg, by cutoff.
+    """
+    rank_values = query_reader.get_rank_values(query_id)
+    num_docs_relevance = len(rank_values)
+
+    results = {}
+    num_docs_relevance_retrieved = 0
+    docs_precision = 0
+    dcg = 0
+    remaining_cutoffs = sorted(cutoffs)
+    for k, doc in enumerate(docs[:remaining_cutoffs[-1]], start=1):
+        if doc in rank_values:
+            num_docs_relevance_retrieved += 1
+            # precision at every relevant document
+            docs_precision += num_docs_relevance_retrieved / k
+            dcg += rank_values[doc] if k == 1 else rank_values[doc] / log2(k)
+
+        while remaining_cutoffs and remaining_cutoffs[0] == k:
+            results[remaining_cutoffs.pop(0)] = (num_docs_relevance_retrieved, docs_precision, dcg)
+
+    # cutoffs past the end of the ranking
+    for num_docs_retrieved in remaining_cutoffs:
+        results[num_docs_retrieved] = (num_docs_relevance_retrieved, docs_precision, dcg)
+
+    for num_docs_retrieved in cutoffs:
+        num_docs_relevance_retrieved, docs_precision, dcg = results[num_docs_retrieved]
+
+        precision = 0
+        recall = 0
+        f_measure = 0
+        average_precision = 0
+        ndcg = 0
+
+        if num_docs_relevance_retrieved != 0:
+            if num_docs_retrieved != 0:
+                precision = num_docs_relevance_retrieved / num_docs_retrieved
+
+            if num_docs_relevance != 0:
+                recall = num_docs_relevance_retrieved / num_docs_relevance
+                average_precision = docs_precision / num_docs_relevance
+
+            if (precision + recall) != 0:
+                f_measure = (2 * precision * recall) / (precision + recall)
+
+            perfect_dcg = query_reader.get_perfect_dcg(query_id, num_docs_retrieved)
+            if perfect_dcg != 0:
+                ndcg = dcg / perfect_dcg
+
+        results[num_docs_retrieved] = (precision, recall, f_measure, average_precision, ndcg)
+    return results
+
+
+def evaluate(query_reader:QueryReader, rankings:dict, cutoffs:list, workers:int = 1) -> dict:
+    """
+    Evaluate the ranked documents of every query, in a pool of processes when there is more than one worker.
+
+    Parameters
+    ----------
+    query_reader : QueryReader
+        The queries, with the relevance of the documents.
+    rankings : dict
+        The ranked document ids, by query id.
+    cutoffs : list
+        The numbers of retrieved documents the metrics are calculated for.
+    workers : int
+        The number of processes used to evaluate the queries.
+
+    Returns
+    -------
+    dict
+        The metrics by cutoff, by query id.
+    """
+    if workers <= 1:
+        results = {}
+        for query_id, docs in rankings.items():
+            with timers.timer("query.evaluate"):
+                results[query_id] = evaluate_query(query_reader, query_id, docs, cutoffs)
+        return results
+
+    rankings = list(rankings.items())
+    chunks = [rankings[i:i + CHUNK_SIZE] for i in range(0, len(rankings), CHUNK_SIZE)]
+    results = {}
+    with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(query_reader,)) as executor:
+        for chunk, histograms in executor.map(_evaluate_worker, chunks, [cutoffs] * len(chunks)):
+            results.update(chunk)
+            timers.merge(histograms)
+    return results
@@ -0,0 +1,139 @@
+from array import array
+
+from Indexer import Indexer
+from Postings import Postings
+from Timers import timers
+
+
+class ImpactIndex:
+	"""
+	Class used to keep the postings of every token sorted by weight (impact ordered), next to an index
+	sorted by document. The first postings of a token, the ones with the highest weights, are its champion list,
+	with champions only the champion lists are kept.
+	The impact ordered postings are sorted when first searched, or all at once by build().
+
+	...
+
+	Attributes
+	----------
+	doc_ids : list
+		The document ids, by document number.
+	champions : int
+		The number of postings of the champion lists, None to keep all the postings.
+	version : int
+		The version of the index.
+
+	Methods
+	-------
+	build()
+		Sort the postings of all the tokens of an in memory index.
+	get_token_impacts()
+		Get the postings of the token, sorted by weight.
+	get_token_search()
+		Search for the token on indexs.
+	get_token_freq()
+		Get the token fregquency.
+	get_token_max_weight()
+		Get the max weight of the token on any document.
+	"""
+	def __init__(self, index:Indexer, champions:int = None):
+		"""
+		Parameters
+		----------
+		index : Indexer
+			The index sorted by document, an Indexer, IndexReader or IncrementalIndexer.
+		champions : int
+			The number of postings of the champion lists, None to keep all the postings.
+		"""
+		self._index = index
+		self._champions = champions
+		self._impacts = {}
+		self._version = getattr(index, "version", 0)
+
+	@property
+	def doc_ids(self) -> list:
+		return self._index.doc_ids
+
+	@property
+	def champions(self) -> int:
+		return self._champions
+
+	@property
+	def version(self) -> int:
+		return getattr(self._index, "version", 0)
+
+	def _sort(self, postings:Postings) -> tuple:
+		"""
+		Sort the postings by weight, the ties are kept in order of document.
+		A repeated document id can have more than one posting on the token, they are summed as one.
+		"""
+		docs, weights = list(postings.docs), list(postings.weights)
+		if len(set(docs)) != len(docs):
+			summed = {}
+			for doc, weight in zip(docs, weights):
+				summed[doc] = summed.get(doc, 0) + weight
+			docs, weights = list(summed), list(summed.values())
+
+		order = sorted(range(len(docs)), key=weights.__getitem__, reverse=True)
+		if self._champions is not None:
+			order = order[:self._champions]
+		return array("i", [docs[i] for i in order]), array("d", [weights[i] for i in order])
+
+	def build(self) -> None:
+		"""Sort the postings of all the tokens of an in memory index, at once."""
+		with timers.timer("index.impacts"):
+			for token in self._index.index:
+				self.get_token_impacts(token)
+
+	def get_token_impacts(self, token) -> tuple:
+		"""
+		Get the postings of the token sorted by weight, only the champion list with champions.
+		They are sorted again when the index changes.
+
+		Returns
+		-------
+		tuple
+			The documents and the weights.
+		"""
+		version = self.version
+		if version != self._version:
+			self._impacts.clear()
+			self._version = version
+
+		impacts = self._impacts.get(token)
+		if impacts is None:
+			impacts = self._impacts[token] = self._sort(self._index.get_token_search(token))
+		return impacts
+
+	def get_token_search(self, token) -> Postings:
+		"""
+		Search for the token on indexs.
+
+		Returns
+		-------
+		Postings
+			The postings of the token, sorted by document.
+		"""
+		return self._index.get_token_search(token)
+
+	def get_token_freq(self, token) -> float:
+		"""
+		Get the token fregquency.
+
+		Returns
+		-------
+		float
+			The token frequency.
+		"""
+		return self._index.get_token_freq(token)
+
+	def get_token_max_weight(self, token) -> float:
+		"""
+		Get the max weight of the token on any document.
+
+		Returns
+		-------
+		float
+			The max weight.
+		"""
+		return self._index.get_token_max_weight(token)
@@ -0,0 +1,141 @@
+import heapq
+import time
+
+from Query import Query, BOUND_MARGIN
+from Timers import timers
+
+
+def _impact_end(weights, start:int, min_weight:float) -> int:
+    """Get the position of the first weight smaller than min_weight, from start, the weights are sorted in decreasing order."""
+    end = len(weights)
+    while start < end:
+        middle = (start + end) // 2
+        if weights[middle] >= min_weight:
+            start = middle + 1
+        else:
+            end = middle
+    return start
+
+
+class ImpactQuery(Query):
+    """
+    Class used to search the k best documents of queries on an ImpactIndex, from the postings of highest impact.
+    The impact of a posting is its weight times the query weight of its token. The postings of all the tokens
+    are scored in rounds, each round down to half the impact of the previous one, and the search stops once
+    the documents not found yet can not enter the top k. The documents found that can still enter it are scored
+    exactly, so the result is the same as Query. With champion lists only the champions of every token are
+    scored, and the result is approximate.
+
+    ...
+
+    Methods
+    -------
+    _impact_search()
+        Search the k best documents, from the postings of highest impact.
+    lookup_idf()
+        Search the tokens relevant for the query. Using idf.
+    lookup_bm25()
+        Search the tokens relevant for the query. Using bm25.
+    """
+    def _impact_search(self, query_terms:list, terms:dict, postings:dict, top_k:int) -> list:
+        """
+        Search the k best documents, from the postings of highest impact.
+
+        Parameters
+        ----------
+        query_terms : list
+            The tokens and their query weights, in the order the scores are summed.
+        terms : dict
+            The query weight and upper bound of every token.
+        postings : dict
+            The documents and weights of every token, sorted by document.
+        top_k : int
+            The number of documents to return.
+        """
+        if top_k < 1:
+            return []
+
+        start_time = time.perf_counter()
+        impacts = {token: self._index.get_token_impacts(token) for token in terms}
+        positions = dict.fromkeys(terms, 0)
+        prox_by_doc = {}
+        threshold = max((terms[token][0] * weights[0] for token, (_, weights) in impacts.items() if weights), default=0) / 2
+        while True:
+            for token, (query_weight, _) in terms.items():
+                docs, weights = impacts[token]
+                start = positions[token]
+                if query_weight > 0:
+                    end = _impact_end(weights, start, threshold / query_weight)
+                else:
+                    end = len(weights) if threshold <= 0 else start
+                get = prox_by_doc.get
+                for doc, weight in zip(docs[start:end], weights[start:end]):
+                    prox_by_doc[doc] = get(doc, 0) + query_weight * weight
+                positions[token] = end
+
+            # the impact of the next posting of every token bounds what a document can still add
+            frontiers = [terms[token][0] * weights[positions[token]]
+                         for token, (_, weights) in impacts.items() if positions[token] < len(weights)]
+            remaining = sum(frontiers) * BOUND_MARGIN
+            if not frontiers or (len(prox_by_doc) >= top_k and
+                                 heapq.nlargest(top_k, prox_by_doc.values())[-1] > remaining):
+                break
+            threshold = min(threshold / 2, max(frontiers))
+        timers.record("query.score", time.perf_counter() - start_time)
+
+        if not prox_by_doc:
+            return []
+        kth_score = heapq.nlargest(top_k, prox_by_doc.values())[-1] / BOUND_MARGIN if len(prox_by_doc) >= top_k else 0
+        return self._exact_rank(query_terms, postings, [doc for doc, prox in prox_by_doc.items()
+                                                        if (prox + remaining) * BOUND_MARGIN >= kth_score], top_k)
+
+    def lookup_idf(self, top_k:int = None, pruning:bool = False) -> list:
+        """
+        Search the tokens relevant for the query. Using idf.
+
+        Parameters
+        ----------
+        top_k : int
+            The number of documents to return, all the documents found by Query if None.
+        pruning : bool
+            Not used, the search stops early by itself.
+
+        Returns
+        -------
+        list
+            The list of relevant tokens.
+        """
+        if top_k is None:
+            return super().lookup_idf()
+
+        self._tokenize()
+        with timers.timer("query.fetch"):
+            self._process()
+            query_terms = list(self._query_vector.items())
+            terms, postings = self._max_score_postings(query_terms)
+        return self._impact_search(query_terms, terms, postings, top_k)
+
+    def lookup_bm25(self, top_k:int = None, pruning:bool = False) -> list:
+        """
+        Search the tokens relevant for the query. Using bm25.
+
+        Parameters
+        ----------
+        top_k : int
+            The number of documents to return, all the documents found by Query if None.
+        pruning : bool
+            Not used, the search stops early by itself.
+
+        Returns
+        -------
+        list
+            The list of relevant tokens.
+        """
+        if top_k is None:
+            return super().lookup_bm25()
+
+        tokens = self._tokenize()
+        with timers.timer("query.fetch"):
+            query_terms = [(token, 1) for token in tokens]
+            terms, postings = self._max_score_postings(query_terms)
+        return self._impact_search(query_terms, terms, postings, top_k)
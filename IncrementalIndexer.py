@@ -0,0 +1,382 @@
+import threading
+
+from array import array
+from math import log10, sqrt
+
+from Tokenizer import Tokenizer
+from Postings import Postings
+from Timers import timers
+
+
+class Segment:
+	"""
+	Class used to keep the raw postings of a group of documents, it is not changed once created.
+
+	...
+
+	Attributes
+	----------
+	postings : dict
+		The document numbers and the frequencies of every token.
+	docs : array
+		The numbers of the documents of the segment.
+	level : int
+		The number of times the segment was merged, segments of the same level have similar sizes.
+	"""
+	__slots__ = ("postings", "docs", "level")
+
+	def __init__(self, postings:dict, docs:array, level:int = 0):
+		self.postings = postings
+		self.docs = docs
+		self.level = level
+
+
+class IncrementalIndexer:
+	"""
+	Class used by index the tokens, with documents added and deleted after the index is built.
+	The raw frequencies of the tokens and the lengths of the documents are kept, in segments,
+	and the weights are only calculated when a token is searched, with the current statistics.
+	Small segments are merged on a background thread.
+
+	...
+
+	Attributes
+	----------
+	doc_ids : list
+		The document ids, by document number.
+	number_of_docs : int
+		The number of documents on the index.
+	version : int
+		The number of updates of the index, it changes when the results of a query may change.
+
+	Methods
+	-------
+	add_documents()
+		Add documents to the index, a document already indexed is replaced.
+	delete_documents()
+		Delete documents from the index.
+	wait_merges()
+		Wait for the background merges.
+	get_token_search()
+		Search for the token on indexs.
+	get_token_freq()
+		Get the token fregquency.
+	get_token_max_weight()
+		Get the max weight of the token on any document.
+	"""
+	def __init__(self, tokenizer:Tokenizer, merge_factor:int = 8):
+		"""
+		Parameters
+		----------
+		tokenizer : Tokenizer
+			The tokenizer object that will tokenize the documents.
+		merge_factor : int
+			The number of segments of the same level that are merged together.
+		"""
+		self._tokenizer = tokenizer
+		self._merge_factor = merge_factor
+		self._segments = []
+		self._doc_ids = []
+		self._doc_numbers = {}
+		self._doc_lens = array("i")
+		self._doc_norms = array("d")
+		self._deleted = set()
+		self._number_of_docs = 0
+		self._total_doc_len = 0
+		# statistics and weights calculated since the last update
+		self._doc_freqs = {}
+		self._token_postings = {}
+		self._version = 0
+		self._lock = threading.RLock()
+		# only one merge at a time, the segments selected are replaced when it ends
+		self._merge_lock = threading.Lock()
+		self._merge_thread = None
+
+	@property
+	def doc_ids(self) -> list:
+		return self._doc_ids
+
+	@property
+	def number_of_docs(self) -> int:
+		return self._number_of_docs
+
+	@property
+	def version(self) -> int:
+		return self._version
+
+	def __getstate__(self):
+		# the locks and the merge thread can not be pickled, the merges must be over
+		self.wait_merges()
+		state = self.__dict__.copy()
+		del state["_lock"], state["_merge_lock"], state["_merge_thread"]
+		return state
+
+	def __setstate__(self, state):
+		self.__dict__.update(state)
+		self._lock = threading.RLock()
+		self._merge_lock = threading.Lock()
+		self._merge_thread = None
+
+	@staticmethod
+	def _index_batch(tokenizer:Tokenizer, all_files:dict) -> tuple:
+		"""
+		Index a batch of documents with the raw frequencies of the tokens.
+
+		Returns
+		-------
+		tuple
+			The documents and frequencies of every token, and the length and norm of every document.
+		"""
+		postings = {}
+		doc_lens = {}
+		doc_norms = {}
+		for doc_id, data in all_files.items():
+			doc_weight = 0
+			token_list, doc_lens[doc_id] = tokenizer.term_frequencies(data)
+			for token, freq in token_list.items():
+				doc_weight += (1 + log10(freq)) ** 2
+				docs, freqs = postings.setdefault(token, ([], []))
+				docs.append(doc_id)
+				freqs.append(freq)
+			doc_norms[doc_id] = sqrt(doc_weight)
+
+		return postings, doc_lens, doc_norms
+
+	def _invalidate(self) -> None:
+		"""Drop the statistics and weights calculated before an update."""
+		self._doc_freqs = {}
+		self._token_postings = {}
+		self._version += 1
+
+	def _delete(self, doc_id) -> None:
+		"""Delete a document, its postings are only removed when its segment is merged."""
+		doc = self._doc_numbers.pop(doc_id, None)
+		if doc is None:
+			return
+		self._deleted.add(doc)
+		self._number_of_docs -= 1
+		self._total_doc_len -= self._doc_lens[doc]
+
+	def add_documents(self, all_files:dict) -> None:
+		"""
+		Add documents to the index, as a new segment. A document already indexed is replaced.
+
+		Parameters
+		----------
+		all_files : dict
+			The data of the documents, by document id.
+		"""
+		with timers.timer("index.tokenize"):
+			postings, doc_lens, doc_norms = self._index_batch(self._tokenizer, all_files)
+		with self._lock, timers.timer("index.index"):
+			segment_docs = array("i")
+			for doc_id in doc_lens:
+				self._delete(doc_id)
+				self._doc_numbers[doc_id] = len(self._doc_ids)
+				segment_docs.append(len(self._doc_ids))
+				self._doc_ids.append(doc_id)
+				self._doc_lens.append(doc_lens[doc_id])
+				self._doc_norms.append(doc_norms[doc_id])
+				self._number_of_docs += 1
+				self._total_doc_len += doc_lens[doc_id]
+
+			doc_numbers = self._doc_numbers
+			segment_postings = {token: (array("i", [doc_numbers[doc_id] for doc_id in docs]), array("i", freqs))
+								for token, (docs, freqs) in postings.items()}
+			self._segments.append(Segment(segment_postings, segment_docs))
+			self._invalidate()
+
+		self._start_merge()
+
+	def delete_documents(self, doc_ids) -> None:
+		"""
+		Delete documents from the index, the ids not indexed are ignored.
+
+		Parameters
+		----------
+		doc_ids : iterable
+			The ids of the documents.
+		"""
+		with self._lock:
+			for doc_id in doc_ids:
+				self._delete(doc_id)
+			self._invalidate()
+
+	def _select_merge(self) -> list:
+		"""Select the last segments, when there are merge_factor of them with the same level."""
+		with self._lock:
+			segments = self._segments
+			if len(segments) < self._merge_factor:
+				return []
+			selected = segments[-self._merge_factor:]
+			if any(segment.level != selected[0].level for segment in selected):
+				return []
+			return selected
+
+	def _merge(self, segments:list) -> None:
+		"""
+		Merge segments into one, without the postings of the deleted documents.
+		The segments are adjacent, so the postings stay sorted by document.
+		"""
+		with self._lock:
+			deleted = set(self._deleted)
+
+		postings = {}
+		for segment in segments:
+			for token, (docs, freqs) in segment.postings.items():
+				merged_docs, merged_freqs = postings.setdefault(token, (array("i"), array("i")))
+				if deleted:
+					for doc, freq in zip(docs, freqs):
+						if doc not in deleted:
+							merged_docs.append(doc)
+							merged_freqs.append(freq)
+				else:
+					merged_docs.extend(docs)
+					merged_freqs.extend(freqs)
+
+		segment_docs = array("i", [doc for segment in segments for doc in segment.docs if doc not in deleted])
+		merged = Segment({token: token_postings for token, token_postings in postings.items() if token_postings[0]},
+						 segment_docs, segments[0].level + 1)
+
+		with self._lock:
+			first = self._segments.index(segments[0])
+			self._segments[first:first + len(segments)] = [merged]
+			# the postings of these documents are gone, the other deletions are still pending
+			# the statistics and weights do not change
+			for segment in segments:
+				self._deleted.difference_update(doc for doc in segment.docs if doc in deleted)
+
+	def _merge_segments(self) -> None:
+		"""Merge the segments while there are merge_factor segments of the same level."""
+		with self._merge_lock:
+			while True:
+				segments = self._select_merge()
+				if not segments:
+					break
+				with timers.timer("index.merge"):
+					self._merge(segments)
+
+	def _start_merge(self) -> None:
+		"""Merge the segments on a background thread, if it is not already running."""
+		with self._lock:
+			if self._merge_thread is not None and self._merge_thread.is_alive():
+				return
+			if not self._select_merge():
+				return
+			self._merge_thread = threading.Thread(target=self._merge_segments, daemon=True)
+			self._merge_thread.start()
+
+	def wait_merges(self) -> None:
+		"""Wait for the background merges, and merge the segments left by them."""
+		if self._merge_thread is not None:
+			self._merge_thread.join()
+		self._merge_segments()
+
+	def _weight(self, idf:float, doc:int, freq:int) -> float:
+		"""Get the weight of a token on a document, the normalized tf."""
+		return (1 + log10(freq)) / self._doc_norms[doc]
+
+	def get_token_search(self, token) -> Postings:
+		"""
+		Search for the token on indexs, the weights are calculated with the current statistics.
+
+		Returns
+		-------
+		Postings
+			The postings of the token.
+		"""
+		with self._lock:
+			if token in self._token_postings:
+				return self._token_postings[token]
+
+			token_postings = Postings(self._doc_ids)
+			idf = self.get_token_freq(token)
+			deleted = self._deleted
+			for segment in self._segments:
+				docs, freqs = segment.postings.get(token, ((), ()))
+				for doc, freq in zip(docs, freqs):
+					if doc not in deleted:
+						token_postings.docs.append(doc)
+						token_postings.weights.append(self._weight(idf, doc, freq))
+
+			self._token_postings[token] = token_postings
+			return token_postings
+
+	def get_token_freq(self, token) -> float:
+		"""
+		Get the token fregquency.
+
+		Returns
+		-------
+		float
+			The token frequency.
+		"""
+		with self._lock:
+			if token not in self._doc_freqs:
+				doc_freq = 0
+				for segment in self._segments:
+					docs, _ = segment.postings.get(token, ((), ()))
+					doc_freq += sum(doc not in self._deleted for doc in docs) if self._deleted else len(docs)
+				self._doc_freqs[token] = doc_freq
+
+			doc_freq = self._doc_freqs[token]
+			if doc_freq == 0:
+				return 0
+
+			return log10(self._number_of_docs / doc_freq)
+
+	def get_token_max_weight(self, token) -> float:
+		"""
+		Get the max weight of the token on any document.
+
+		Returns
+		-------
+		float
+			The max weight.
+		"""
+		weights = self.get_token_search(token).weights
+		return max(weights) if weights else 0
+
+
+class IncrementalIndexerBM25(IncrementalIndexer):
+	"""
+	Class used by index the tokens, with documents added and deleted after the index is built.
+	The BM25 weights are calculated when a token is searched, so k1 and b can be changed at any time.
+
+	...
+
+	Methods
+	-------
+	set_parameters()
+		Change the k1 and b parameters.
+	"""
+	def __init__(self, tokenizer:Tokenizer, k1:float, b:float, merge_factor:int = 8):
+		"""
+		Parameters
+		----------
+		tokenizer : Tokenizer
+			The tokenizer object that will tokenize the documents.
+		k1 : float
+			The k1 parameter of BM25.
+		b : float
+			The b parameter of BM25.
+		merge_factor : int
+			The number of segments of the same level that are merged together.
+		"""
+		super().__init__(tokenizer, merge_factor)
+		self._k1 = k1
+		self._b = b
+
+	def set_parameters(self, k1:float, b:float) -> None:
+		"""Change the k1 and b parameters, the weights are calculated again but the statistics are kept."""
+		with self._lock:
+			self._k1 = k1
+			self._b = b
+			self._token_postings = {}
+			self._version += 1
+
+	def _weight(self, idf:float, doc:int, freq:int) -> float:
+		"""Get the BM25 weight of a token on a document."""
+		avg_doc_len = self._total_doc_len / self._number_of_docs
+		return idf * (self._k1 + 1) * freq / \
+			(self._k1 * ((1 - self._b) + self._b * self._doc_lens[doc] / avg_doc_len) + freq)
@@ -0,0 +1,167 @@
+import mmap
+import struct
+import sys
+
+from os import path
+
+from Postings import Postings
+from CompressedPostings import CompressedPostings
+
+
+# files of a binary index directory
+TERMS_FILE = "terms"
+DICTIONARY_FILE = "dictionary"
+POSTINGS_FILE = "postings"
+DOCS_FILE = "docs"
+
+# dictionary file: header (magic, number of documents, number of terms, bits of the quantized weights or 0),
+# then one entry (postings offset, postings size, document frequency, idf, max weight) per term,
+# in the order of the terms file, compressed postings have skip pointers since RIX3
+MAGIC = b"RIX3"
+HEADER = struct.Struct("<4sIIH")
+ENTRY = struct.Struct("<qqidd")
+
+
+class IndexReader:
+	"""
+	Class used to read a binary index written by Indexer.write_binary().
+	The postings file is memory mapped, only the postings of the searched tokens are read from disk.
+	Compressed postings are decoded while they are read.
+
+	...
+
+	Attributes
+	----------
+	doc_ids : list
+		The document ids, by document number.
+	number_of_read_docs : int
+		The number of indexed docs.
+
+	Methods
+	-------
+	get_token_search()
+		Search for the token on indexs.
+	get_token_freq()
+		Get the token fregquency.
+	get_token_max_weight()
+		Get the max weight of the token on any document.
+	close()
+		Close the index files.
+	"""
+	def __init__(self, index_path:str):
+		"""
+		Parameters
+		----------
+		index_path : str
+			The index directory path.
+		"""
+		if not path.isdir(index_path):
+			sys.exit("Index directory not found!")
+
+		self._index_path = index_path
+
+		with open(path.join(index_path, TERMS_FILE), "r") as reader:
+			self._terms = {term: number for number, term in enumerate(reader.read().split("\n")) if term}
+		with open(path.join(index_path, DOCS_FILE), "r") as reader:
+			self._doc_ids = [doc_id for doc_id in reader.read().split("\n") if doc_id]
+
+		self._dictionary = self._map(path.join(index_path, DICTIONARY_FILE))
+		magic, self._number_of_read_docs, number_of_terms, self._weight_bits = HEADER.unpack_from(self._dictionary)
+		if magic != MAGIC or number_of_terms != len(self._terms):
+			sys.exit("Invalid index file!")
+
+		self._postings = self._map(path.join(index_path, POSTINGS_FILE))
+
+	@staticmethod
+	def _map(file_path:str):
+		"""Memory map a file for reading."""
+		with open(file_path, "rb") as reader:
+			# an empty file can not be mapped
+			if path.getsize(file_path) == 0:
+				return b""
+			return mmap.mmap(reader.fileno(), 0, access=mmap.ACCESS_READ)
+
+	def __getstate__(self):
+		# the memory maps can not be pickled, every worker process maps the files again
+		state = self.__dict__.copy()
+		del state["_dictionary"], state["_postings"]
+		return state
+
+	def __setstate__(self, state):
+		self.__dict__.update(state)
+		self._dictionary = self._map(path.join(self._index_path, DICTIONARY_FILE))
+		self._postings = self._map(path.join(self._index_path, POSTINGS_FILE))
+
+	@property
+	def doc_ids(self) -> list:
+		return self._doc_ids
+
+	@property
+	def number_of_read_docs(self) -> int:
+		return self._number_of_read_docs
+
+	def _entry(self, token) -> tuple:
+		"""Get the dictionary entry of the token, None if it is not indexed."""
+		number = self._terms.get(token)
+		if number is None:
+			return None
+		return ENTRY.unpack_from(self._dictionary, HEADER.size + number * ENTRY.size)
+
+	def get_token_search(self, token) -> Postings:
+		"""
+		Search for the token on indexs.
+
+		Returns
+		-------
+		Postings
+			The postings of the token, backed by the memory mapped file.
+		"""
+		entry = self._entry(token)
+		if entry is None:
+			return Postings(self._doc_ids)
+
+		offset, size, doc_freq, _, max_weight = entry
+		if self._weight_bits:
+			data = memoryview(self._postings)[offset:offset + size]
+			return CompressedPostings(self._doc_ids, data, doc_freq, max_weight, self._weight_bits)
+
+		# the weights are written before the documents, so both stay aligned
+		weights = memoryview(self._postings)[offset:offset + 8 * doc_freq].cast("d")
+		docs = memoryview(self._postings)[offset + 8 * doc_freq:offset + 12 * doc_freq].cast("i")
+		return Postings(self._doc_ids, docs, weights)
+
+	def get_token_freq(self, token) -> float:
+		"""
+		Get the token fregquency.
+
+		Returns
+		-------
+		float
+			The token frequency.
+		"""
+		entry = self._entry(token)
+		if entry is None:
+			return 0
+
+		return entry[3]
+
+	def get_token_max_weight(self, token) -> float:
+		"""
+		Get the max weight of the token on any document.
+
+		Returns
+		-------
+		float
+			The max weight.
+		"""
+		entry = self._entry(token)
+		if entry is None:
+			return 0
+
+		return entry[4]
+
+	def close(self) -> None:
+		"""Close the index files."""
+		for index_file in (self._dictionary, self._postings):
+			if isinstance(index_file, mmap.mmap):
+				index_file.close()
@@ -1,9 +1,86 @@
-from collections import Counter
+import gzip
+import heapq
+import tempfile
+
+from array import array
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from math import log10, sqrt
+from operator import itemgetter
+from os import makedirs, path
+
+import numpy as np
+
+try:
+	import zstandard
+except ImportError:
+	zstandard = None
 
 from Tokenizer import Tokenizer
 from CorpusReader import CorpusReader
-from TokenInfo import TokenInfo
+from Postings import Postings
+from CompressedPostings import vbyte_encode, skips_encode, quantize
+from Timers import timers
+from IndexReader import TERMS_FILE, DICTIONARY_FILE, POSTINGS_FILE, DOCS_FILE, MAGIC, HEADER, ENTRY
+
+
+# rough size in bytes of a posting and of a token on a block, used for the memory budget
+POSTING_SIZE = 48
+TOKEN_SIZE = 200
+# number of postings from which the final weights of a token are calculated with numpy
+VECTOR_MIN = 32
+# number of postings of the tokens formatted at a time when writing the index file
+WRITE_CHUNK = 1 << 16
+# compressions of the index file
+COMPRESSIONS = ("gzip", "zstd")
+
+_worker_tokenizer = None
+_worker_doc_ids = None
+
+
+def _init_worker(tokenizer:Tokenizer) -> None:
+	"""Keep the tokenizer on the worker process, so it is only sent once."""
+	global _worker_tokenizer
+	_worker_tokenizer = tokenizer
+
+
+def _index_batch_worker(indexer_class:type, all_files:dict) -> tuple:
+	"""
+	Index a batch of documents on a worker process.
+	The hits and misses of the cache of stems of the worker, while indexing the batch, are returned with it.
+	"""
+	hits, misses = getattr(_worker_tokenizer, "cache_hits", 0), getattr(_worker_tokenizer, "cache_misses", 0)
+	partial_index = indexer_class._index_batch(_worker_tokenizer, all_files)
+	return partial_index, (getattr(_worker_tokenizer, "cache_hits", 0) - hits, getattr(_worker_tokenizer, "cache_misses", 0) - misses)
+
+
+def _init_writer(doc_ids:list) -> None:
+	"""Keep the document ids on the worker process, so they are only sent once."""
+	global _worker_doc_ids
+	_worker_doc_ids = doc_ids
+
+
+def _format_chunk(chunk:list, doc_ids:list = None) -> bytes:
+	"""
+	Format the lines of a range of tokens of the index file, on a worker process when no document ids are given.
+	Every line has the token and its idf, and then the document and weight of every posting.
+	"""
+	if doc_ids is None:
+		doc_ids = _worker_doc_ids
+	format_posting = ";{}:{:.2f}".format
+	return "".join("{}:{:.3f}".format(token, idf) + "".join(map(format_posting, map(doc_ids.__getitem__, docs), weights)) + "\n"
+		for token, idf, docs, weights in chunk).encode()
+
+
+def _open_output(file, compression:str = None):
+	"""Open the index file for writing bytes, compressed with gzip or zstd."""
+	if compression == "gzip":
+		return gzip.open(file, "wb", compresslevel=6)
+	if compression == "zstd":
+		if zstandard is None:
+			raise ImportError("zstd compression requires the zstandard package")
+		return zstandard.ZstdCompressor().stream_writer(open(file, "wb"))
+	return open(file, "wb", buffering=1 << 20)
 
 
 class Indexer:
@@ -15,20 +92,38 @@ class Indexer:
 	Attributes
 	----------
 	index : dict
-		The indexed tokens.
+		The indexed tokens, with the postings of every token.
+	doc_ids : list
+		The document ids, by document number.
+	number_of_docs : int
+		The number of documents of the collection, of all the shards when the statistics are set.
 
 	Methods
 	-------
 	indexing()
 		Index the tokens.
+	finalize()
+		Calculate what depends on the statistics of the collection, after indexing.
+	prune()
+		Drop the postings of low weight, after finalize().
+	statistics()
+		Get the statistics of the documents indexed, to be summed with the ones of the other shards.
+	set_statistics()
+		Use the statistics of the whole collection, when the index is a shard.
+	block_indexing()
+		Index the tokens in blocks that fit the memory budget, straight to the index file.
 	get_token_search()
 		Search for the token on indexs.
 	get_token_freq()
 		Get the token fregquency.
+	get_token_max_weight()
+		Get the max weight of the token on any document.
 	write()
 		Write the indexs on file.
+	write_binary()
+		Write the indexs on a binary index directory, that can be loaded by IndexReader.
 	"""
-	def __init__(self, corpus:CorpusReader, tokenizer:Tokenizer):
+	def __init__(self, corpus:CorpusReader, tokenizer:Tokenizer, workers:int = 1):
 		"""
 		Parameters
 		----------
@@ -36,38 +131,378 @@ class Indexer:
 			The CorpusReader object with the loaded file.
 		tokenizer : Tokenizer
 			The tokenizer object that will tokenize the documents.
+		workers : int
+			The number of processes used to tokenize the documents.
 		"""
 		self._corpus = corpus
 		self._tokenizer = tokenizer
+		self._workers = workers
 		self._index = {}
+		self._doc_ids = []
+		self._doc_numbers = {}
+		self._max_weights = {}
+		self._repeated_docs = False
+		# statistics of the whole collection, when the index is a shard
+		self._number_of_docs = None
+		self._doc_freqs = None
+		# idf of every token, calculated once by finalize()
+		self._idfs = None
 
 	@property
 	def index(self) -> dict:
 		return self._index
 
-	def indexing(self) -> None:
+	@property
+	def doc_ids(self) -> list:
+		return self._doc_ids
+
+	@property
+	def number_of_docs(self) -> int:
+		if self._number_of_docs is not None:
+			return self._number_of_docs
+		return self._corpus.number_of_read_docs
+
+	@classmethod
+	def _index_batch(cls, tokenizer:Tokenizer, all_files:dict) -> tuple:
+		"""
+		Index a batch of documents on a partial index.
+
+		Returns
+		-------
+		tuple
+			The partial index, with the documents and weights of every token,
+			as well as the length of every document.
+		"""
+		postings = {}
+		doc_lens = {}
+		for doc_id, data in all_files.items():
+			doc_weight = 0
+			token_list, doc_lens[doc_id] = tokenizer.term_frequencies(data)
+			for token, freq in token_list.items():
+				tf = 1 + log10(freq)
+				token_list[token] = tf
+				doc_weight += tf ** 2
+
+			doc_weight = sqrt(doc_weight)
+			for token, tf in token_list.items():
+				docs, weights = postings.setdefault(token, ([], []))
+				docs.append(doc_id)
+				weights.append(tf / doc_weight)
+
+		return postings, doc_lens
+
+	def _map_batches(self):
+		"""
+		Index the batches of documents, in a pool of processes when there is more than one worker.
+		The partial indexes are returned in the order of the documents.
+		With a pool, the time tokenizing is the time waiting for the workers.
+		"""
+		batches = timers.timed_iter("index.read", self._corpus.batches(1000))
+		if self._workers <= 1:
+			for all_files in batches:
+				with timers.timer("index.tokenize"):
+					partial_index = self._index_batch(self._tokenizer, all_files)
+				yield partial_index
+			return
+
+		with ProcessPoolExecutor(self._workers, initializer=_init_worker, initargs=(self._tokenizer,)) as executor:
+			pending = deque()
+			for all_files in batches:
+				pending.append(executor.submit(_index_batch_worker, type(self), all_files))
+				# bound the number of batches in memory
+				if len(pending) >= 2 * self._workers:
+					yield self._worker_result(pending.popleft())
+			while pending:
+				yield self._worker_result(pending.popleft())
+
+	def _worker_result(self, future) -> tuple:
+		"""
+		Wait for the partial index of a worker process.
+		The hits and misses of the cache of stems of the worker are added to the ones of the tokenizer.
+		"""
+		with timers.timer("index.tokenize"):
+			partial_index, (hits, misses) = future.result()
+		if hits or misses:
+			self._tokenizer.add_cache_stats(hits, misses)
+		return partial_index
+
+	def _number_docs(self, doc_lens:dict) -> bool:
+		"""
+		Give the next document numbers to the new documents of a batch, a repeated document id keeps its first number.
+
+		Returns
+		-------
+		bool
+			True if a document id of the batch was already numbered.
+		"""
+		doc_numbers = self._doc_numbers
+		repeated = False
+		for doc_id in doc_lens:
+			if doc_id not in doc_numbers:
+				doc_numbers[doc_id] = len(self._doc_ids)
+				self._doc_ids.append(doc_id)
+			else:
+				repeated = self._repeated_docs = True
+		return repeated
+
+	def _merge(self, postings:dict, doc_lens:dict) -> None:
+		"""
+		Merge a partial index on the index, the document ids are mapped to document numbers.
+		The postings are kept sorted by document, even when a document id is repeated on the data file.
+		"""
+		doc_numbers = self._doc_numbers
+		repeated = self._number_docs(doc_lens)
+		for token, (docs, weights) in postings.items():
+			token_postings = self._index.get(token)
+			if token_postings is None:
+				token_postings = self._index[token] = Postings(self._doc_ids)
+			if repeated:
+				token_postings.merge([doc_numbers[doc_id] for doc_id in docs], weights)
+			else:
+				token_postings.extend([doc_numbers[doc_id] for doc_id in docs], weights)
+
+	def _update_max_weights(self) -> None:
+		"""
+		Keep the max weight of every token, the upper bound of its score used to prune queries.
+		A repeated document id can have more than one posting on the same token, so their weights are summed.
+		"""
+		if not self._repeated_docs:
+			self._max_weights = {token: max(token_postings.weights) for token, token_postings in self._index.items()}
+			return
+
+		self._max_weights = {}
+		for token, token_postings in self._index.items():
+			max_weight = 0
+			last_doc = None
+			for doc, weight in zip(token_postings.docs, token_postings.weights):
+				doc_weight = doc_weight + weight if doc == last_doc else weight
+				max_weight = max(max_weight, doc_weight)
+				last_doc = doc
+			self._max_weights[token] = max_weight
+
+	def indexing(self, finalize:bool = True) -> None:
 		"""
 		Index the tokens, by processing 1000 documents at a time,
 		tokenizing these coduments and then indexing all.
+
+		Parameters
+		----------
+		finalize : bool
+			Finalize the index. A shard is finalized later, after its statistics are set.
+		"""
+		for postings, doc_lens in self._map_batches():
+			with timers.timer("index.index"):
+				self._merge(postings, doc_lens)
+				self._update_statistics(doc_lens)
+
+		if finalize:
+			self.finalize()
+
+	def finalize(self) -> None:
+		"""Calculate the idf table, the final weights and the max weight of every token, after indexing."""
+		with timers.timer("index.finalize"):
+			self._update_idfs()
+			self._update_weights()
+			self._update_max_weights()
+
+	def prune(self, top:int = None, min_weight:float = None, relative:float = None) -> int:
+		"""
+		Drop the postings of low weight, that seldom change the best documents of a query, after finalize().
+		The postings kept are the ones with at least min_weight, with at least relative times the max weight
+		of their token, and then the top with the highest weights of every token, the ties kept in order of document.
+		The idf of the tokens stays the one of the whole index.
+
+		Parameters
+		----------
+		top : int
+			The number of postings kept of every token, None to keep all.
+		min_weight : float
+			The min weight of the postings kept, on all the tokens.
+		relative : float
+			The min weight of the postings kept, relative to the max weight of their token.
+
+		Returns
+		-------
+		int
+			The number of postings dropped.
+		"""
+		dropped = 0
+		with timers.timer("index.prune"):
+			for token in list(self._index):
+				token_postings = self._index[token]
+				weights = np.frombuffer(token_postings.weights, dtype=np.float64)
+				keep = np.ones(len(weights), dtype=bool)
+				if min_weight is not None:
+					keep &= weights >= min_weight
+				if relative is not None:
+					keep &= weights >= relative * self._max_weights[token]
+				if top is not None and np.count_nonzero(keep) > top:
+					kept = np.flatnonzero(keep)
+					keep[:] = False
+					keep[kept[np.argsort(-weights[kept], kind="stable")[:top]]] = True
+
+				number_kept = np.count_nonzero(keep)
+				if number_kept == len(weights):
+					continue
+				dropped += len(weights) - number_kept
+				if not number_kept:
+					del self._index[token]
+					continue
+				docs = np.frombuffer(token_postings.docs, dtype=np.int32)
+				self._index[token] = Postings(self._doc_ids, array("i", docs[keep].tobytes()), array("d", weights[keep].tobytes()))
+
+			self._update_max_weights()
+		return dropped
+
+	def _update_idfs(self) -> None:
+		"""
+		Calculate the idf of every token once, with the statistics of the collection.
+		A shard keeps the idf of all the tokens of the collection, also the ones it does not have.
+		"""
+		if self._doc_freqs is not None:
+			doc_freqs = self._doc_freqs
+		else:
+			doc_freqs = {token: len(token_postings) for token, token_postings in self._index.items()}
+		number_of_docs = self.number_of_docs
+		self._idfs = {token: log10(number_of_docs / doc_freq) for token, doc_freq in doc_freqs.items() if doc_freq}
+
+	def _update_weights(self) -> None:
+		"""Calculate the final weight of every posting, the tf-idf weights are final once indexed."""
+		pass
+
+	def statistics(self) -> tuple:
+		"""
+		Get the statistics of the documents indexed, to be summed with the ones of the other shards.
+
+		Returns
+		-------
+		tuple
+			The number of documents, the number of documents of every token,
+			and the total length of the documents, only kept for BM25.
+		"""
+		return self._corpus.number_of_read_docs, {token: len(token_postings) for token, token_postings in self._index.items()}, 0
+
+	def set_statistics(self, number_of_docs:int, doc_freqs:dict, total_doc_len:int) -> None:
+		"""
+		Use the statistics of the whole collection, so the scores of every shard are comparable.
+		Must be called before finalize().
+
+		Parameters
+		----------
+		number_of_docs : int
+			The number of documents of all the shards.
+		doc_freqs : dict
+			The number of documents of every token, on all the shards.
+		total_doc_len : int
+			The total length of the documents of all the shards.
+		"""
+		self._number_of_docs = number_of_docs
+		self._doc_freqs = doc_freqs
+
+	def _update_statistics(self, doc_lens:dict) -> None:
+		"""Update the collection statistics with the lengths of a batch of documents."""
+		pass
+
+	def _final_weight(self, idf:float, doc_id:str, weight:float) -> float:
+		"""Get the weight of a posting written on the index file."""
+		return weight
+
+	def _write_run(self, block:dict, run_file:str) -> None:
+		"""
+		Write a block on a run file, sorted by token and then by document number.
+		A repeated document id has its first number, so it can be before the documents indexed with it.
+		"""
+		with open(run_file, "w", buffering=1 << 20) as writer:
+			for token in sorted(block):
+				docs, weights = block[token]
+				postings = zip(docs, weights)
+				if self._repeated_docs:
+					postings = sorted(postings, key=itemgetter(0))
+				writer.write(token + "".join(";{}:{!r}".format(doc, weight) for doc, weight in postings) + "\n")
+
+	@staticmethod
+	def _read_run(run_file:str):
+		"""Read the tokens of a run file, in order."""
+		with open(run_file, "r", buffering=1 << 20) as reader:
+			for line in reader:
+				token, _, postings = line.rstrip("\n").partition(";")
+				yield token, postings
+
+	def _merge_runs(self, run_files:list, file) -> None:
+		"""
+		Merge the run files on the index file.
+		For the same token, the postings of the runs are merged by document number,
+		the postings of the same document in the order of the runs, as write() keeps them.
+		"""
+		runs = [self._read_run(run_file) for run_file in run_files]
+		with open(file, "w", buffering=1 << 20) as writer:
+			token = None
+			token_postings = []
+			for next_token, postings in heapq.merge(*runs, key=lambda run: run[0]):
+				if next_token != token and token is not None:
+					writer.write(self._merged_line(token, token_postings) + "\n")
+					token_postings = []
+				token = next_token
+				token_postings.append(postings)
+
+			if token is not None:
+				writer.write(self._merged_line(token, token_postings) + "\n")
+
+	def _merged_line(self, token:str, token_postings:list) -> str:
+		"""Get the line of the index file of a token, from the postings of all runs."""
+		runs = [[(int(doc), weight) for doc, weight in (posting.split(":") for posting in run_postings.split(";"))]
+			for run_postings in token_postings]
+		postings = list(heapq.merge(*runs, key=itemgetter(0))) if len(runs) > 1 else runs[0]
+		idf = log10(self.number_of_docs / len(postings))
+		line = "{}:{:.3f}".format(token, idf)
+		doc_ids = self._doc_ids
+		return line + "".join(";{}:{:.2f}".format(doc_ids[doc], self._final_weight(idf, doc_ids[doc], float(weight)))
+			for doc, weight in postings)
+
+	def block_indexing(self, file, memory_budget:int) -> None:
+		"""
+		Index the tokens in blocks that fit the memory budget (SPIMI).
+		Every time a block is full it is written on disk as a run sorted by token,
+		at the end all runs are merged on the index file, with the same format of write().
+
+		Parameters
+		----------
+		file : str
+			The index file path.
+		memory_budget : int
+			The memory budget of a block, in bytes.
 		"""
-		while True:
-			all_files, reached_end = self._corpus.process(1000)
-
-			for doc_id, data in all_files.items():
-				doc_weight = 0
-				token_list = self._tokenizer.tokenize(data)
-				token_list = dict(Counter(token_list))
-				for token, freq in token_list.items():
-					tf = 1 + log10(freq)
-					self._index[token] = self._index.get(token, [])
-					self._index[token].append(TokenInfo(doc_id, tf))
-					doc_weight += tf ** 2
-				
-				for token in token_list:
-					self._index[token][-1].weight = self._index[token][-1].weight / sqrt(doc_weight)
-
-			if reached_end:
-				break
+		with tempfile.TemporaryDirectory(dir=path.dirname(path.abspath(file))) as tmp_dir:
+			run_files = []
+			block = {}
+			block_size = 0
+			for postings, doc_lens in self._map_batches():
+				with timers.timer("index.index"):
+					self._update_statistics(doc_lens)
+					# the documents are numbered as on write(), the runs are merged by document number
+					self._number_docs(doc_lens)
+					for token, (docs, weights) in postings.items():
+						docs = [self._doc_numbers[doc_id] for doc_id in docs]
+						if token not in block:
+							block[token] = docs, weights
+							block_size += TOKEN_SIZE
+						else:
+							block[token][0].extend(docs)
+							block[token][1].extend(weights)
+						block_size += len(docs) * POSTING_SIZE
+
+					if block_size >= memory_budget:
+						run_files.append(path.join(tmp_dir, "run%d" % len(run_files)))
+						self._write_run(block, run_files[-1])
+						block = {}
+						block_size = 0
+
+			with timers.timer("index.finalize"):
+				if block:
+					run_files.append(path.join(tmp_dir, "run%d" % len(run_files)))
+					self._write_run(block, run_files[-1])
+
+				self._merge_runs(run_files, file)
 
 	def get_token_search(self, token) -> list:
 		"""
@@ -75,10 +510,10 @@ class Indexer:
 
 		Returns
 		-------
-		list
-			The token list.
+		Postings
+			The postings of the token.
 		"""
-		return self._index.get(token, [])
+		return self._index.get(token) or Postings(self._doc_ids)
 
 	def get_token_freq(self, token) -> float:
 		"""
@@ -89,19 +524,129 @@ class Indexer:
 		float
 			The token frequency.
 		"""
-		if token not in self._index:
+		if self._idfs is not None:
+			return self._idfs.get(token, 0)
+		if self._doc_freqs is not None:
+			doc_freq = self._doc_freqs.get(token, 0)
+		else:
+			doc_freq = len(self._index[token]) if token in self._index else 0
+		if not doc_freq:
 			return 0
 
-		return log10(self._corpus.number_of_read_docs / len(self._index[token]))
+		return log10(self.number_of_docs / doc_freq)
+
+	def get_token_max_weight(self, token) -> float:
+		"""
+		Get the max weight of the token on any document.
+
+		Returns
+		-------
+		float
+			The max weight.
+		"""
+		return self._max_weights.get(token, 0)
+
+	def _write_chunks(self):
+		"""Get the tokens in order, with their idf and postings, in ranges of about WRITE_CHUNK postings."""
+		chunk = []
+		size = 0
+		for token in sorted(self._index):
+			token_postings = self._index[token]
+			chunk.append((token, self.get_token_freq(token), token_postings.docs, token_postings.weights))
+			size += len(token_postings)
+			if size >= WRITE_CHUNK:
+				yield chunk
+				chunk = []
+				size = 0
+		if chunk:
+			yield chunk
+
+	def _format_chunks(self):
+		"""
+		Format the ranges of tokens of the index file, in a pool of processes when there is more than one worker.
+		The ranges are returned in order.
+		"""
+		if self._workers <= 1:
+			for chunk in self._write_chunks():
+				yield _format_chunk(chunk, self._doc_ids)
+			return
+
+		with ProcessPoolExecutor(self._workers, initializer=_init_writer, initargs=(self._doc_ids,)) as executor:
+			pending = deque()
+			for chunk in self._write_chunks():
+				pending.append(executor.submit(_format_chunk, chunk))
+				# bound the number of ranges in memory
+				if len(pending) >= 2 * self._workers:
+					yield pending.popleft().result()
+			while pending:
+				yield pending.popleft().result()
+
+	def write(self, file, compression:str = None) -> None:
+		"""
+		Write the indexs on file, sorted by token.
+		The lines are formatted in ranges of tokens, in parallel with the workers, and written by a background thread,
+		that also compresses them.
 
-	def write(self, file) -> None:
-		"""Write the indexs on file."""
-		with open(file, "w") as writer:
-			for token in self._index:
-				line = "{}:{:.3f}".format(token, self.get_token_freq(token))
-				for info in self._index[token]:
-					line += ";" + str(info)
-				writer.write(line + "\n")
+		Parameters
+		----------
+		file : str
+			The index file path.
+		compression : str
+			Compress the index file with gzip or zstd, None to write it as text.
+		"""
+		with _open_output(file, compression) as writer, ThreadPoolExecutor(1) as background:
+			pending = deque()
+			for data in self._format_chunks():
+				pending.append(background.submit(writer.write, data))
+				# bound the number of ranges waiting to be written
+				if len(pending) >= 4:
+					pending.popleft().result()
+			while pending:
+				pending.popleft().result()
+
+	def write_binary(self, index_path, weight_bits:int = 0) -> None:
+		"""
+		Write the indexs on a binary index directory.
+		The tokens are sorted, the postings of every token are written contiguously,
+		first the weights then the document numbers, in the native byte order.
+
+		Parameters
+		----------
+		index_path : str
+			The index directory path.
+		weight_bits : int
+			When 8 or 16, the postings are compressed: the weights are quantized to that number of bits
+			and the document numbers are sorted and encoded with variable byte gaps,
+			after a table of skip pointers.
+		"""
+		makedirs(index_path, exist_ok=True)
+		tokens = sorted(self._index)
+		with open(path.join(index_path, TERMS_FILE), "w") as writer:
+			writer.write("\n".join(tokens))
+		with open(path.join(index_path, DOCS_FILE), "w") as writer:
+			writer.write("\n".join(self._doc_ids))
+
+		with open(path.join(index_path, DICTIONARY_FILE), "wb", buffering=1 << 20) as dictionary, \
+			open(path.join(index_path, POSTINGS_FILE), "wb", buffering=1 << 20) as postings:
+			dictionary.write(HEADER.pack(MAGIC, self.number_of_docs, len(tokens), weight_bits))
+			offset = 0
+			for token in tokens:
+				token_postings = self._index[token]
+				max_weight = self.get_token_max_weight(token)
+				if weight_bits:
+					data = skips_encode(token_postings.docs) + quantize(token_postings.weights, max_weight, weight_bits).tobytes() + \
+						vbyte_encode(token_postings.docs)
+					size = len(data)
+					postings.write(data)
+				else:
+					token_postings.weights.tofile(postings)
+					token_postings.docs.tofile(postings)
+					size = 12 * len(token_postings)
+				dictionary.write(ENTRY.pack(offset, size, len(token_postings), self.get_token_freq(token), max_weight))
+				# keep the weights of the next token aligned to 8 bytes
+				padding = -size % 8
+				postings.write(b"\0" * padding)
+				offset += size + padding
 
 
 class IndexerBM25(Indexer):
@@ -112,10 +657,10 @@ class IndexerBM25(Indexer):
 
 	Methods
 	-------
-	indexing()
-		Index the tokens.
+	finalize()
+		Calculate the BM25 weight of every posting, after indexing.
 	"""
-	def __init__(self, corpus:CorpusReader, tokenizer:Tokenizer, k1:float, b:float):
+	def __init__(self, corpus:CorpusReader, tokenizer:Tokenizer, k1:float, b:float, workers:int = 1):
 		"""
 		Parameters
 		----------
@@ -123,37 +668,84 @@ class IndexerBM25(Indexer):
 			the CorpusReader object with the loaded file
 		tokenizer : Tokenizer
 			The tokenizer object that will tokenize the documents.
+		workers : int
+			The number of processes used to tokenize the documents.
 		"""
-		self._corpus = corpus
-		self._tokenizer = tokenizer
-		self._index = {}
+		super().__init__(corpus, tokenizer, workers)
 		self._k1 = k1
 		self._b = b
+		self._doc_lens = {}
+		self._total_doc_len = 0
 
-	def indexing(self):
+	@classmethod
+	def _index_batch(cls, tokenizer:Tokenizer, all_files:dict) -> tuple:
 		"""
-		Index the tokens, by processing 1000 documents at a time,
-		tokenizing these coduments and then indexing all.
+		Index a batch of documents on a partial index.
+
+		Returns
+		-------
+		tuple
+			The partial index, with the documents and frequencies of every token,
+			as well as the length of every document.
 		"""
+		postings = {}
 		doc_lens = {}
-		avg_doc_len = 0	
-		while True:
-			all_files, reached_end = self._corpus.process(1000)
-			for doc_id, data in all_files.items():
-				token_list = self._tokenizer.tokenize(data)
-				doc_lens[doc_id] = len(token_list)
-				avg_doc_len += len(token_list)
-				token_list = dict(Counter(token_list))
-				for token, freq in token_list.items():
-					self._index[token] = self._index.get(token, [])
-					self._index[token].append(TokenInfo(doc_id, freq))
-
-			if reached_end:
-				break
-
-		avg_doc_len /= self._corpus.number_of_read_docs
-
-		for token in self._index:
-			for info in self._index[token]:
-				info.weight = self.get_token_freq(token) * (self._k1 + 1) * info.weight / \
-				(self._k1 * ((1 - self._b) + self._b * doc_lens[info.doc] / avg_doc_len) + info.weight)
+		for doc_id, data in all_files.items():
+			token_list, doc_lens[doc_id] = tokenizer.term_frequencies(data)
+			for token, freq in token_list.items():
+				docs, weights = postings.setdefault(token, ([], []))
+				docs.append(doc_id)
+				weights.append(freq)
+
+		return postings, doc_lens
+
+	def _update_statistics(self, doc_lens:dict) -> None:
+		"""Update the collection statistics with the lengths of a batch of documents."""
+		self._doc_lens.update(doc_lens)
+		self._total_doc_len += sum(doc_lens.values())
+
+	def _final_weight(self, idf:float, doc_id:str, weight:float) -> float:
+		"""Get the BM25 weight of a posting, from the frequency of the token on the document."""
+		avg_doc_len = self._total_doc_len / self.number_of_docs
+		return idf * (self._k1 + 1) * weight / \
+			(self._k1 * ((1 - self._b) + self._b * self._doc_lens[doc_id] / avg_doc_len) + weight)
+
+	def statistics(self) -> tuple:
+		"""
+		Get the statistics of the documents indexed, to be summed with the ones of the other shards.
+
+		Returns
+		-------
+		tuple
+			The number of documents, the number of documents of every token,
+			and the total length of the documents.
+		"""
+		number_of_docs, doc_freqs, _ = super().statistics()
+		return number_of_docs, doc_freqs, self._total_doc_len
+
+	def set_statistics(self, number_of_docs:int, doc_freqs:dict, total_doc_len:int) -> None:
+		"""Use the statistics of the whole collection, the average document length is the one of all the shards."""
+		super().set_statistics(number_of_docs, doc_freqs, total_doc_len)
+		self._total_doc_len = total_doc_len
+
+	def _update_weights(self) -> None:
+		"""
+		Calculate the BM25 weight of every posting, with the idf table and average document length of the collection.
+		The length normalization of every document is calculated once, the weights of the long postings
+		are calculated in bulk with numpy and the ones of the short postings in a loop, with the same operations.
+		"""
+		avg_doc_len = self._total_doc_len / self.number_of_docs
+		doc_lens = np.array([self._doc_lens[doc_id] for doc_id in self._doc_ids], dtype=np.float64)
+		norms = self._k1 * ((1 - self._b) + self._b * doc_lens / avg_doc_len)
+		norms_list = norms.tolist()
+		for token, token_postings in self._index.items():
+			scale = self._idfs.get(token, 0) * (self._k1 + 1)
+			weights = token_postings.weights
+			if len(weights) >= VECTOR_MIN:
+				# the numpy arrays are views of the postings, the weights are replaced in place
+				tfs = np.frombuffer(weights, dtype=np.float64)
+				tfs[:] = scale * tfs / (norms[np.frombuffer(token_postings.docs, dtype=np.int32)] + tfs)
+			else:
+				docs = token_postings.docs
+				for i, weight in enumerate(weights):
+					weights[i] = scale * weight / (norms_list[docs[i]] + weight)
@@ -0,0 +1,227 @@
+import numpy as np
+
+from Query import Query, _BatchIndex
+from Indexer import Indexer
+from Tokenizer import Tokenizer
+from CompressedPostings import CompressedPostings
+from Timers import timers
+
+
+# number of scores of a batch of queries kept at once, the queries are scored in groups that fit it
+BATCH_SCORES = 1 << 22
+
+
+class NumpyQuery(Query):
+    """
+    Class used to search the relevant tokens of queries, scoring with NumPy arrays.
+    Gives the same results as Query, scores and ties included.
+
+    ...
+
+    Methods
+    -------
+    _postings_arrays()
+        Get the postings of a token as NumPy arrays.
+    _score()
+        Add the weights of the tokens on a dense array of scores.
+    _rank()
+        Sort the best documents by score.
+    lookup_idf()
+        Search the tokens relevant for the query. Using idf.
+    lookup_bm25()
+        Search the tokens relevant for the query. Using bm25.
+    lookup_batch()
+        Search the tokens relevant for many queries at once, scoring them together.
+    """
+    def _postings_arrays(self, token) -> tuple:
+        """
+        Get the postings of a token as NumPy arrays, without copying them when they are already in memory.
+
+        Returns
+        -------
+        tuple
+            The document numbers and the weights.
+        """
+        postings = self._index.get_token_search(token)
+        if isinstance(postings, CompressedPostings):
+            return (np.fromiter(postings.docs, dtype=np.int32, count=len(postings)),
+                    np.fromiter(postings.weights, dtype=np.float64, count=len(postings)))
+        return np.frombuffer(postings.docs, dtype=np.int32), np.frombuffer(postings.weights, dtype=np.float64)
+
+    def _score(self, query_terms:list, postings:list) -> tuple:
+        """
+        Add the weights of the tokens on a dense array of scores, in the order of query_terms,
+        so every score is summed in the same order as Query does.
+
+        Returns
+        -------
+        tuple
+            The scores, and the first term found on every document, or -1 if it was not found.
+        """
+        with timers.timer("query.score"):
+            num_docs = len(self._index.doc_ids)
+            scores = np.zeros(num_docs)
+            first_terms = np.full(num_docs, -1)
+            for term, ((docs, weights), (_, query_weight)) in enumerate(zip(postings, query_terms)):
+                if query_weight is not None:
+                    weights = query_weight * weights
+
+                new_docs = docs[first_terms[docs] == -1]
+                first_terms[new_docs] = term
+                # a repeated document id has more than one posting, they must be added one at a time
+                if len(docs) > 1 and np.any(docs[1:] == docs[:-1]):
+                    np.add.at(scores, docs, weights)
+                else:
+                    scores[docs] += weights
+
+        return scores, first_terms
+
+    def _rank(self, scores:np.ndarray, first_terms:np.ndarray, top_k:int) -> list:
+        """
+        Sort the best documents by score, the ties are broken by the order Query finds the documents.
+        With top_k only the k best documents are selected, with argpartition.
+        """
+        with timers.timer("query.rank"):
+            docs = np.flatnonzero(first_terms >= 0)
+            if top_k is not None and top_k < len(docs):
+                if top_k < 1:
+                    return []
+                # keep the documents tied with the k-th best score, the ties are broken below
+                kth_score = scores[docs[np.argpartition(-scores[docs], top_k - 1)[top_k - 1]]]
+                docs = docs[scores[docs] >= kth_score]
+
+            order = np.lexsort((docs, first_terms[docs], -scores[docs]))[:top_k]
+            doc_ids = self._index.doc_ids
+            return [(doc_ids[doc], score) for doc, score in zip(docs[order].tolist(), scores[docs[order]].tolist())]
+
+    def lookup_idf(self, top_k:int = None, pruning:bool = False) -> list:
+        """
+        Search the tokens relevant for the query. Using idf.
+
+        Parameters
+        ----------
+        top_k : int
+            The number of documents to return, all the documents found if None.
+        pruning : bool
+            Not used, every posting of the query tokens is scored.
+
+        Returns
+        -------
+        list
+            The list of relevant tokens.
+        """
+        self._tokenize()
+        with timers.timer("query.fetch"):
+            self._process()
+            query_terms = list(self._query_vector.items())
+            postings = [self._postings_arrays(token) for token, _ in query_terms]
+        return self._rank(*self._score(query_terms, postings), top_k)
+
+    def lookup_bm25(self, top_k:int = None, pruning:bool = False) -> list:
+        """
+        Search the tokens relevant for the query. Using bm25.
+
+        Parameters
+        ----------
+        top_k : int
+            The number of documents to return, all the documents found if None.
+        pruning : bool
+            Not used, every posting of the query tokens is scored.
+
+        Returns
+        -------
+        list
+            The list of relevant tokens.
+        """
+        query_terms = [(token, None) for token in self._tokenize()]
+        with timers.timer("query.fetch"):
+            postings = [self._postings_arrays(token) for token, _ in query_terms]
+        return self._rank(*self._score(query_terms, postings), top_k)
+
+    @classmethod
+    def lookup_batch(cls, queries:dict, index:Indexer, tokenizer:Tokenizer, use_bm:bool,
+                     top_k:int = None, pruning:bool = False) -> dict:
+        """
+        Search the tokens relevant for many queries at once, scoring them together.
+        Every query is tokenized once and the queries with the same tokens are only searched once.
+        The postings of every token are fetched once, and the queries are scored in groups as the product
+        of the matrix of their query weights by the matrix of the postings: the weighted postings of all the
+        queries of a group are added on one array of scores, of a row by query, with a single bincount.
+        Every score is summed in the order of the query terms, so the results are the same as searching
+        the queries one at a time.
+
+        Parameters
+        ----------
+        queries : dict
+            The queries, by query id.
+        index : Indexer
+            The indexer object.
+        tokenizer : Tokenizer
+            The tokenizer object that will tokenize the queries.
+        use_bm : bool
+            Use bm25 instead of idf.
+        top_k : int
+            The number of documents to return for every query, all the documents found if None.
+        pruning : bool
+            Not used, every posting of the query tokens is scored.
+
+        Returns
+        -------
+        dict
+            The list of relevant tokens, by query id.
+        """
+        batch_index = _BatchIndex(index)
+        keys = {}
+        searches = {}
+        for query_id, query in queries.items():
+            with timers.timer("query.tokenize"):
+                tokens = tokenizer.tokenize(query)
+            key = keys[query_id] = tuple(tokens)
+            if key not in searches:
+                searches[key] = cls(query, batch_index, tokenizer, tokens)
+
+        with timers.timer("query.fetch"):
+            query_terms = {}
+            postings = {}
+            for key, search in searches.items():
+                if use_bm:
+                    query_terms[key] = [(token, None) for token in key]
+                else:
+                    search._process()
+                    query_terms[key] = list(search._query_vector.items())
+                for token, _ in query_terms[key]:
+                    if token not in postings:
+                        postings[token] = search._postings_arrays(token)
+
+        num_docs = len(batch_index.doc_ids)
+        group_size = max(1, BATCH_SCORES // max(1, num_docs))
+        group_keys = list(searches)
+        results_by_tokens = {}
+        for start in range(0, len(group_keys), group_size):
+            group = group_keys[start:start + group_size]
+            with timers.timer("query.score"):
+                # the postings of every query term, on the row of its query, in the order of the query terms
+                cells = [np.zeros(0, dtype=np.int64)]
+                weights = [np.zeros(0)]
+                terms = [np.zeros(0, dtype=np.int64)]
+                for row, key in enumerate(group):
+                    for term, (token, query_weight) in enumerate(query_terms[key]):
+                        docs, token_weights = postings[token]
+                        cells.append(docs.astype(np.int64) + row * num_docs)
+                        weights.append(token_weights if query_weight is None else query_weight * token_weights)
+                        terms.append(np.full(len(docs), term, dtype=np.int64))
+                cells = np.concatenate(cells)
+
+                # bincount adds the weights in order, so the scores are summed as _score() does
+                scores = np.bincount(cells, np.concatenate(weights), minlength=len(group) * num_docs).reshape(len(group), num_docs)
+                # the terms of a row are in increasing order, so the first term of a document is the smallest one
+                not_found = np.iinfo(np.int64).max
+                first_terms = np.full(len(group) * num_docs, not_found, dtype=np.int64)
+                np.minimum.at(first_terms, cells, np.concatenate(terms))
+                first_terms[first_terms == not_found] = -1
+                first_terms = first_terms.reshape(len(group), num_docs)
+
+            for row, key in enumerate(group):
+                results_by_tokens[key] = searches[key]._rank(scores[row], first_terms[row], top_k)
+
+        return {query_id: results_by_tokens[key] for query_id, key in keys.items()}
@@ -0,0 +1,145 @@
+from array import array
+from bisect import bisect_left
+from itertools import chain
+from operator import itemgetter
+
+from TokenInfo import TokenInfo
+
+
+class PostingsCursor:
+    """
+    Class used to walk the postings of a token in order of document.
+    The documents can be read at any position, so the skips are galloping searches: the step doubles
+    until it passes the document searched, which is then found by binary search.
+
+    ...
+
+    Attributes
+    ----------
+    doc : int
+        The document of the current posting, None after the last posting.
+    weight : float
+        The weight of the current posting.
+
+    Methods
+    -------
+    next()
+        Move to the next posting.
+    next_geq()
+        Move to the first posting with a document greater than or equal to the one given.
+    """
+    __slots__ = ("_docs", "_weights", "_position")
+
+    def __init__(self, docs, weights):
+        self._docs = docs
+        self._weights = weights
+        self._position = 0
+
+    @property
+    def doc(self):
+        return self._docs[self._position] if self._position < len(self._docs) else None
+
+    @property
+    def weight(self) -> float:
+        return self._weights[self._position]
+
+    def next(self):
+        """Move to the next posting, and get its document."""
+        self._position += 1
+        return self.doc
+
+    def next_geq(self, target:int):
+        """
+        Move to the first posting with a document greater than or equal to target, and get its document.
+
+        Returns
+        -------
+        int
+            The document, None if there is none.
+        """
+        docs = self._docs
+        position = self._position
+        if position >= len(docs) or docs[position] >= target:
+            return self.doc
+
+        step = 1
+        while position + step < len(docs) and docs[position + step] < target:
+            position += step
+            step *= 2
+        self._position = bisect_left(docs, target, position + 1, min(len(docs), position + step))
+        return self.doc
+
+
+class Postings:
+    """
+    Class used to keep the postings of a token in compact arrays.
+
+    ...
+
+    Attributes
+    ----------
+    docs : array
+        The numbers of the documents, sorted.
+        Can also be a memoryview over a loaded index file.
+    weights : array
+        The weight of the token on every document.
+
+    Methods
+    -------
+    extend()
+        Add postings at the end of the list.
+    merge()
+        Add postings keeping the list sorted by document.
+    cursor()
+        Get a cursor over the postings, that can skip to a document.
+    """
+    __slots__ = ("_doc_ids", "_docs", "_weights")
+
+    def __init__(self, doc_ids:list, docs = None, weights = None):
+        """
+        Parameters
+        ----------
+        doc_ids : list
+            The document ids by document number, shared by all the postings of the index.
+        docs : array
+            The numbers of the documents, a new array is used if none is given.
+        weights : array
+            The weights of the token, a new array is used if none is given.
+        """
+        self._doc_ids = doc_ids
+        self._docs = array("i") if docs is None else docs
+        self._weights = array("d") if weights is None else weights
+
+    @property
+    def docs(self):
+        return self._docs
+
+    @property
+    def weights(self):
+        return self._weights
+
+    def extend(self, docs, weights) -> None:
+        """Add postings at the end of the list."""
+        self._docs.extend(docs)
+        self._weights.extend(weights)
+
+    def merge(self, docs, weights) -> None:
+        """Add postings keeping the list sorted by document, the postings of the same document keep their order."""
+        postings = sorted(zip(chain(self._docs, docs), chain(self._weights, weights)), key=itemgetter(0))
+        self._docs = array("i", [doc for doc, _ in postings])
+        self._weights = array("d", [weight for _, weight in postings])
+
+    def cursor(self) -> PostingsCursor:
+        """Get a cursor over the postings, that can skip to a document."""
+        return PostingsCursor(self._docs, self._weights)
+
+    def __len__(self):
+        return len(self._docs)
+
+    def __iter__(self):
+        # lightweight view, the TokenInfo objects only live while they are used
+        for doc, weight in zip(self._docs, self._weights):
+            yield TokenInfo(self._doc_ids[doc], weight)
+
+    def __repr__(self):
+        return ";".join(str(info) for info in self)
@@ -1,8 +1,58 @@
+import heapq
+import time
+
+from array import array
+from bisect import bisect_left
 from collections import Counter
+from itertools import accumulate
 from math import sqrt
 
 from Tokenizer import Tokenizer
 from Indexer import Indexer
+from Postings import Postings
+from CompressedPostings import CompressedPostings
+from Timers import timers
+
+
+# the upper bounds are summed in a different order than the scores, this margin keeps them safe
+BOUND_MARGIN = 1 + 1e-9
+
+
+class _BatchIndex:
+    """
+    Index used by a batch of queries, the postings, frequency and max weight of every token
+    are fetched only once for all the queries. Compressed postings are decoded once.
+    """
+    def __init__(self, index:Indexer):
+        self._index = index
+        self._postings = {}
+        self._token_freqs = {}
+        self._max_weights = {}
+
+    @property
+    def doc_ids(self) -> list:
+        return self._index.doc_ids
+
+    def get_token_search(self, token) -> Postings:
+        if token not in self._postings:
+            postings = self._index.get_token_search(token)
+            if isinstance(postings, CompressedPostings):
+                postings = Postings(self.doc_ids, array("i", postings.docs), array("d", postings.weights))
+            self._postings[token] = postings
+        return self._postings[token]
+
+    def get_token_freq(self, token) -> float:
+        if token not in self._token_freqs:
+            self._token_freqs[token] = self._index.get_token_freq(token)
+        return self._token_freqs[token]
+
+    def get_token_max_weight(self, token) -> float:
+        if token not in self._max_weights:
+            self._max_weights[token] = self._index.get_token_max_weight(token)
+        return self._max_weights[token]
+
+    def get_token_impacts(self, token) -> tuple:
+        return self._index.get_token_impacts(token)
 
 
 class Query:
@@ -13,14 +63,26 @@ class Query:
 
     Methods
     -------
-    __process()
+    _tokenize()
+        Get the tokens of the query.
+    _process()
         Calculates the weight of the query tokens in case of using the idf.
+    __rank()
+        Sort the documents by score.
+    _max_score_postings()
+        Get the upper bounds and the postings used by __max_score().
+    __max_score()
+        Search the k best documents, skipping the postings that can not change them.
+    _exact_rank()
+        Get the k best candidate documents, with their exact scores.
     lookup_idf()
         Search the tokens relevant for the query. Using idf.
     lookup_bm25()
         Search the tokens relevant for the query. Using bm25.
+    lookup_batch()
+        Search the tokens relevant for many queries at once.
     """
-    def __init__(self, query:str, index:Indexer, tokenizer:Tokenizer):
+    def __init__(self, query:str, index:Indexer, tokenizer:Tokenizer, tokens:list = None):
         """
         Parameters
         ----------
@@ -30,64 +92,302 @@ class Query:
             The indexer object.
         tokenizer : Tokenizer
             The tokenizer object that will tokenize the documents.
+        tokens : list
+            The tokens of the query, when it was already tokenized.
         """
         self._query = query
         self._tokenizer = tokenizer
         self._index = index
+        self._tokens = tokens
         self._query_vector = {}
 
-    def __process(self) -> None:
+    def _tokenize(self) -> list:
+        """
+        Get the tokens of the query, it is only tokenized once.
+        """
+        if self._tokens is None:
+            with timers.timer("query.tokenize"):
+                self._tokens = self._tokenizer.tokenize(self._query)
+        return self._tokens
+
+    def _process(self) -> None:
         """
         Calculates the weight of the query tokens in case of using the idf.
         """
         # * First step, tokenize the query and get the weights
         weight_total = 0
-        token_list = self._tokenizer.tokenize(self._query)
-        token_list = dict(Counter(token_list)).items()
+        token_list = dict(Counter(self._tokenize())).items()
         for token, freq in token_list:
             weight = freq * self._index.get_token_freq(token)
             self._query_vector[token] = weight
             weight_total += weight ** 2
-            
+
+        # none of the tokens is on the index, or they are on all the documents
+        if weight_total == 0:
+            return
+
         for token in self._query_vector:
             self._query_vector[token] = weight / sqrt(weight_total)
 
-    def lookup_idf(self) -> list:
+    def __rank(self, prox_by_doc:dict, top_k:int) -> list:
+        """
+        Sort the documents by score, the document numbers are mapped back to document ids.
+        With top_k only the k best documents are kept, with a bounded heap instead of sorting all.
+        """
+        with timers.timer("query.rank"):
+            doc_ids = self._index.doc_ids
+            if top_k is None:
+                ranked = sorted(prox_by_doc.items(), key=lambda t: t[1], reverse=True)
+            else:
+                ranked = heapq.nlargest(top_k, prox_by_doc.items(), key=lambda t: t[1])
+            return [(doc_ids[doc], prox) for doc, prox in ranked]
+
+    def _max_score_postings(self, query_terms:list) -> tuple:
+        """
+        Get the query weight and upper bound of the score of every token, and its postings as arrays.
+
+        Returns
+        -------
+        tuple
+            The query weight and upper bound, and the documents and weights, by token.
+        """
+        terms = {}
+        for token, query_weight in query_terms:
+            terms.setdefault(token, [0, 0])
+            terms[token][0] += query_weight
+            terms[token][1] += query_weight * self._index.get_token_max_weight(token)
+
+        postings = {}
+        for token in terms:
+            token_postings = self._index.get_token_search(token)
+            docs, weights = token_postings.docs, token_postings.weights
+            if isinstance(token_postings, CompressedPostings):
+                docs, weights = array("i", docs), array("d", weights)
+            postings[token] = docs, weights
+
+        return terms, postings
+
+    def __max_score(self, query_terms:list, terms:dict, postings:dict, top_k:int) -> list:
+        """
+        Search the k best documents with MaxScore dynamic pruning.
+        The terms are scored in decreasing order of the upper bound of their score. Once the bounds
+        of the remaining terms can not reach the k-th best partial score, no other document can enter
+        the top k, so the remaining terms are only added to the documents that can still reach it,
+        searching them on the sorted postings.
+        The best documents are then scored again in the order of query_terms, and the ties are broken
+        by the order the documents are found, so the result is the same as __rank() over all the documents.
+
+        Parameters
+        ----------
+        query_terms : list
+            The tokens and their query weights, in the order the scores are summed.
+        terms : dict
+            The query weight and upper bound of every token.
+        postings : dict
+            The documents and weights of every token.
+        top_k : int
+            The number of documents to return.
+        """
+        if top_k < 1:
+            return []
+
+        start_time = time.perf_counter()
+        tokens = sorted(terms, key=lambda token: terms[token][1], reverse=True)
+        # bound of the terms from the i-th token on
+        bounds = list(accumulate(terms[token][1] * BOUND_MARGIN for token in reversed(tokens)))[::-1] + [0]
+
+        prox_by_doc = {}
+        scored = 0
+        for token in tokens:
+            if len(prox_by_doc) >= top_k and bounds[scored] < heapq.nlargest(top_k, prox_by_doc.values())[-1]:
+                break
+            query_weight = terms[token][0]
+            for doc, weight in zip(*postings[token]):
+                prox_by_doc[doc] = prox_by_doc.get(doc, 0) + query_weight * weight
+            scored += 1
+
+        # the remaining tokens are only added to the documents that can still reach the k-th best score
+        for i in range(scored, len(tokens)):
+            kth_score = heapq.nlargest(top_k, prox_by_doc.values())[-1] / BOUND_MARGIN
+            prox_by_doc = {doc: prox for doc, prox in prox_by_doc.items() if (prox + bounds[i]) * BOUND_MARGIN >= kth_score}
+
+            docs, weights = postings[tokens[i]]
+            query_weight = terms[tokens[i]][0]
+            if len(docs) > len(prox_by_doc):
+                for doc in prox_by_doc:
+                    position = bisect_left(docs, doc)
+                    while position < len(docs) and docs[position] == doc:
+                        prox_by_doc[doc] += query_weight * weights[position]
+                        position += 1
+            else:
+                for doc, weight in zip(docs, weights):
+                    if doc in prox_by_doc:
+                        prox_by_doc[doc] += query_weight * weight
+
+        timers.record("query.score", time.perf_counter() - start_time)
+        if not prox_by_doc:
+            return []
+
+        kth_score = heapq.nlargest(top_k, prox_by_doc.values())[-1] / BOUND_MARGIN
+        return self._exact_rank(query_terms, postings, [doc for doc, prox in prox_by_doc.items()
+                                                        if prox * BOUND_MARGIN >= kth_score], top_k)
+
+    def _exact_rank(self, query_terms:list, postings:dict, candidates:list, top_k:int) -> list:
+        """
+        Get the k best candidate documents, with their exact scores summed in the same order as the
+        exhaustive search. The ties are broken by the order the exhaustive search finds the documents,
+        so the result is the same as __rank() when the candidates have all the k best documents.
+
+        Parameters
+        ----------
+        query_terms : list
+            The tokens and their query weights, in the order the scores are summed.
+        postings : dict
+            The documents and weights of every token, sorted by document.
+        candidates : list
+            The documents to score.
+        top_k : int
+            The number of documents to return.
+        """
+        start_time = time.perf_counter()
+        ranked = []
+        for doc in candidates:
+            score = 0
+            first_term = None
+            for term, (token, query_weight) in enumerate(query_terms):
+                docs, weights = postings[token]
+                position = bisect_left(docs, doc)
+                while position < len(docs) and docs[position] == doc:
+                    if first_term is None:
+                        first_term = term
+                    score += query_weight * weights[position]
+                    position += 1
+            ranked.append((score, -first_term, -doc))
+
+        doc_ids = self._index.doc_ids
+        ranked = [(doc_ids[-doc], score) for score, _, doc in heapq.nlargest(top_k, ranked)]
+        timers.record("query.rank", time.perf_counter() - start_time)
+        return ranked
+
+    def lookup_idf(self, top_k:int = None, pruning:bool = False) -> list:
         """
         Search the tokens relevant for the query. Using idf.
 
+        Parameters
+        ----------
+        top_k : int
+            The number of documents to return, all the documents found if None.
+        pruning : bool
+            Use MaxScore dynamic pruning to find the top_k documents.
+
         Returns
         -------
         list
             The list of relevant tokens.
         """
-        self.__process()
-        prox_by_doc = {}
+        self._tokenize()
+        with timers.timer("query.fetch"):
+            self._process()
+            query_terms = list(self._query_vector.items())
+            if pruning and top_k is not None:
+                terms, postings = self._max_score_postings(query_terms)
+            else:
+                postings = {token: self._index.get_token_search(token) for token in self._query_vector}
 
-        for token in self._query_vector:
-            for token_info in self._index.get_token_search(token):
-                doc = token_info.doc
-                if doc not in prox_by_doc:
-                    prox_by_doc[doc] = 0
-                prox_by_doc[doc] += self._query_vector[token] * token_info.weight
+        if pruning and top_k is not None:
+            return self.__max_score(query_terms, terms, postings, top_k)
+
+        with timers.timer("query.score"):
+            prox_by_doc = {}
 
-        return sorted(prox_by_doc.items(), key=lambda t: t[1], reverse=True)
+            for token in self._query_vector:
+                query_weight = self._query_vector[token]
+                for doc, weight in zip(postings[token].docs, postings[token].weights):
+                    if doc not in prox_by_doc:
+                        prox_by_doc[doc] = 0
+                    prox_by_doc[doc] += query_weight * weight
 
-    def lookup_bm25(self) -> list:
+        return self.__rank(prox_by_doc, top_k)
+
+    def lookup_bm25(self, top_k:int = None, pruning:bool = False) -> list:
         """
         Search the tokens relevant for the query. Using bm25.
 
+        Parameters
+        ----------
+        top_k : int
+            The number of documents to return, all the documents found if None.
+        pruning : bool
+            Use MaxScore dynamic pruning to find the top_k documents.
+
         Returns
         -------
         list
             The list of relevant tokens.
         """
-        prox_by_doc = {}
-        for token in self._tokenizer.tokenize(self._query):
-            for token_info in self._index.get_token_search(token):
-                doc = token_info.doc
-                if doc not in prox_by_doc:
-                    prox_by_doc[doc] = 0
-                prox_by_doc[doc] += token_info.weight
-
-        return sorted(prox_by_doc.items(), key=lambda t: t[1], reverse=True)
+        tokens = self._tokenize()
+        with timers.timer("query.fetch"):
+            if pruning and top_k is not None:
+                query_terms = [(token, 1) for token in tokens]
+                terms, postings = self._max_score_postings(query_terms)
+            else:
+                postings = [self._index.get_token_search(token) for token in tokens]
+
+        if pruning and top_k is not None:
+            return self.__max_score(query_terms, terms, postings, top_k)
+
+        with timers.timer("query.score"):
+            prox_by_doc = {}
+            for token_postings in postings:
+                for doc, weight in zip(token_postings.docs, token_postings.weights):
+                    if doc not in prox_by_doc:
+                        prox_by_doc[doc] = 0
+                    prox_by_doc[doc] += weight
+
+        return self.__rank(prox_by_doc, top_k)
+
+    @classmethod
+    def lookup_batch(cls, queries:dict, index:Indexer, tokenizer:Tokenizer, use_bm:bool,
+                     top_k:int = None, pruning:bool = False) -> dict:
+        """
+        Search the tokens relevant for many queries at once.
+        Every query is tokenized once and the queries with the same tokens are only searched once.
+        The postings of every token are fetched and decoded once for all the queries, but every query
+        is scored on its own, so it can stop early with pruning. NumpyQuery scores the queries together.
+
+        Parameters
+        ----------
+        queries : dict
+            The queries, by query id.
+        index : Indexer
+            The indexer object.
+        tokenizer : Tokenizer
+            The tokenizer object that will tokenize the queries.
+        use_bm : bool
+            Use bm25 instead of idf.
+        top_k : int
+            The number of documents to return for every query, all the documents found if None.
+        pruning : bool
+            Use MaxScore dynamic pruning to find the top_k documents.
+
+        Returns
+        -------
+        dict
+            The list of relevant tokens, by query id.
+        """
+        batch_index = _BatchIndex(index)
+        results_by_tokens = {}
+        results = {}
+        for query_id, query in queries.items():
+            with timers.timer("query.tokenize"):
+                tokens = tokenizer.tokenize(query)
+            key = tuple(tokens)
+            if key not in results_by_tokens:
+                query_search = cls(query, batch_index, tokenizer, tokens)
+                if use_bm:
+                    results_by_tokens[key] = query_search.lookup_bm25(top_k, pruning)
+                else:
+                    results_by_tokens[key] = query_search.lookup_idf(top_k, pruning)
+            results[query_id] = results_by_tokens[key]
+
+        return results
@@ -0,0 +1,202 @@
+import time
+
+from array import array
+from collections import OrderedDict
+
+from Tokenizer import Tokenizer
+from Indexer import Indexer
+from Postings import Postings
+from CompressedPostings import CompressedPostings
+from Query import Query
+from Timers import timers
+
+
+# rough size in bytes of a cached result, and of a document on a result, used for the memory budget
+RESULT_SIZE = 400
+RESULT_DOC_SIZE = 90
+
+
+class _CachedIndex:
+    """
+    Index with the postings of the hot tokens cached, at most max_postings postings are kept,
+    the least recently used tokens are evicted first. Compressed postings are kept decoded.
+    """
+    def __init__(self, index:Indexer, max_postings:int):
+        self._index = index
+        self._max_postings = max_postings
+        self._postings = OrderedDict()
+        self._number_of_postings = 0
+        self._token_freqs = {}
+        self._max_weights = {}
+
+    @property
+    def doc_ids(self) -> list:
+        return self._index.doc_ids
+
+    def clear(self) -> None:
+        self._postings.clear()
+        self._number_of_postings = 0
+        self._token_freqs.clear()
+        self._max_weights.clear()
+
+    def get_token_search(self, token) -> Postings:
+        postings = self._postings.get(token)
+        if postings is not None:
+            self._postings.move_to_end(token)
+            return postings
+
+        postings = self._index.get_token_search(token)
+        if isinstance(postings, CompressedPostings):
+            postings = Postings(self.doc_ids, array("i", postings.docs), array("d", postings.weights))
+        if len(postings) <= self._max_postings:
+            self._postings[token] = postings
+            self._number_of_postings += len(postings)
+            while self._number_of_postings > self._max_postings:
+                self._number_of_postings -= len(self._postings.popitem(last=False)[1])
+        return postings
+
+    def get_token_freq(self, token) -> float:
+        if token not in self._token_freqs:
+            self._token_freqs[token] = self._index.get_token_freq(token)
+        return self._token_freqs[token]
+
+    def get_token_max_weight(self, token) -> float:
+        if token not in self._max_weights:
+            self._max_weights[token] = self._index.get_token_max_weight(token)
+        return self._max_weights[token]
+
+    def get_token_impacts(self, token) -> tuple:
+        return self._index.get_token_impacts(token)
+
+
+class QueryCache:
+    """
+    Class used to cache the results of queries, in front of Query.
+    The results are keyed on the tokens of the query, in the order Query sums their scores and breaks the ties,
+    so queries that only differ on the case, punctuation, stop words or word forms the tokenizer removes share the result.
+    The least recently used results are evicted first, when there are more than max_entries results
+    or they use more than max_memory bytes. The postings of the hot tokens are also cached.
+    Both caches are cleared when the index changes.
+
+    ...
+
+    Attributes
+    ----------
+    hits : int
+        The number of queries answered from the cache.
+    misses : int
+        The number of queries searched on the index.
+    saved_latency : float
+        The time saved by the hits, in seconds.
+
+    Methods
+    -------
+    lookup()
+        Search the documents of a query, from the cache when it was already searched.
+    clear()
+        Remove all the cached results and postings.
+    """
+    def __init__(self, index:Indexer, tokenizer:Tokenizer, max_entries:int = 1000, max_memory:int = None,
+                 max_postings:int = 1000000, query_class:type = Query):
+        """
+        Parameters
+        ----------
+        index : Indexer
+            The indexer object.
+        tokenizer : Tokenizer
+            The tokenizer object that will tokenize the queries.
+        max_entries : int
+            The max number of results cached.
+        max_memory : int
+            The max memory of the results cached, in bytes, no limit if None.
+        max_postings : int
+            The max number of postings cached.
+        query_class : type
+            The class used to search the queries.
+        """
+        self._index = index
+        self._tokenizer = tokenizer
+        self._max_entries = max_entries
+        self._max_memory = max_memory
+        self._query_class = query_class
+        self._results = OrderedDict()
+        self._memory = 0
+        self._cached_index = _CachedIndex(index, max_postings)
+        self._version = getattr(index, "version", 0)
+        self._hits = 0
+        self._misses = 0
+        self._saved_latency = 0
+
+    @property
+    def hits(self) -> int:
+        return self._hits
+
+    @property
+    def misses(self) -> int:
+        return self._misses
+
+    @property
+    def saved_latency(self) -> float:
+        return self._saved_latency
+
+    def clear(self) -> None:
+        """Remove all the cached results and postings."""
+        self._results.clear()
+        self._memory = 0
+        self._cached_index.clear()
+
+    def _evict(self) -> None:
+        """Evict the least recently used results, until the cache is within its bounds."""
+        while self._results and (len(self._results) > self._max_entries or
+                                 self._max_memory is not None and self._memory > self._max_memory):
+            docs, _ = self._results.popitem(last=False)[1]
+            self._memory -= RESULT_SIZE + RESULT_DOC_SIZE * len(docs)
+
+    def lookup(self, query:str, use_bm:bool, top_k:int = None, pruning:bool = False) -> list:
+        """
+        Search the documents of a query, from the cache when the same tokens were already searched.
+
+        Parameters
+        ----------
+        query : str
+            The query.
+        use_bm : bool
+            Use bm25 instead of idf.
+        top_k : int
+            The number of documents to return, all the documents found if None.
+        pruning : bool
+            Use MaxScore dynamic pruning, the results are the same.
+
+        Returns
+        -------
+        list
+            The list of relevant tokens.
+        """
+        start_time = time.perf_counter()
+        version = getattr(self._index, "version", 0)
+        if version != self._version:
+            self.clear()
+            self._version = version
+
+        with timers.timer("query.tokenize"):
+            tokens = self._tokenizer.tokenize(query)
+        key = (use_bm, top_k, tuple(tokens))
+        cached = self._results.get(key)
+        if cached is not None:
+            self._results.move_to_end(key)
+            docs, latency = cached
+            self._hits += 1
+            self._saved_latency += max(0, latency - (time.perf_counter() - start_time))
+            return list(docs)
+
+        self._misses += 1
+        query_search = self._query_class(query, self._cached_index, self._tokenizer, tokens)
+        if use_bm:
+            docs = query_search.lookup_bm25(top_k, pruning)
+        else:
+            docs = query_search.lookup_idf(top_k, pruning)
+
+        self._results[key] = (tuple(docs), time.perf_counter() - start_time)
+        self._memory += RESULT_SIZE + RESULT_DOC_SIZE * len(docs)
+        self._evict()
+        return docs
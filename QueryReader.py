@@ -27,6 +27,8 @@ class QueryReader:
         Get the perfect dcg.
     get_rank_value()
         Get the doc rank value on query.
+    get_rank_values()
+        Get the rank values of all the docs judged on query.
     """
     def __init__(self, query_file_path:str, query_relevance_file_path):
         """
@@ -39,6 +41,9 @@ class QueryReader:
         """
         self._query_file_path = query_file_path
         self._query_relevance_file_path = query_relevance_file_path
+        # calculated once by query
+        self._perfect_dcgs = {}
+        self._rank_values = {}
         if self._query_file_path[-4:] == '.xml':
             self._read_queries_xml()
         else:
@@ -85,18 +90,21 @@ class QueryReader:
         float
             The perfect dcg.
         """
-        perfect_rank = 0
-        num_sums = 0
-        for i in range(2,0,-1):
-            perfect_docs = self._queries_relevance[query_id][i]
-            for doc in perfect_docs:
-                num_sums += 1
-                if num_sums == 1: 
-                    perfect_rank = i
-                    continue
-                perfect_rank += i / log2(num_sums)
-                if num_sums == num_docs: return perfect_rank
-        return perfect_rank
+        if query_id not in self._perfect_dcgs:
+            # the perfect dcg of every number of docs, with the docs sorted by rank value
+            perfect_dcgs = []
+            perfect_rank = 0
+            for i in range(2,0,-1):
+                for _ in self._queries_relevance.get(query_id, {}).get(i, ()):
+                    num_sums = len(perfect_dcgs) + 1
+                    perfect_rank += i if num_sums == 1 else i / log2(num_sums)
+                    perfect_dcgs.append(perfect_rank)
+            self._perfect_dcgs[query_id] = perfect_dcgs
+
+        perfect_dcgs = self._perfect_dcgs[query_id]
+        if not perfect_dcgs or num_docs < 1:
+            return 0
+        return perfect_dcgs[min(num_docs, len(perfect_dcgs)) - 1]
 
     def get_rank_value(self, query_id, doc) -> int:
         """
@@ -110,3 +118,20 @@ class QueryReader:
         if doc in self._queries_relevance[query_id][2]: return 2
         if doc in self._queries_relevance[query_id][1]: return 1
         return 0
+
+    def get_rank_values(self, query_id) -> dict:
+        """
+        Get the rank values of all the docs judged on query, the docs judged not relevant have value 0.
+
+        Returns
+        -------
+        dict
+            The rank value, by doc.
+        """
+        if query_id not in self._rank_values:
+            rank_values = {}
+            for i in range(3):
+                for doc in self._queries_relevance.get(query_id, {}).get(i, ()):
+                    rank_values[doc] = i
+            self._rank_values[query_id] = rank_values
+        return self._rank_values[query_id]
@@ -0,0 +1,237 @@
+import asyncio
+import json
+import logging
+import time
+
+from concurrent.futures import ProcessPoolExecutor
+from urllib.parse import urlsplit, parse_qs
+
+from Tokenizer import Tokenizer
+from Indexer import Indexer
+from Query import Query
+from Timers import timers
+
+
+logger = logging.getLogger("server")
+
+# the largest request accepted, in bytes
+MAX_REQUEST_SIZE = 65536
+
+_worker_state = None
+
+
+def _init_worker(index:Indexer, tokenizer:Tokenizer, query_class:type) -> None:
+    """Keep the index on the worker process, so it is only sent once."""
+    global _worker_state
+    _worker_state = (index, tokenizer, query_class)
+    # a forked worker starts with a copy of the histograms of the parent, only its own are sent back
+    timers.reset()
+
+
+def _search_batch(queries:dict, use_bm:bool, top_k:int, pruning:bool) -> tuple:
+    """Search a batch of queries on a worker process, the stages timed on the worker are sent back."""
+    index, tokenizer, query_class = _worker_state
+    results = query_class.lookup_batch(queries, index, tokenizer, use_bm, top_k, pruning)
+    histograms = timers.histograms
+    timers.reset()
+    return results, histograms
+
+
+class QueryServer:
+    """
+    Class used to serve queries over HTTP, on a TCP port or a Unix socket, with the index kept in memory.
+    The queries are scored in a pool of processes, the requests that arrive together are
+    searched as one batch, so the tokens they share are only fetched once.
+
+    Endpoints
+    ---------
+    GET /search?q=<query>&k=<number of documents>
+        The ranked documents, as JSON.
+    GET /metrics
+        The time percentiles of the server, in the Prometheus text format.
+    GET /health
+        Check the server is up.
+
+    ...
+
+    Methods
+    -------
+    serve()
+        Serve until cancelled.
+    """
+    def __init__(self, index:Indexer, tokenizer:Tokenizer, use_bm:bool, workers:int = 2, top_k:int = 50,
+                 pruning:bool = False, query_class:type = Query, batch_wait:float = 0.002, max_batch:int = 64):
+        """
+        Parameters
+        ----------
+        index : Indexer
+            The indexer object, or an IndexReader.
+        tokenizer : Tokenizer
+            The tokenizer object that will tokenize the queries.
+        use_bm : bool
+            Use bm25 instead of idf.
+        workers : int
+            The number of processes used to score the queries.
+        top_k : int
+            The default number of documents of a search, and the max a request can ask.
+        pruning : bool
+            Use MaxScore dynamic pruning.
+        query_class : type
+            The class used to search the queries.
+        batch_wait : float
+            The time a request waits for others to be searched with it, in seconds.
+        max_batch : int
+            The max number of requests searched at once.
+        """
+        self._index = index
+        self._tokenizer = tokenizer
+        self._use_bm = use_bm
+        self._workers = workers
+        self._top_k = top_k
+        self._pruning = pruning
+        self._query_class = query_class
+        self._batch_wait = batch_wait
+        self._max_batch = max_batch
+        self._pending = None
+        self._executor = None
+
+    async def _batcher(self) -> None:
+        """Collect the pending requests in batches, and search every batch on a worker."""
+        loop = asyncio.get_running_loop()
+        # at most one batch for every worker, the next batch grows while they are busy
+        slots = asyncio.Semaphore(self._workers)
+        while True:
+            batch = [await self._pending.get()]
+            deadline = loop.time() + self._batch_wait
+            while len(batch) < self._max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._pending.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            await slots.acquire()
+            task = loop.create_task(self._search(batch))
+            task.add_done_callback(lambda _: slots.release())
+
+    async def _search(self, batch:list) -> None:
+        """Search a batch of requests on a worker, and answer every request."""
+        loop = asyncio.get_running_loop()
+        queries = {str(number): query for number, (query, _, _) in enumerate(batch)}
+        top_k = max(k for _, k, _ in batch)
+        try:
+            results, histograms = await loop.run_in_executor(self._executor, _search_batch, queries, self._use_bm, top_k, self._pruning)
+        except Exception as error:
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_exception(error)
+            return
+        timers.merge(histograms)
+        # the best k documents are the first k of the best top_k
+        for number, (_, k, future) in enumerate(batch):
+            if not future.done():
+                future.set_result(results[str(number)][:k])
+
+    async def search(self, query:str, top_k:int = None) -> list:
+        """
+        Search a query, with the other requests of its batch.
+
+        Returns
+        -------
+        list
+            The ranked documents and their scores.
+        """
+        future = asyncio.get_running_loop().create_future()
+        await self._pending.put((query, self._top_k if top_k is None else top_k, future))
+        return await future
+
+    @staticmethod
+    def _response(writer:asyncio.StreamWriter, status:str, body:bytes, content_type:str = "application/json") -> None:
+        """Write a HTTP response, the connection is kept open."""
+        writer.write(("HTTP/1.1 %s\r\nContent-Type: %s\r\nContent-Length: %d\r\nConnection: keep-alive\r\n\r\n"
+                      % (status, content_type, len(body))).encode() + body)
+
+    async def _handle(self, reader:asyncio.StreamReader, writer:asyncio.StreamWriter) -> None:
+        """Answer the requests of a connection, until the client closes it."""
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b"\r\n\r\n")
+                except asyncio.IncompleteReadError:
+                    break
+                except asyncio.LimitOverrunError:
+                    self._response(writer, "413 Payload Too Large", b'{"error": "request too large"}')
+                    break
+                start_time = time.perf_counter()
+
+                request_line = head.split(b"\r\n", 1)[0].decode("latin-1").split(" ")
+                if len(request_line) != 3:
+                    self._response(writer, "400 Bad Request", b'{"error": "bad request"}')
+                    break
+                method, target, _ = request_line
+                url = urlsplit(target)
+                params = parse_qs(url.query)
+
+                if method != "GET":
+                    self._response(writer, "405 Method Not Allowed", b'{"error": "only GET is allowed"}')
+                elif url.path == "/health":
+                    self._response(writer, "200 OK", b'{"status": "ok"}')
+                elif url.path == "/metrics":
+                    self._response(writer, "200 OK", timers.to_prometheus().encode(), "text/plain; version=0.0.4")
+                elif url.path == "/search" and "q" in params:
+                    try:
+                        top_k = int(params["k"][0]) if "k" in params else self._top_k
+                    except ValueError:
+                        top_k = -1
+                    if not 0 < top_k <= self._top_k:
+                        self._response(writer, "400 Bad Request",
+                                       b'{"error": "k must be between 1 and %d"}' % self._top_k)
+                    else:
+                        try:
+                            docs = await self.search(params["q"][0], top_k)
+                        except Exception:
+                            logger.exception("Search failed: %s" % params["q"][0])
+                            self._response(writer, "500 Internal Server Error", b'{"error": "search failed"}')
+                        else:
+                            body = json.dumps({"query": params["q"][0], "results": docs}).encode()
+                            self._response(writer, "200 OK", body)
+                            timers.record("server.latency", time.perf_counter() - start_time)
+                else:
+                    self._response(writer, "404 Not Found", b'{"error": "not found"}')
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, address:str) -> None:
+        """
+        Serve until cancelled.
+
+        Parameters
+        ----------
+        address : str
+            host:port to listen on TCP, or the path of a Unix socket.
+        """
+        self._pending = asyncio.Queue()
+        self._executor = ProcessPoolExecutor(self._workers, initializer=_init_worker,
+                                             initargs=(self._index, self._tokenizer, self._query_class))
+        # start the workers before the first request
+        await asyncio.gather(*[asyncio.get_running_loop().run_in_executor(self._executor, time.sleep, 0)
+                               for _ in range(self._workers)])
+
+        if ":" in address:
+            host, port = address.rsplit(":", 1)
+            server = await asyncio.start_server(self._handle, host or None, int(port), limit=MAX_REQUEST_SIZE)
+        else:
+            server = await asyncio.start_unix_server(self._handle, address, limit=MAX_REQUEST_SIZE)
+
+        logger.info("Serving on %s with %d workers" % (address, self._workers))
+        batcher = asyncio.get_running_loop().create_task(self._batcher())
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            batcher.cancel()
+            self._executor.shutdown(cancel_futures=True)
@@ -0,0 +1,293 @@
+import heapq
+import multiprocessing
+
+from array import array
+from bisect import bisect_left
+from itertools import chain
+
+from Tokenizer import Tokenizer
+from CorpusReader import CorpusReader
+from CompressedPostings import CompressedPostings
+from Indexer import Indexer, IndexerBM25
+from Query import Query
+from Timers import timers
+
+
+def _tie_breaks(results:dict, queries:dict, indexer:Indexer, tokenizer:Tokenizer, doc_numbers:dict,
+	doc_rows:dict) -> dict:
+	"""
+	Add to every document found the keys a single index breaks the ties of its scores with:
+	the first query token found on the document, and the row of the document on the data file.
+	"""
+	with timers.timer("query.tie_break"):
+		postings = {}
+		tie_breaks = {}
+		for query_id, docs in results.items():
+			tokens = list(dict.fromkeys(tokenizer.tokenize(queries[query_id])))
+			for token in tokens:
+				if token not in postings:
+					token_postings = indexer.get_token_search(token)
+					postings[token] = token_postings.docs
+					if isinstance(token_postings, CompressedPostings):
+						postings[token] = array("i", postings[token])
+
+			tie_breaks[query_id] = []
+			for doc_id, score in docs:
+				doc = doc_numbers[doc_id]
+				for first_term, token in enumerate(tokens):
+					position = bisect_left(postings[token], doc)
+					if position < len(postings[token]) and postings[token][position] == doc:
+						break
+				tie_breaks[query_id].append((doc_id, score, first_term, doc_rows[doc_id]))
+		return tie_breaks
+
+
+def _shard_process(connection, data_file_path:str, shard:int, shards:int, tokenizer:Tokenizer,
+	use_bm:bool, k1:float, b:float, workers:int, query_class:type) -> None:
+	"""
+	Index a shard and search it for the coordinator, until it is closed.
+	The shard sends its statistics, and is finalized with the statistics of the whole collection.
+	"""
+	try:
+		corpus = CorpusReader(data_file_path, shard, shards)
+		if use_bm:
+			indexer = IndexerBM25(corpus, tokenizer, k1, b, workers)
+		else:
+			indexer = Indexer(corpus, tokenizer, workers)
+
+		indexer.indexing(finalize=False)
+		connection.send(indexer.statistics())
+		indexer.set_statistics(*connection.recv())
+		indexer.finalize()
+		connection.send(len(indexer.doc_ids))
+		doc_numbers = {doc_id: doc for doc, doc_id in enumerate(indexer.doc_ids)}
+
+		while True:
+			message = connection.recv()
+			if message is None:
+				break
+			queries, search_bm, top_k, pruning = message
+			results = query_class.lookup_batch(queries, indexer, tokenizer, search_bm, top_k, pruning)
+			connection.send(_tie_breaks(results, queries, indexer, tokenizer, doc_numbers, corpus.doc_rows))
+
+		# the stages timed on the shard are counted by the coordinator
+		connection.send(timers.histograms)
+	except Exception as error:
+		connection.send(error)
+	finally:
+		connection.close()
+
+
+class ShardedIndex:
+	"""
+	Class used to split the collection in shards by document, every shard is indexed and searched by its own process.
+	The shards share the statistics of the whole collection, the number of documents, the number of documents
+	of every token and the average document length, so the scores of all the shards are comparable.
+	A search is sent to all the shards at once, and the best documents of every shard are merged.
+
+	...
+
+	Attributes
+	----------
+	number_of_docs : int
+		The number of documents of the collection.
+	shard_sizes : list
+		The number of documents of every shard.
+
+	Methods
+	-------
+	indexing()
+		Index the shards, and share the statistics of the collection.
+	search()
+		Search queries on all the shards.
+	close()
+		Stop the shard processes.
+	"""
+	def __init__(self, data_file_path:str, tokenizer:Tokenizer, shards:int, use_bm:bool = False, k1:float = 1.2,
+		b:float = 0.75, workers:int = 1, query_class:type = Query):
+		"""
+		Parameters
+		----------
+		data_file_path : str
+			The data file path, every shard reads its documents.
+		tokenizer : Tokenizer
+			The tokenizer object that will tokenize the documents and the queries.
+		shards : int
+			The number of shards.
+		use_bm : bool
+			Index with the BM25 weights.
+		k1 : float
+			K value for the BM25 method.
+		b : float
+			B value for the BM25 method.
+		workers : int
+			The number of processes used by every shard to tokenize its documents.
+		query_class : type
+			The class used by the shards to search the queries.
+		"""
+		self._data_file_path = data_file_path
+		self._tokenizer = tokenizer
+		self._shards = shards
+		self._use_bm = use_bm
+		self._k1 = k1
+		self._b = b
+		self._workers = workers
+		self._query_class = query_class
+		self._connections = []
+		self._processes = []
+		self._number_of_docs = 0
+		self._shard_sizes = []
+
+	@property
+	def number_of_docs(self) -> int:
+		return self._number_of_docs
+
+	@property
+	def shard_sizes(self) -> list:
+		return self._shard_sizes
+
+	@staticmethod
+	def _receive(connection):
+		"""Receive the answer of a shard, raising the error of the shard if it failed."""
+		answer = connection.recv()
+		if isinstance(answer, Exception):
+			raise answer
+		return answer
+
+	def indexing(self) -> None:
+		"""
+		Index the shards, every shard on its own process.
+		The statistics of the collection are the sum of the statistics of the shards,
+		they are sent back to every shard before it calculates its weights.
+		"""
+		for shard in range(self._shards):
+			connection, shard_connection = multiprocessing.Pipe()
+			# not a daemon, the shard can have its own pool of workers
+			process = multiprocessing.Process(target=_shard_process, args=(shard_connection, self._data_file_path,
+				shard, self._shards, self._tokenizer, self._use_bm, self._k1, self._b, self._workers, self._query_class))
+			process.start()
+			shard_connection.close()
+			self._connections.append(connection)
+			self._processes.append(process)
+
+		number_of_docs = 0
+		doc_freqs = {}
+		total_doc_len = 0
+		for connection in self._connections:
+			shard_docs, shard_doc_freqs, shard_doc_len = self._receive(connection)
+			number_of_docs += shard_docs
+			total_doc_len += shard_doc_len
+			for token, doc_freq in shard_doc_freqs.items():
+				doc_freqs[token] = doc_freqs.get(token, 0) + doc_freq
+
+		for connection in self._connections:
+			connection.send((number_of_docs, doc_freqs, total_doc_len))
+		self._shard_sizes = [self._receive(connection) for connection in self._connections]
+		self._number_of_docs = number_of_docs
+
+	def search(self, queries:dict, use_bm:bool, top_k:int = None, pruning:bool = False) -> dict:
+		"""
+		Search queries on all the shards, the shards search at the same time.
+		The best top_k documents of the collection are among the best top_k documents of every shard.
+		The ties are broken as on a single index, by the first query token found on the document,
+		and then by the row of the document on the data file.
+
+		Parameters
+		----------
+		queries : dict
+			The queries, by query id.
+		use_bm : bool
+			Use bm25 instead of idf.
+		top_k : int
+			The number of documents to return for every query, all the documents found if None.
+		pruning : bool
+			Use MaxScore dynamic pruning on every shard.
+
+		Returns
+		-------
+		dict
+			The list of relevant documents, by query id.
+		"""
+		for connection in self._connections:
+			connection.send((queries, use_bm, top_k, pruning))
+		shard_results = [self._receive(connection) for connection in self._connections]
+
+		with timers.timer("query.merge"):
+			results = {}
+			for query_id in queries:
+				docs = chain.from_iterable(shard_result[query_id] for shard_result in shard_results)
+				ranked = ((score, -first_term, -row, doc_id) for doc_id, score, first_term, row in docs)
+				if top_k is None:
+					ranked = sorted(ranked, reverse=True)
+				else:
+					ranked = heapq.nlargest(top_k, ranked)
+				results[query_id] = [(doc_id, score) for score, _, _, doc_id in ranked]
+			return results
+
+	def close(self) -> None:
+		"""
+		Stop the shard processes, the stages they timed are added to the timers of this process.
+		The shards that failed are already stopped.
+		"""
+		for connection in self._connections:
+			try:
+				connection.send(None)
+			except OSError:
+				pass
+		for connection, process in zip(self._connections, self._processes):
+			try:
+				answer = connection.recv()
+				if isinstance(answer, dict):
+					timers.merge(answer)
+			except EOFError:
+				pass
+			connection.close()
+			process.join()
+		self._connections = []
+		self._processes = []
+
+
+class ShardedQuery:
+	"""
+	Class used to search queries on a ShardedIndex, with the same methods as Query.
+
+	...
+
+	Methods
+	-------
+	lookup_idf()
+		Search the documents relevant for the query. Using idf.
+	lookup_bm25()
+		Search the documents relevant for the query. Using bm25.
+	lookup_batch()
+		Search the documents relevant for many queries at once.
+	"""
+	def __init__(self, query:str, index:ShardedIndex, tokenizer:Tokenizer, tokens:list = None):
+		"""
+		Parameters
+		----------
+		query : str
+			The query.
+		index : ShardedIndex
+			The sharded index.
+		tokenizer : Tokenizer
+			Not used, every shard tokenizes the query.
+		tokens : list
+			Not used, every shard tokenizes the query.
+		"""
+		self._query = query
+		self._index = index
+
+	def lookup_idf(self, top_k:int = None, pruning:bool = False) -> list:
+		"""Search the documents relevant for the query on all the shards. Using idf."""
+		return self._index.search({0: self._query}, False, top_k, pruning)[0]
+
+	def lookup_bm25(self, top_k:int = None, pruning:bool = False) -> list:
+		"""Search the documents relevant for the query on all the shards. Using bm25."""
+		return self._index.search({0: self._query}, True, top_k, pruning)[0]
+
+	@classmethod
+	def lookup_batch(cls, queries:dict, index:ShardedIndex, tokenizer:Tokenizer, use_bm:bool,
+		top_k:int = None, pruning:bool = False) -> dict:
+		"""Search the documents relevant for many queries at once, every shard searches them as a batch."""
+		return index.search(queries, use_bm, top_k, pruning)
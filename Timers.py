@@ -0,0 +1,233 @@
+import json
+import threading
+import time
+
+from contextlib import contextmanager
+from math import ceil
+
+
+# the values of a bucket differ by less than 1 / 2 ** (SUB_BUCKET_BITS - 1) of the value
+SUB_BUCKET_BITS = 7
+PERCENTILES = [50, 90, 99]
+
+
+class Histogram:
+    """
+    Class used to count durations on logarithmic buckets, as HDR histograms do.
+    Every power of two is split in 2 ** (SUB_BUCKET_BITS - 1) linear buckets, so the percentiles
+    have the same relative precision from nanoseconds to hours, with a small fixed number of buckets.
+
+    ...
+
+    Attributes
+    ----------
+    count : int
+        The number of durations.
+    total : float
+        The sum of the durations, in seconds.
+
+    Methods
+    -------
+    record()
+        Count a duration.
+    merge()
+        Count the durations of another histogram.
+    percentile()
+        Get the duration below which are the given percent of the durations.
+    summary()
+        Get the count, sum, mean, min, max and percentiles.
+    """
+    __slots__ = ("_buckets", "_count", "_total", "_min", "_max")
+
+    def __init__(self):
+        self._buckets = {}
+        self._count = 0
+        self._total = 0
+        self._min = None
+        self._max = None
+
+    @property
+    def count(self) -> int:
+        return self._count
+
+    @property
+    def total(self) -> float:
+        return self._total
+
+    @staticmethod
+    def _bucket(nanoseconds:int) -> int:
+        """The bucket of a duration, the buckets are sorted as the durations."""
+        shift = max(0, nanoseconds.bit_length() - SUB_BUCKET_BITS)
+        return shift << SUB_BUCKET_BITS | nanoseconds >> shift
+
+    @staticmethod
+    def _bucket_value(bucket:int) -> float:
+        """The middle duration of a bucket, in seconds."""
+        shift = bucket >> SUB_BUCKET_BITS
+        low = (bucket & ((1 << SUB_BUCKET_BITS) - 1)) << shift
+        return (low + ((1 << shift) - 1) / 2) / 1e9
+
+    def record(self, seconds:float) -> None:
+        """Count a duration, in seconds."""
+        bucket = self._bucket(max(0, int(seconds * 1e9)))
+        self._buckets[bucket] = self._buckets.get(bucket, 0) + 1
+        self._count += 1
+        self._total += seconds
+        if self._min is None or seconds < self._min:
+            self._min = seconds
+        if self._max is None or seconds > self._max:
+            self._max = seconds
+
+    def merge(self, other:"Histogram") -> None:
+        """Count the durations of another histogram, from a worker process."""
+        for bucket, count in other._buckets.items():
+            self._buckets[bucket] = self._buckets.get(bucket, 0) + count
+        self._count += other._count
+        self._total += other._total
+        for value in (other._min, other._max):
+            if value is not None:
+                self._min = value if self._min is None else min(self._min, value)
+                self._max = value if self._max is None else max(self._max, value)
+
+    def percentile(self, percent:float) -> float:
+        """
+        Get the duration below which are the given percent of the durations.
+
+        Returns
+        -------
+        float
+            The duration in seconds, 0 if there are none.
+        """
+        if not self._count:
+            return 0
+        rank = max(1, ceil(percent / 100 * self._count))
+        seen = 0
+        for bucket in sorted(self._buckets):
+            seen += self._buckets[bucket]
+            if seen >= rank:
+                return min(self._max, max(self._min, self._bucket_value(bucket)))
+        return self._max
+
+    def summary(self) -> dict:
+        """Get the count, sum, mean, min, max and percentiles, in seconds."""
+        summary = {"count": self._count, "sum": self._total,
+                   "mean": self._total / self._count if self._count else 0,
+                   "min": self._min or 0, "max": self._max or 0}
+        for percent in PERCENTILES:
+            summary["p%d" % percent] = self.percentile(percent)
+        return summary
+
+
+class Timers:
+    """
+    Class used to time the stages of indexing and searching, with monotonic clocks,
+    every stage has a histogram of its durations.
+
+    ...
+
+    Attributes
+    ----------
+    histograms : dict
+        The histogram of every stage, by name.
+
+    Methods
+    -------
+    timer()
+        Context manager that times a stage.
+    timed_iter()
+        Iterate, timing every item as a stage.
+    record()
+        Count the duration of a stage.
+    merge()
+        Count the durations timed on another process.
+    isolated()
+        Context manager that times on histograms of its own.
+    reset()
+        Remove all the histograms.
+    to_json()
+        Export the histograms as JSON.
+    to_prometheus()
+        Export the histograms in the Prometheus text format.
+    """
+    def __init__(self):
+        self._histograms = {}
+        # stages can be timed on background threads
+        self._lock = threading.Lock()
+
+    @property
+    def histograms(self) -> dict:
+        return self._histograms
+
+    def record(self, name:str, seconds:float) -> None:
+        """Count the duration of a stage, in seconds."""
+        with self._lock:
+            histogram = self._histograms.get(name)
+            if histogram is None:
+                histogram = self._histograms[name] = Histogram()
+            histogram.record(seconds)
+
+    def merge(self, histograms:dict) -> None:
+        """Count the durations of the histograms of another process, by name."""
+        with self._lock:
+            for name, other in histograms.items():
+                histogram = self._histograms.get(name)
+                if histogram is None:
+                    histogram = self._histograms[name] = Histogram()
+                histogram.merge(other)
+
+    @contextmanager
+    def timer(self, name:str):
+        """Time the code in the with block as a stage."""
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start_time)
+
+    def timed_iter(self, name:str, iterable):
+        """Iterate, the time taken to get every item is a stage."""
+        iterator = iter(iterable)
+        while True:
+            start_time = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            self.record(name, time.perf_counter() - start_time)
+            yield item
+
+    @contextmanager
+    def isolated(self):
+        """Time the code in the with block on new histograms, the histograms before it are restored after it."""
+        with self._lock:
+            histograms, self._histograms = self._histograms, {}
+        isolated = self._histograms
+        try:
+            yield isolated
+        finally:
+            with self._lock:
+                self._histograms = histograms
+
+    def reset(self) -> None:
+        """Remove all the histograms."""
+        self._histograms = {}
+
+    def to_json(self) -> str:
+        """Export the summary of every histogram as JSON, the durations are in seconds."""
+        return json.dumps({name: histogram.summary() for name, histogram in self._histograms.items()}, indent=2)
+
+    def to_prometheus(self, prefix:str = "ri") -> str:
+        """Export every histogram as a Prometheus summary, the durations are in seconds."""
+        lines = []
+        for name, histogram in self._histograms.items():
+            metric = "%s_%s_seconds" % (prefix, name.replace(".", "_").replace("-", "_"))
+            lines.append("# TYPE %s summary" % metric)
+            for percent in PERCENTILES:
+                lines.append('%s{quantile="%s"} %r' % (metric, percent / 100, histogram.percentile(percent)))
+            lines.append("%s_sum %r" % (metric, histogram.total))
+            lines.append("%s_count %d" % (metric, histogram.count))
+        return "\n".join(lines) + "\n"
+
+
+# timers of this process, shared by the indexers and queries
+timers = Timers()
@@ -2,6 +2,9 @@ import abc
 import re
 import json
 
+from collections import Counter
+from functools import lru_cache
+
 from CorpusReader import CorpusReader
 from nltk.stem.snowball import SnowballStemmer
 
@@ -16,12 +19,29 @@ class Tokenizer(metaclass=abc.ABCMeta):
 	-------
 	tokenize()
 		Tokenize the data.
+
+	Methods
+	-------
+	term_frequencies()
+		Count the tokens of the data.
 	"""
 	@abc.abstractmethod
 	def tokenize(self) -> list:
 		"""Tokenize the data."""
 		pass
 
+	def term_frequencies(self, data) -> tuple:
+		"""
+		Count the tokens of the data, the same tokens tokenize() gives.
+
+		Returns
+		-------
+		tuple
+			The frequency of every token, in order of first occurrence, and the number of tokens.
+		"""
+		tokens = self.tokenize(data)
+		return Counter(tokens), len(tokens)
+
 
 class SimpleTokenizer(Tokenizer):
 	"""
@@ -33,7 +53,12 @@ class SimpleTokenizer(Tokenizer):
 	-------
 	tokenize()
 		Tokenize the data.
+	term_frequencies()
+		Count the tokens of the data, in one pass.
 	"""
+	# maps the letters to lowercase and every other byte to a space, also the bytes of the non-ASCII characters
+	_table = bytes(ord(char.lower()) if char.isascii() and char.isalpha() else ord(" ") for char in map(chr, range(256)))
+
 	def tokenize(self, data) -> list:
 		"""Tokenize the data."""
 		# replaces all non-alphabetic characters by a space
@@ -44,6 +69,23 @@ class SimpleTokenizer(Tokenizer):
 		# ! remove duplicated tokens
 		return [token for token in tokens.split() if len(token) >= 3]
 
+	def term_frequencies(self, data) -> tuple:
+		"""
+		Count the tokens of the data, in one pass.
+		The separators are replaced and the letters put in lowercase at once, by a translation of the bytes of the data,
+		and the tokens are counted without building a list of them.
+
+		Returns
+		-------
+		tuple
+			The frequency of every token, in order of first occurrence, and the number of tokens.
+		"""
+		freqs = Counter(data.encode("utf-8", "surrogatepass").translate(self._table).decode("ascii").split())
+		# ignores all tokens with less than 3 characters
+		for token in [token for token in freqs if len(token) < 3]:
+			del freqs[token]
+		return freqs, sum(freqs.values())
+
 class ImprovedTokenizer(Tokenizer):
 	"""
 	Class used by tokenize the data with a improved tokenizer.
@@ -54,16 +96,63 @@ class ImprovedTokenizer(Tokenizer):
 	----------
 	stemmer : SnowballStemmer
 		The stemmer object.
+	cache_hits : int
+		The number of stems found on the cache.
+	cache_misses : int
+		The number of stems not found on the cache.
+		Both also count the stems of the copies of the tokenizer on worker processes.
 
 	Methods
 	-------
 	tokenize()
 		Tokenize the data.
+	term_frequencies()
+		Count the tokens of the data, in one pass.
+	add_cache_stats()
+		Add the hits and misses of the cache of a copy of the tokenizer.
 	"""
-	def __init__(self):
+	# maps the letters to lowercase, keeps numbers and hyphens, and maps every other byte to a space
+	_table = bytes(ord(char.lower()) if char.isascii() and (char.isalnum() or char == "-") else ord(" ")
+		for char in map(chr, range(256)))
+
+	def __init__(self, cache_size:int = 100000):
+		"""
+		Parameters
+		----------
+		cache_size : int
+			The number of words kept on the LRU cache of stems.
+		"""
 		with open("stopwords.json", "r") as stop:
 			self._stopwords = set(json.load(stop))
 		self._stemmer = SnowballStemmer("english")
+		self._cache_size = cache_size
+		self._stem = lru_cache(maxsize=cache_size)(self._stemmer.stem)
+		# hits and misses of the copies of the tokenizer on worker processes
+		self._worker_hits = 0
+		self._worker_misses = 0
+
+	@property
+	def cache_hits(self) -> int:
+		return self._stem.cache_info().hits + self._worker_hits
+
+	@property
+	def cache_misses(self) -> int:
+		return self._stem.cache_info().misses + self._worker_misses
+
+	def add_cache_stats(self, hits:int, misses:int) -> None:
+		"""Add the hits and misses of the cache of a copy of the tokenizer, used on a worker process."""
+		self._worker_hits += hits
+		self._worker_misses += misses
+
+	def __getstate__(self):
+		# the cache can not be pickled, every worker process builds its own
+		state = self.__dict__.copy()
+		del state["_stem"]
+		return state
+
+	def __setstate__(self, state):
+		self.__dict__.update(state)
+		self._stem = lru_cache(maxsize=self._cache_size)(self._stemmer.stem)
 
 	def tokenize(self, data) -> list:
 		"""Tokenize the data."""
@@ -71,7 +160,28 @@ class ImprovedTokenizer(Tokenizer):
 		tokens = re.sub('[^a-zA-Z0-9\-]+', ' ', data)
 		# put token in lowercase
 		tokens = tokens.lower()
-		# use stemmer
+		# use stemmer, the stopwords are removed before looking for the stem on the cache
 		# ! remove duplicated tokens
-		return [self._stemmer.stem(token)
-				for token in tokens.split() if token not in self._stopwords]
+		stem = self._stem
+		return [stem(token) for token in tokens.split() if token not in self._stopwords]
+
+	def term_frequencies(self, data) -> tuple:
+		"""
+		Count the tokens of the data, in one pass.
+		The words are found as by SimpleTokenizer.term_frequencies() and counted before stemming,
+		so every different word is stemmed once, and the counts of the words with the same stem are summed.
+
+		Returns
+		-------
+		tuple
+			The frequency of every token, in order of first occurrence, and the number of tokens.
+		"""
+		stem = self._stem
+		stopwords = self._stopwords
+		freqs = {}
+		words = data.encode("utf-8", "surrogatepass").translate(self._table).decode("ascii").split()
+		for word, freq in Counter(words).items():
+			if word not in stopwords:
+				token = stem(word)
+				freqs[token] = freqs.get(token, 0) + freq
+		return freqs, sum(freqs.values())
@@ -0,0 +1,529 @@
+import argparse
+import csv
+import json
+import logging
+import os
+import platform
+import random
+import subprocess
+import tempfile
+import time
+import tracemalloc
+
+from collections import Counter
+from datetime import datetime
+from statistics import median
+
+from Tokenizer import SimpleTokenizer, ImprovedTokenizer
+from Indexer import Indexer, IndexerBM25
+from IndexReader import IndexReader
+from Query import Query
+from NumpyQuery import NumpyQuery
+from QueryCache import QueryCache
+from CorpusReader import CorpusReader
+from TokenInfo import TokenInfo
+
+
+logging.basicConfig(
+    level=logging.INFO, format="%(message)s"
+)
+
+logger = logging.getLogger("benchmark")
+
+# words of the synthetic abstracts, as in the CORD-19 abstracts
+ABSTRACT_WORDS = ["coronavirus", "SARS-CoV-2", "COVID-19", "MERS-CoV", "patients", "infection", "infections", "respiratory",
+                  "viral", "virus", "viruses", "clinical", "disease", "diseases", "severe", "acute", "syndrome", "cells",
+                  "protein", "proteins", "ACE2", "receptor", "binding", "spike", "antibodies", "antibody", "vaccine",
+                  "vaccines", "transmission", "outbreak", "epidemic", "pandemic", "Wuhan", "China", "hospital", "mortality",
+                  "treatment", "therapy", "drug", "drugs", "inhibitor", "inhibitors", "immune", "response", "responses",
+                  "cytokine", "IL-6", "T-cell", "RNA", "genome", "sequencing", "PCR", "RT-PCR", "assay", "detection",
+                  "analysis", "analysed", "analyzed", "results", "study", "studies", "studied", "model", "models",
+                  "data", "rate", "rates", "risk", "factors", "age", "children", "pneumonia", "lung", "symptoms",
+                  "fever", "cough", "ICU", "ventilation", "incubation", "period", "days", "cases", "confirmed",
+                  "public", "health", "influenza", "H1N1", "replication", "host", "expression", "mice", "in", "vitro",
+                  "vivo", "significantly", "increased", "decreased", "associated", "compared", "higher", "lower",
+                  "the", "of", "and", "in", "to", "a", "with", "for", "was", "were", "is", "that", "by", "on", "as",
+                  "we", "from", "this", "these", "an", "or", "be", "are", "which", "at", "have", "has", "not"]
+
+HEADER = ["cord_uid", "sha", "source_x", "title", "doi", "pmcid",
+          "pubmed_id", "license", "abstract", "publish_time"]
+
+
+def generate_corpus(file_path:str, num_docs:int, vocabulary_size:int = 20000, seed:int = 0, skew:float = 1) -> None:
+    """
+    Generate a synthetic data file with the same columns used by the CorpusReader.
+    The words follow a Zipf distribution, the frequency of the word of rank r is proportional to 1 / r ** skew.
+    Some abstracts have embedded newlines, as in the real metadata file.
+    """
+    rand = random.Random(seed)
+    vocabulary = ["w%x" % rand.getrandbits(32) for _ in range(vocabulary_size)]
+    cum_weights = []
+    total = 0
+    for rank in range(1, vocabulary_size + 1):
+        total += 1 / rank ** skew
+        cum_weights.append(total)
+
+    def text(size):
+        return " ".join(rand.choices(vocabulary, cum_weights=cum_weights, k=size))
+
+    with open(file_path, "w", newline="") as writer:
+        csv_writer = csv.writer(writer)
+        csv_writer.writerow(HEADER)
+        for doc in range(num_docs):
+            abstract = text(rand.randint(50, 250))
+            if doc % 10 == 0:
+                abstract = abstract.replace(" ", "\n", 2)
+            csv_writer.writerow(["doc%08d" % doc, "", "", text(10), "", "", "", "", abstract, ""])
+
+
+def generate_abstracts(file_path:str, num_docs:int, seed:int = 0) -> None:
+    """
+    Generate a data file with abstracts that look like the CORD-19 ones, with sentences in mixed case,
+    punctuation, numbers, percentages and hyphenated terms, for the benchmarks of the tokenizers.
+    """
+    rand = random.Random(seed)
+    cum_weights = []
+    total = 0
+    for rank in range(1, len(ABSTRACT_WORDS) + 1):
+        total += 1 / rank
+        cum_weights.append(total)
+    # the stopwords, at the end of the list, are the most frequent words
+    words = ABSTRACT_WORDS[::-1]
+
+    def sentence():
+        tokens = rand.choices(words, cum_weights=cum_weights, k=rand.randint(8, 30))
+        tokens[0] = tokens[0].capitalize()
+        for position in rand.sample(range(1, len(tokens)), 2):
+            tokens[position] = rand.choice(["(n = %d)" % rand.randint(10, 5000), "%.1f%%" % (rand.random() * 100),
+                                            "(p < 0.%02d)," % rand.randint(1, 5), tokens[position] + ",",
+                                            "[%d]" % rand.randint(1, 60), tokens[position] + ";"])
+        return " ".join(tokens) + "."
+
+    with open(file_path, "w", newline="") as writer:
+        csv_writer = csv.writer(writer)
+        csv_writer.writerow(HEADER)
+        for doc in range(num_docs):
+            abstract = "Background: " + " ".join(sentence() for _ in range(rand.randint(4, 12)))
+            csv_writer.writerow(["doc%08d" % doc, "", "", sentence(), "", "", "", "", abstract, ""])
+
+
+def tokenizing(size:int, data_file_path:str = None, repeat:int = 3) -> None:
+    """
+    Tokenizing time of every tokenizer, counting the tokens of the list given by tokenize()
+    and with the single pass of term_frequencies(), on the CORD-19 metadata file or on synthetic abstracts.
+    The counts must be the same, in the same order.
+    """
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        if data_file_path is None:
+            data_file_path = os.path.join(tmp_dir, "abstracts_%d.csv" % size)
+            generate_abstracts(data_file_path, size)
+        all_files = {}
+        for batch in CorpusReader(data_file_path).batches(1000):
+            all_files.update(batch)
+        documents = list(all_files.values())
+
+        logger.info("%d documents, %d characters" % (len(documents), sum(len(data) for data in documents)))
+        logger.info("%20s %15s %15s %15s %15s" % ("Tokenizer", "Count (s)", "Fused (s)", "Speedup", "Same counts"))
+        for tokenizer_class in (SimpleTokenizer, ImprovedTokenizer):
+            tokenizer = tokenizer_class()
+            # a first run fills the stem cache
+            counted = []
+            for data in documents:
+                tokens = tokenizer.tokenize(data)
+                counted.append((list(Counter(tokens).items()), len(tokens)))
+            fused = [(list(freqs.items()), length) for freqs, length in map(tokenizer.term_frequencies, documents)]
+
+            def count():
+                for data in documents:
+                    tokens = tokenizer.tokenize(data)
+                    dict(Counter(tokens)), len(tokens)
+            def fuse():
+                for data in documents:
+                    tokenizer.term_frequencies(data)
+            count_time = timed(count, repeat)["seconds"]
+            fused_time = timed(fuse, repeat)["seconds"]
+            logger.info("%20s %15f %15f %15f %15s" % (tokenizer_class.__name__, count_time, fused_time,
+                                                      count_time / fused_time, counted == fused))
+
+
+def indexing(sizes:list, improved_tokenizer:bool, workers:int) -> None:
+    """
+    Indexing time for growing corpus sizes, the time per document should stay flat.
+    """
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        logger.info("%10s %15s %15s" % ("Documents", "Time (s)", "Time/doc (ms)"))
+        for size in sizes:
+            data_file_path = os.path.join(tmp_dir, "data_%d.csv" % size)
+            generate_corpus(data_file_path, size)
+            tokenizer = ImprovedTokenizer() if improved_tokenizer else SimpleTokenizer()
+            indexer = Indexer(CorpusReader(data_file_path), tokenizer, workers)
+
+            start_time = time.perf_counter()
+            indexer.indexing()
+            elapsed = time.perf_counter() - start_time
+            logger.info("%10d %15f %15f" % (size, elapsed, elapsed * 1000 / size))
+
+
+def posting_memory(size:int, improved_tokenizer:bool) -> None:
+    """
+    Memory per posting of the index, with one TokenInfo object per posting and with the compact postings.
+    """
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        data_file_path = os.path.join(tmp_dir, "data_%d.csv" % size)
+        generate_corpus(data_file_path, size)
+        tokenizer = ImprovedTokenizer() if improved_tokenizer else SimpleTokenizer()
+        indexer = Indexer(CorpusReader(data_file_path), tokenizer)
+
+        tracemalloc.start()
+        indexer.indexing()
+        compact_size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+
+        tracemalloc.start()
+        index = {token: [TokenInfo(info.doc, info.weight) for info in postings]
+                 for token, postings in indexer.index.items()}
+        token_info_size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+
+        num_postings = sum(len(postings) for postings in index.values())
+        logger.info("%10s %15s %15s" % ("Postings", "TokenInfo (B)", "Compact (B)"))
+        logger.info("%10d %15f %15f" % (num_postings, token_info_size / num_postings, compact_size / num_postings))
+
+
+def directory_size(directory:str) -> int:
+    """Size of the files of a directory."""
+    return sum(os.path.getsize(os.path.join(directory, file)) for file in os.listdir(directory))
+
+
+def index_size(size:int, improved_tokenizer:bool, num_queries:int = 200) -> None:
+    """
+    Size and speed of the text index and of the binary index, with and without compression.
+    The overlap is the fraction of the top 50 documents of random queries that is kept on every format.
+    """
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        data_file_path = os.path.join(tmp_dir, "data_%d.csv" % size)
+        generate_corpus(data_file_path, size)
+        tokenizer = ImprovedTokenizer() if improved_tokenizer else SimpleTokenizer()
+        rand = random.Random(0)
+
+        for indexer_class, args in ((Indexer, ()), (IndexerBM25, (1.2, 0.75))):
+            indexer = indexer_class(CorpusReader(data_file_path), tokenizer, *args)
+            indexer.indexing()
+            vocabulary = list(indexer.index)
+            queries = [" ".join(rand.choices(vocabulary, k=3)) for _ in range(num_queries)]
+
+            def lookup(index, query_text):
+                query = Query(query_text, index, tokenizer)
+                return query.lookup_bm25() if indexer_class is IndexerBM25 else query.lookup_idf()
+
+            exact = []
+            for query_text in queries:
+                exact.append(set(doc for doc, _ in lookup(indexer, query_text)[:50]))
+
+            logger.info(indexer_class.__name__)
+            logger.info("%10s %15s %15s %15s %15s" % ("Format", "Size (B)", "Write (s)", "Decode (s)", "Overlap@50"))
+
+            file_path = os.path.join(tmp_dir, "index.txt")
+            start_time = time.perf_counter()
+            indexer.write(file_path)
+            elapsed = time.perf_counter() - start_time
+            logger.info("%10s %15d %15f %15s %15s" % ("text", os.path.getsize(file_path), elapsed, "-", "-"))
+
+            for weight_bits in (0, 16, 8):
+                index_path = os.path.join(tmp_dir, "index_%s_%d" % (indexer_class.__name__, weight_bits))
+                start_time = time.perf_counter()
+                indexer.write_binary(index_path, weight_bits)
+                write_time = time.perf_counter() - start_time
+
+                index = IndexReader(index_path)
+                start_time = time.perf_counter()
+                for token in vocabulary:
+                    postings = index.get_token_search(token)
+                    for _ in zip(postings.docs, postings.weights):
+                        pass
+                decode_time = time.perf_counter() - start_time
+
+                overlap = 0
+                for query_text, exact_docs in zip(queries, exact):
+                    docs = set(doc for doc, _ in lookup(index, query_text)[:50])
+                    overlap += len(docs & exact_docs) / len(exact_docs) if exact_docs else 1
+
+                logger.info("%10s %15d %15f %15f %15f" % ("binary%d" % weight_bits if weight_bits else "binary",
+                    directory_size(index_path), write_time, decode_time, overlap / num_queries))
+
+
+def query_throughput(size:int, improved_tokenizer:bool, num_queries:int = 200, top_k:int = 50) -> None:
+    """
+    Query throughput of the python and NumPy engines, the query tokens are drawn by document frequency.
+    """
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        data_file_path = os.path.join(tmp_dir, "data_%d.csv" % size)
+        generate_corpus(data_file_path, size)
+        tokenizer = ImprovedTokenizer() if improved_tokenizer else SimpleTokenizer()
+        rand = random.Random(0)
+
+        logger.info("%12s %10s %15s %15s" % ("Indexer", "Engine", "Queries/s", "Same results"))
+        for indexer_class, args in ((Indexer, ()), (IndexerBM25, (1.2, 0.75))):
+            indexer = indexer_class(CorpusReader(data_file_path), tokenizer, *args)
+            indexer.indexing()
+            vocabulary = list(indexer.index)
+            doc_freqs = [len(indexer.index[token]) for token in vocabulary]
+            queries = [" ".join(rand.choices(vocabulary, weights=doc_freqs, k=rand.randint(2, 6))) for _ in range(num_queries)]
+
+            results = {}
+            for engine, query_class in (("python", Query), ("numpy", NumpyQuery)):
+                start_time = time.perf_counter()
+                results[engine] = []
+                for query_text in queries:
+                    query = query_class(query_text, indexer, tokenizer)
+                    results[engine].append(query.lookup_bm25(top_k) if indexer_class is IndexerBM25 else query.lookup_idf(top_k))
+                elapsed = time.perf_counter() - start_time
+                logger.info("%12s %10s %15f %15s" % (indexer_class.__name__, engine, num_queries / elapsed, results[engine] == results["python"]))
+
+
+def caching(size:int, improved_tokenizer:bool, num_queries:int = 200, top_k:int = 50) -> None:
+    """
+    Query throughput with and without the query cache, the queries are searched with their tokens
+    in the drawn order, then in another order, then again in the drawn order.
+    The cached results must be the same as the results of Query.
+    """
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        data_file_path = os.path.join(tmp_dir, "data_%d.csv" % size)
+        generate_corpus(data_file_path, size)
+        tokenizer = ImprovedTokenizer() if improved_tokenizer else SimpleTokenizer()
+        rand = random.Random(0)
+
+        logger.info("%12s %10s %15s %15s %15s" % ("Indexer", "Cache", "Queries/s", "Hits", "Same results"))
+        for indexer_class, args in ((Indexer, ()), (IndexerBM25, (1.2, 0.75))):
+            indexer = indexer_class(CorpusReader(data_file_path), tokenizer, *args)
+            indexer.indexing()
+            use_bm = indexer_class is IndexerBM25
+            vocabulary = list(indexer.index)
+            doc_freqs = [len(indexer.index[token]) for token in vocabulary]
+            queries = [rand.choices(vocabulary, weights=doc_freqs, k=rand.randint(2, 6)) for _ in range(num_queries)]
+            queries = [" ".join(tokens) for tokens in queries] + \
+                [" ".join(rand.sample(tokens, len(tokens))) for tokens in queries] + [" ".join(tokens) for tokens in queries]
+
+            start_time = time.perf_counter()
+            expected = []
+            for query_text in queries:
+                query = Query(query_text, indexer, tokenizer)
+                expected.append(query.lookup_bm25(top_k) if use_bm else query.lookup_idf(top_k))
+            elapsed = time.perf_counter() - start_time
+            logger.info("%12s %10s %15f %15s %15s" % (indexer_class.__name__, "none", len(queries) / elapsed, "", ""))
+
+            cache = QueryCache(indexer, tokenizer)
+            start_time = time.perf_counter()
+            results = [cache.lookup(query_text, use_bm, top_k) for query_text in queries]
+            elapsed = time.perf_counter() - start_time
+            logger.info("%12s %10s %15f %15d %15s" % (indexer_class.__name__, "query", len(queries) / elapsed,
+                                                      cache.hits, results == expected))
+
+
+def stemming(size:int, cache_sizes:list) -> None:
+    """
+    Tokenizing time of the improved tokenizer, on the batches of 1000 documents read while indexing,
+    for every size of the stem cache.
+    """
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        data_file_path = os.path.join(tmp_dir, "data_%d.csv" % size)
+        generate_corpus(data_file_path, size)
+
+        logger.info("%12s %15s %15s %15s" % ("Cache size", "Time (s)", "Hits", "Misses"))
+        for cache_size in cache_sizes:
+            tokenizer = ImprovedTokenizer(cache_size)
+            start_time = time.perf_counter()
+            for all_files in CorpusReader(data_file_path).batches(1000):
+                for data in all_files.values():
+                    tokenizer.tokenize(data)
+            elapsed = time.perf_counter() - start_time
+            logger.info("%12d %15f %15d %15d" % (cache_size, elapsed, tokenizer.cache_hits, tokenizer.cache_misses))
+
+
+def percentile(values:list, percent:float) -> float:
+    """Nearest rank percentile of the values."""
+    values = sorted(values)
+    return values[max(0, min(len(values) - 1, round(percent / 100 * len(values)) - 1))]
+
+
+def timed(function, repeat:int) -> dict:
+    """Time a function repeat times, the median is the time reported."""
+    runs = []
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        function()
+        runs.append(time.perf_counter() - start_time)
+    return {"seconds": median(runs), "runs": runs}
+
+
+def version() -> str:
+    """The commit of the code benchmarked, None out of a git repository."""
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def suite(sizes:list, vocabulary_size:int, skew:float, seed:int, improved_tokenizer:bool, workers:int,
+          num_queries:int = 200, top_k:int = 50, repeat:int = 1) -> dict:
+    """
+    Benchmark every stage on synthetic corpora: reading the data file, tokenizing with every tokenizer,
+    building the Indexer and IndexerBM25 indexes, writing them and the latency of queries.
+    The corpora and the queries only depend on the parameters, so runs of different versions can be compared.
+    """
+    report = {
+        "version": version(),
+        "date": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "parameters": {"sizes": sizes, "vocabulary_size": vocabulary_size, "skew": skew, "seed": seed,
+                       "improved_tokenizer": improved_tokenizer, "workers": workers,
+                       "queries": num_queries, "top_k": top_k, "repeat": repeat},
+        "results": []
+    }
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for size in sizes:
+            data_file_path = os.path.join(tmp_dir, "data_%d.csv" % size)
+            generate_corpus(data_file_path, size, vocabulary_size, seed, skew)
+            result = {"documents": size, "corpus_bytes": os.path.getsize(data_file_path)}
+            logger.info("%d documents" % size)
+
+            all_files = {}
+            def read():
+                all_files.clear()
+                for batch in CorpusReader(data_file_path).batches(1000):
+                    all_files.update(batch)
+            result["corpus_reader"] = timed(read, repeat)
+            logger.info("%25s %15f s" % ("CorpusReader", result["corpus_reader"]["seconds"]))
+
+            result["tokenizers"] = {}
+            for tokenizer_class in (SimpleTokenizer, ImprovedTokenizer):
+                # a new tokenizer every run, the stem cache starts empty
+                def tokenize():
+                    tokenizer = tokenizer_class()
+                    for data in all_files.values():
+                        tokenizer.tokenize(data)
+                result["tokenizers"][tokenizer_class.__name__] = timed(tokenize, repeat)
+                logger.info("%25s %15f s" % (tokenizer_class.__name__, result["tokenizers"][tokenizer_class.__name__]["seconds"]))
+
+            result["indexers"] = {}
+            for indexer_class, args in ((Indexer, ()), (IndexerBM25, (1.2, 0.75))):
+                stats = result["indexers"][indexer_class.__name__] = {}
+                indexers = []
+                def build():
+                    tokenizer = ImprovedTokenizer() if improved_tokenizer else SimpleTokenizer()
+                    indexers.append(indexer_class(CorpusReader(data_file_path), tokenizer, *args, workers=workers))
+                    indexers[-1].indexing()
+                stats["build"] = timed(build, repeat)
+                indexer = indexers[-1]
+                del indexers[:-1]
+                stats["postings"] = sum(len(postings) for postings in indexer.index.values())
+                stats["tokens"] = len(indexer.index)
+
+                file_path = os.path.join(tmp_dir, "index.txt")
+                stats["write"] = timed(lambda: indexer.write(file_path), repeat)
+                stats["index_bytes"] = os.path.getsize(file_path)
+
+                # the query tokens are drawn by document frequency, with the same seed for every version
+                rand = random.Random(seed)
+                vocabulary = sorted(indexer.index)
+                doc_freqs = [len(indexer.index[token]) for token in vocabulary]
+                queries = [" ".join(rand.choices(vocabulary, weights=doc_freqs, k=rand.randint(2, 6))) for _ in range(num_queries)]
+                tokenizer = ImprovedTokenizer() if improved_tokenizer else SimpleTokenizer()
+                latencies = []
+                for query_text in queries:
+                    start_time = time.perf_counter()
+                    query = Query(query_text, indexer, tokenizer)
+                    if indexer_class is IndexerBM25:
+                        query.lookup_bm25(top_k)
+                    else:
+                        query.lookup_idf(top_k)
+                    latencies.append(time.perf_counter() - start_time)
+                stats["query"] = {"mean": sum(latencies) / num_queries, "p50": percentile(latencies, 50),
+                                  "p90": percentile(latencies, 90), "p99": percentile(latencies, 99),
+                                  "queries_per_second": num_queries / sum(latencies)}
+
+                logger.info("%25s %15f s" % (indexer_class.__name__ + " build", stats["build"]["seconds"]))
+                logger.info("%25s %15f s" % (indexer_class.__name__ + " write", stats["write"]["seconds"]))
+                logger.info("%25s %15f ms" % (indexer_class.__name__ + " query p50", stats["query"]["p50"] * 1000))
+                logger.info("%25s %15f ms" % (indexer_class.__name__ + " query p99", stats["query"]["p99"] * 1000))
+
+            report["results"].append(result)
+    return report
+
+
+if __name__ == "__main__":
+    """
+    EXECUTION
+    ---------
+    indexing time by corpus size:
+        python3 benchmark.py -n 5000 10000 20000 40000
+    indexing time with a pool of processes:
+        python3 benchmark.py -t --workers 8
+    memory per posting of the index:
+        python3 benchmark.py -n 20000 --memory
+    size and speed of the index formats:
+        python3 benchmark.py -n 20000 --size
+    query throughput of the python and NumPy engines:
+        python3 benchmark.py -n 20000 --queries
+    tokenizing time of the tokenizers, counting the tokens in one pass, on the CORD-19 metadata file or on synthetic abstracts:
+        python3 benchmark.py -n 20000 --tokenizers
+        python3 benchmark.py --tokenizers -f metadata.csv
+    query throughput with the query cache, the cached results must be the same as the results of Query:
+        python3 benchmark.py -n 20000 --cache
+    tokenizing time by size of the stem cache:
+        python3 benchmark.py -n 20000 --stemming
+    every stage, with the results written to a JSON file to compare with other versions:
+        python3 benchmark.py -n 5000 20000 --suite --repeat 3 --json results.json
+    every stage, on a corpus with a flatter vocabulary:
+        python3 benchmark.py -n 20000 --suite --vocabulary 50000 --skew 0.8 --json results.json
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", dest="sizes", required=False, help="Corpus sizes", type=int, nargs="+", default=[5000, 10000, 20000, 40000])
+    parser.add_argument("-t", dest="improved_tokenizer", required=False, help="Use improved tokenizer", default=False, action='store_true')
+    parser.add_argument("--workers", dest="workers", required=False, help="Number of processes used to index", type=int, default=1)
+    parser.add_argument("--memory", dest="memory", required=False, help="Memory per posting of the index", default=False, action='store_true')
+    parser.add_argument("--size", dest="size", required=False, help="Size and speed of the index formats", default=False, action='store_true')
+    parser.add_argument("--queries", dest="queries", required=False, help="Query throughput of the engines", default=False, action='store_true')
+    parser.add_argument("--cache", dest="cache", required=False, help="Query throughput with the query cache", default=False, action='store_true')
+    parser.add_argument("--tokenizers", dest="tokenizers", required=False, help="Tokenizing time of the tokenizers, counting the tokens in one pass", default=False, action='store_true')
+    parser.add_argument("-f", dest="data_file_path", required=False, help="Data file of the tokenizers benchmark, synthetic abstracts if not given", default=None)
+    parser.add_argument("--stemming", dest="stemming", required=False, help="Tokenizing time by size of the stem cache", default=False, action='store_true')
+    parser.add_argument("--suite", dest="suite", required=False, help="Benchmark every stage", default=False, action='store_true')
+    parser.add_argument("--vocabulary", dest="vocabulary_size", required=False, help="Vocabulary size of the corpus of the suite", type=int, default=20000)
+    parser.add_argument("--skew", dest="skew", required=False, help="Zipf exponent of the vocabulary of the corpus of the suite", type=float, default=1)
+    parser.add_argument("--seed", dest="seed", required=False, help="Seed of the corpus and queries of the suite", type=int, default=0)
+    parser.add_argument("--repeat", dest="repeat", required=False, help="Number of runs of every stage of the suite, the median is reported", type=int, default=1)
+    parser.add_argument("--json", dest="json_file", required=False, help="Write the results of the suite to a JSON file", default=None)
+    args = parser.parse_args()
+
+    if (args.json_file or args.repeat != 1 or args.vocabulary_size != 20000 or args.skew != 1 or args.seed != 0) and not args.suite:
+        parser.error("--vocabulary, --skew, --seed, --repeat and --json requires the flag --suite")
+    elif args.vocabulary_size < 1 or args.repeat < 1:
+        parser.error("--vocabulary and --repeat must be greater than 0")
+    elif args.skew < 0:
+        parser.error("--skew must not be negative")
+    elif args.data_file_path and not args.tokenizers:
+        parser.error("-f requires the flag --tokenizers")
+
+    if args.suite:
+        report = suite(args.sizes, args.vocabulary_size, args.skew, args.seed, args.improved_tokenizer, args.workers, repeat=args.repeat)
+        if args.json_file:
+            with open(args.json_file, "w") as writer:
+                json.dump(report, writer, indent=2)
+    elif args.memory:
+        posting_memory(args.sizes[-1], args.improved_tokenizer)
+    elif args.size:
+        index_size(args.sizes[-1], args.improved_tokenizer)
+    elif args.queries:
+        query_throughput(args.sizes[-1], args.improved_tokenizer)
+    elif args.cache:
+        caching(args.sizes[-1], args.improved_tokenizer)
+    elif args.tokenizers:
+        tokenizing(args.sizes[-1], args.data_file_path)
+    elif args.stemming:
+        stemming(args.sizes[-1], [0, 1000, 10000, 100000])
+    else:
+        indexing(args.sizes, args.improved_tokenizer, args.workers)
@@ -0,0 +1,146 @@
+import argparse
+import asyncio
+import json
+import logging
+import random
+import time
+
+from urllib.parse import quote
+
+from Timers import Histogram, PERCENTILES
+
+
+logging.basicConfig(
+    level=logging.INFO, format="%(message)s"
+)
+
+logger = logging.getLogger("loadgen")
+
+
+def read_queries(file_path:str) -> list:
+    """
+    Read the queries to send, one query per line.
+    """
+    with open(file_path, "r") as reader:
+        return [line.strip() for line in reader if line.strip()]
+
+
+async def connect(address:str) -> tuple:
+    """
+    Open a connection to host:port, or to a Unix socket path.
+    """
+    if ":" in address:
+        host, port = address.rsplit(":", 1)
+        return await asyncio.open_connection(host or "localhost", int(port))
+    return await asyncio.open_unix_connection(address)
+
+
+async def request(reader:asyncio.StreamReader, writer:asyncio.StreamWriter, query:str, top_k:int) -> tuple:
+    """
+    Send a search on a keep-alive connection and read the response.
+
+    Returns
+    -------
+    tuple
+        The status code and the body.
+    """
+    writer.write(("GET /search?q=%s&k=%d HTTP/1.1\r\nHost: loadgen\r\n\r\n" % (quote(query), top_k)).encode())
+    await writer.drain()
+    head = await reader.readuntil(b"\r\n\r\n")
+    lines = head.decode("latin-1").split("\r\n")
+    status = int(lines[0].split(" ")[1])
+    length = 0
+    for line in lines[1:]:
+        name, _, value = line.partition(":")
+        if name.lower() == "content-length":
+            length = int(value)
+    return status, await reader.readexactly(length)
+
+
+async def client(address:str, queries:list, top_k:int, deadline:float, requests:list,
+                 histogram:Histogram, errors:list, rand:random.Random) -> None:
+    """
+    Send searches one after the other until the deadline, or until there are no requests left.
+    """
+    reader, writer = await connect(address)
+    try:
+        while time.perf_counter() < deadline and requests[0] > 0:
+            requests[0] -= 1
+            start_time = time.perf_counter()
+            status, _ = await request(reader, writer, rand.choice(queries), top_k)
+            if status == 200:
+                histogram.record(time.perf_counter() - start_time)
+            else:
+                errors[0] += 1
+    finally:
+        writer.close()
+
+
+async def run(address:str, queries:list, concurrency:int, duration:float, total_requests:int, top_k:int, seed:int) -> dict:
+    """
+    Load the server with concurrent clients, every client waits for its response before the next search.
+
+    Returns
+    -------
+    dict
+        The number of searches, the errors, the throughput and the latency percentiles, in milliseconds.
+    """
+    histogram = Histogram()
+    errors = [0]
+    requests = [total_requests or float("inf")]
+    rand = random.Random(seed)
+
+    start_time = time.perf_counter()
+    await asyncio.gather(*[client(address, queries, top_k, start_time + duration, requests, histogram, errors,
+                                  random.Random(rand.getrandbits(32)))
+                           for _ in range(concurrency)])
+    elapsed = time.perf_counter() - start_time
+
+    report = {"requests": histogram.count, "errors": errors[0], "concurrency": concurrency,
+              "seconds": elapsed, "qps": histogram.count / elapsed}
+    summary = histogram.summary()
+    for name in ["mean"] + ["p%d" % percent for percent in PERCENTILES] + ["max"]:
+        report["%s_ms" % name] = summary[name] * 1000
+    return report
+
+
+if __name__ == "__main__":
+    """
+    EXECUTION
+    ---------
+    load a server with 32 clients for 30 seconds:
+        python3 loadgen.py --url localhost:8080 -q queries.txt --concurrency 32 --duration 30
+    send 10000 searches on a Unix socket, one client at a time, and keep the report:
+        python3 loadgen.py --url /tmp/ri.sock -q queries.txt --concurrency 1 --requests 10000 --json load.json
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", dest="address", required=True, help="Server host:port, or Unix socket path")
+    parser.add_argument("-q", dest="query_file_path", required=True, help="Queries file path, one query per line")
+    parser.add_argument("--concurrency", dest="concurrency", required=False, help="Number of clients searching at once", type=int, default=8)
+    parser.add_argument("--duration", dest="duration", required=False, help="Seconds to load the server", type=float, default=10)
+    parser.add_argument("--requests", dest="requests", required=False, help="Stop after this number of searches", type=int, default=None)
+    parser.add_argument("-k", dest="top_k", required=False, help="Number of documents of every search", type=int, default=50)
+    parser.add_argument("--seed", dest="seed", required=False, help="Seed of the order of the queries", type=int, default=0)
+    parser.add_argument("--json", dest="json_file", required=False, help="Write the report as JSON to file", default=None)
+    args = parser.parse_args()
+
+    if args.concurrency < 1 or args.top_k < 1:
+        parser.error("--concurrency and -k must be greater than 0")
+    elif args.duration <= 0:
+        parser.error("--duration must be greater than 0")
+    elif args.requests is not None and args.requests < 1:
+        parser.error("--requests must be greater than 0")
+
+    queries = read_queries(args.query_file_path)
+    if not queries:
+        parser.error("the queries file has no queries")
+
+    report = asyncio.run(run(args.address, queries, args.concurrency, args.duration, args.requests, args.top_k, args.seed))
+    logger.info("Requests: %d, errors: %d, concurrency: %d, time: %f seconds" %
+                (report["requests"], report["errors"], report["concurrency"], report["seconds"]))
+    logger.info("Throughput: %f queries/second" % report["qps"])
+    logger.info("Latency (ms) mean: %f p50: %f p90: %f p99: %f max: %f" %
+                (report["mean_ms"], report["p50_ms"], report["p90_ms"], report["p99_ms"], report["max_ms"]))
+    if args.json_file:
+        with open(args.json_file, "w") as writer:
+            json.dump(report, writer, indent=2)
@@ -2,18 +2,38 @@
 # Pedro Oliveira 89156 MEI
 
 import argparse
+import asyncio
+import importlib.util
+import itertools
 import logging
 import time
 import sys
 import psutil
 import os
-from math import log2
+from concurrent.futures import ProcessPoolExecutor
+from statistics import median
+
+try:
+    import resource
+except ImportError:
+    resource = None
 
 from Tokenizer import Tokenizer, SimpleTokenizer, ImprovedTokenizer
-from Indexer import Indexer, IndexerBM25
+from Indexer import Indexer, IndexerBM25, COMPRESSIONS
+from IncrementalIndexer import IncrementalIndexer, IncrementalIndexerBM25
+from IndexReader import IndexReader
 from CorpusReader import CorpusReader
 from QueryReader import QueryReader
 from Query import Query
+from NumpyQuery import NumpyQuery
+from ConjunctiveQuery import ConjunctiveQuery
+from ImpactIndex import ImpactIndex
+from ImpactQuery import ImpactQuery
+from QueryCache import QueryCache
+from QueryServer import QueryServer
+from ShardedIndex import ShardedIndex, ShardedQuery
+from Evaluation import evaluate
+from Timers import Histogram, timers
 
 
 logging.basicConfig(
@@ -22,6 +42,35 @@ logging.basicConfig(
 
 logger = logging.getLogger("main")
 
+# number of retrieved documents the metrics are calculated for
+CUTOFFS = [10, 20, 50]
+
+_sweep_state = None
+
+
+def _init_sweep_worker(query_reader:QueryReader, indexer:IncrementalIndexerBM25, tokenizer:Tokenizer,
+                       pruning:bool, query_class:type, batch:bool) -> None:
+    """Keep the index and the queries on the worker process, so they are only sent once."""
+    global _sweep_state
+    _sweep_state = (query_reader, indexer, tokenizer, pruning, query_class, batch)
+    # a forked worker starts with a copy of the histograms of the parent, only its own are sent back
+    timers.reset()
+
+
+def _sweep_point(k1:float, b:float) -> list:
+    """Evaluate a grid point, on the index and queries kept by _init_sweep_worker()."""
+    query_reader, indexer, tokenizer, pruning, query_class, batch = _sweep_state
+    indexer.set_parameters(k1, b)
+    return mean_metrics(metrics(query_reader, indexer, tokenizer, True, pruning, query_class, batch))
+
+
+def _sweep_worker(k1:float, b:float) -> tuple:
+    """Evaluate a grid point on a worker process, the stages timed on the worker are sent back."""
+    means = _sweep_point(k1, b)
+    histograms = timers.histograms
+    timers.reset()
+    return means, histograms
+
 
 def questions(indexer:Indexer) -> None:
     """
@@ -46,84 +95,194 @@ def questions(indexer:Indexer) -> None:
     logger.info('List the ten terms with highest document frequency:\n%s' % str(data))
 
 
-def metrics(query_reader:QueryReader, indexer:Indexer, tokenizer:Tokenizer, use_bm:bool) -> dict:
+def metrics(query_reader:QueryReader, indexer:Indexer, tokenizer:Tokenizer, use_bm:bool, pruning:bool = False,
+            query_class:type = Query, batch:bool = False, cache:QueryCache = None, eval_workers:int = 1,
+            exhaustive:bool = False) -> dict:
     """
     Calculation of metrics.
+    With batch all the queries are searched at once, and the latency of every query is the mean latency.
+    With a cache the queries are searched through it, and the cache hit and saved latency of every query are kept.
+    With exhaustive the queries are searched again by Query over all the postings, and the overlap of both results
+    and the latency of the exhaustive search are kept, to measure what an early terminating search costs and saves.
+    The rankings are evaluated after all the queries are searched, in eval_workers processes.
     """
-    results = {}
+    if batch:
+        start_time = time.perf_counter()
+        batch_docs = query_class.lookup_batch(query_reader.queries, indexer, tokenizer, use_bm, max(CUTOFFS), pruning)
+        batch_latency = (time.perf_counter() - start_time) / len(batch_docs)
+
+    searches = {}
+    rankings = {}
     for query_number, query in query_reader.queries.items():
-        results[query_number] = {}
-        
-        start_time = time.time()
+        searches[query_number] = {}
 
-        query_search = Query(query, indexer, tokenizer)
+        if batch:
+            docs = batch_docs[query_number]
+            searches[query_number]['latency'] = batch_latency
+        elif cache is not None:
+            start_time = time.perf_counter()
+            hits, saved_latency = cache.hits, cache.saved_latency
 
-        if use_bm:
-            docs = query_search.lookup_bm25()
+            docs = cache.lookup(query, use_bm, max(CUTOFFS), pruning)
+
+            searches[query_number]['latency'] = time.perf_counter() - start_time
+            searches[query_number]['cache_hit'] = cache.hits - hits
+            searches[query_number]['saved_latency'] = cache.saved_latency - saved_latency
         else:
-            docs = query_search.lookup_idf()
+            start_time = time.perf_counter()
+
+            query_search = query_class(query, indexer, tokenizer)
+
+            # only the documents of the largest cutoff are ranked
+            if use_bm:
+                docs = query_search.lookup_bm25(max(CUTOFFS), pruning)
+            else:
+                docs = query_search.lookup_idf(max(CUTOFFS), pruning)
+
+            searches[query_number]['latency'] = time.perf_counter() - start_time
+
+        rankings[query_number] = [doc_id for doc_id, weigth in docs]
+
+    if exhaustive:
+        # the stages of the reference searches are not counted with the stages of the searches measured
+        with timers.isolated():
+            for query_number, query in query_reader.queries.items():
+                start_time = time.perf_counter()
+                query_search = Query(query, indexer, tokenizer)
+                if use_bm:
+                    reference = query_search.lookup_bm25(max(CUTOFFS))
+                else:
+                    reference = query_search.lookup_idf(max(CUTOFFS))
+                searches[query_number]['exhaustive_latency'] = time.perf_counter() - start_time
+
+                reference_docs = {doc_id for doc_id, _ in reference}
+                searches[query_number]['overlap'] = \
+                    len(reference_docs.intersection(rankings[query_number])) / len(reference_docs) if reference_docs else 1
+
+    results = evaluate(query_reader, rankings, CUTOFFS, eval_workers)
+    for query_number, search in searches.items():
+        results[query_number].update(search)
+        timers.record("query.latency", search['latency'])
+    return results
 
-        results[query_number]['latency'] = time.time() - start_time
 
-        docs_relevance = query_reader.queries_relevance[query_number][0].union(
-                            query_reader.queries_relevance[query_number][1]).union(
-                                query_reader.queries_relevance[query_number][2]
-                            )
-        docs_retrieved_total = [doc_id for doc_id, weigth in docs]
+def mean_metrics(results:dict) -> list:
+    """
+    Mean of the metrics of all the queries, grouped by metric and then by cutoff,
+    in the order they are printed by print_metrics.
+    """
+    return [sum(x[cutoff][metric] for x in results.values()) / len(results)
+            for metric in range(5) for cutoff in CUTOFFS]
 
-        for num_docs_retrieved in [10, 20, 50]:
-            docs_retrieved = set(list(docs_retrieved_total)[:num_docs_retrieved])
 
-            docs_relevance_retrieved = docs_retrieved & docs_relevance
+def postings_size(indexer:Indexer) -> tuple:
+    """
+    Number of postings of the index, and their size in bytes.
+    """
+    postings = sum(len(token_postings) for token_postings in indexer.index.values())
+    size = sum(token_postings.docs.itemsize * len(token_postings.docs) + token_postings.weights.itemsize * len(token_postings.weights)
+               for token_postings in indexer.index.values())
+    return postings, size
 
-            num_docs_relevance = len(docs_relevance)
 
-            num_docs_relevance_retrieved = len(docs_relevance_retrieved)
+def print_pruning(unpruned:dict, pruned:dict, unpruned_histograms:dict) -> None:
+    """
+    Print the mean metrics and the latency of the queries on the index before and after pruning it.
+    The stages of the queries before pruning are timed on their own histograms, the stages after it are on the timers.
+    """
+    logger.info('%25s %12s %12s %12s' % ('Metric', 'Unpruned', 'Pruned', 'Change'))
+    names = ['%s@%d' % (name, cutoff) for name in ('Precision', 'Recall', 'F-measure', 'Average Precision', 'NDCG')
+             for cutoff in CUTOFFS]
+    for name, before, after in zip(names, mean_metrics(unpruned), mean_metrics(pruned)):
+        logger.info('%25s %12f %12f %+12f' % (name, before, after, after - before))
+
+    for name, statistic in (('Latency p50', median), ('Latency mean', lambda latencies: sum(latencies) / len(latencies))):
+        before = statistic([x['latency'] for x in unpruned.values()])
+        after = statistic([x['latency'] for x in pruned.values()])
+        logger.info('%25s %12f %12f %+11.1f%%' % (name, before, after, (after - before) / before * 100 if before else 0))
+
+    for name, histogram in unpruned_histograms.items():
+        if name.startswith('query.') and name in timers.histograms:
+            before, after = histogram.percentile(50), timers.histograms[name].percentile(50)
+            logger.info('%25s %12f %12f %+11.1f%%' % (name + ' p50', before, after,
+                (after - before) / before * 100 if before else 0))
+
+
+def sweep(query_reader:QueryReader, indexer:IncrementalIndexerBM25, tokenizer:Tokenizer, grid:list, workers:int = 1,
+          pruning:bool = False, query_class:type = Query, batch:bool = False) -> dict:
+    """
+    Evaluate every (k1, b) of the grid on the same index, the BM25 weights are calculated at query time.
+    The grid points are evaluated in a pool of processes when there is more than one worker.
+    """
+    global _sweep_state
+    if workers <= 1:
+        _sweep_state = (query_reader, indexer, tokenizer, pruning, query_class, batch)
+        return {(k1, b): _sweep_point(k1, b) for k1, b in grid}
 
-            precision = 0
-            recall = 0
-            f_measure = 0
-            average_precision = 0
-            ndcg = 0
+    results = {}
 
-            if num_docs_relevance_retrieved != 0:
-                if num_docs_retrieved != 0:
-                    precision = num_docs_relevance_retrieved / num_docs_retrieved
+    with ProcessPoolExecutor(min(workers, len(grid)), initializer=_init_sweep_worker,
+                             initargs=(query_reader, indexer, tokenizer, pruning, query_class, batch)) as executor:
+        for grid_point, (means, histograms) in zip(grid, executor.map(_sweep_worker, *zip(*grid))):
+            results[grid_point] = means
+            timers.merge(histograms)
+    return results
 
-                if num_docs_relevance != 0:
-                    recall = num_docs_relevance_retrieved / num_docs_relevance
 
-                if (precision + recall) != 0:
-                    f_measure = (2 * precision * recall) / (precision + recall)
+def print_sweep(results:dict) -> None:
+    """
+    Print the mean metrics of every grid point, and the best one by NDCG@10.
+    """
+    logger.info('       k1        b %29s %29s %29s %29s %29s' % ('Precision', 'Recall', 'F-measure', 'Average Precision', 'NDCG'))
+    logger.info('                   %9s %9s %9s %9s %9s %9s %9s %9s %9s %9s %9s %9s %9s %9s %9s' % \
+        ('@10', '@20', '@50', '@10', '@20', '@50', '@10', '@20', '@50', '@10', '@20', '@50', '@10', '@20', '@50'))
 
-                docs_precision = 0
-                dcg = 0
-                for i in range(len(docs_retrieved)):
-                    k = i + 1
-                    docs_retrieved_ap = set(list(docs_retrieved)[:k])
-                    docs_relevance_retrieved_ap = docs_retrieved_ap & docs_relevance
-                    docs_precision += len(docs_relevance_retrieved_ap) / k
+    for (k1, b), means in results.items():
+        logger.info('%9f %8f' % (k1, b) + ' %9f' * len(means) % tuple(means))
 
-                    if i == 0: 
-                        dcg = query_reader.get_rank_value(query_number, docs_retrieved_total[i])
-                        continue
-                    dcg += query_reader.get_rank_value(query_number, docs_retrieved_total[i])/log2(k)
+    # NDCG@10 is the 13th mean
+    k1, b = max(results, key=lambda grid_point: results[grid_point][12])
+    logger.info('Best grid point by NDCG@10: k1=%s b=%s' % (k1, b))
 
-                average_precision = docs_precision / num_docs_relevance
 
-                perfect_rank = query_reader.get_perfect_dcg(query_number, num_docs_retrieved)
-                if perfect_rank != 0: 
-                    ndcg = dcg/query_reader.get_perfect_dcg(query_number, num_docs_retrieved)  
-            
-            results[query_number][num_docs_retrieved] = (precision, recall, f_measure, average_precision, ndcg)
-    return results
+def print_timers() -> None:
+    """
+    Print the percentiles of the time of every stage of indexing and searching.
+    """
+    logger.info('%16s %9s %12s %12s %12s %12s' % ('Stage', 'Count', 'Total (s)', 'p50 (s)', 'p90 (s)', 'p99 (s)'))
+    for name, histogram in timers.histograms.items():
+        logger.info('%16s %9d %12f %12f %12f %12f' % (name, histogram.count, histogram.total,
+            histogram.percentile(50), histogram.percentile(90), histogram.percentile(99)))
+
+
+def write_timers(timings_file:str, timings_format:str) -> None:
+    """
+    Write the histograms of the stages, as JSON or in the Prometheus text format.
+    """
+    with open(timings_file, "w") as writer:
+        writer.write(timers.to_json() if timings_format == "json" else timers.to_prometheus())
+
+
+def create_cache(indexer:Indexer, tokenizer:Tokenizer, query_class:type, cache_size:int, cache_memory:int) -> QueryCache:
+    """
+    Create the query result cache, None if cache_size is 0.
+    """
+    if not cache_size:
+        return None
+    return QueryCache(indexer, tokenizer, cache_size, cache_memory * 1024 * 1024 if cache_memory else None,
+                      query_class=query_class)
 
 
 def print_metrics(results:dict) -> None:
     """
     Print the metrics.
     """
-    logger.info('   # %29s %29s %29s %29s %29s  Latency' % ('Precision', 'Recall', 'F-measure', 'Average Precision', 'NDCG'))
+    # the queries were searched through a cache
+    cached = all('cache_hit' in x for x in results.values())
+    compared = all('overlap' in x for x in results.values())
+
+    logger.info('   # %29s %29s %29s %29s %29s  Latency' % ('Precision', 'Recall', 'F-measure', 'Average Precision', 'NDCG') +
+                ('  Hit     Saved' if cached else ''))
     logger.info('   %9s %9s %9s %9s %9s %9s %9s %9s %9s %9s %9s %9s %9s %9s %9s' % \
         ('@10', '@20', '@50', '@10', '@20', '@50', '@10', '@20', '@50', '@10', '@20', '@50', '@10', '@20', '@50'))
 
@@ -143,6 +302,8 @@ def print_metrics(results:dict) -> None:
     average_precision3_total = 0
     ndcg3_total = 0
     latency_total = []
+    hit_total = 0
+    saved_latency_total = 0
 
     for query_number, x in results.items():
         precision1, recall1, f_measure1, average_precision1, ndcg1 = x[10]
@@ -174,18 +335,47 @@ def print_metrics(results:dict) -> None:
             f_measure1, f_measure2, f_measure3,
             average_precision1, average_precision2, average_precision3,
             ndcg1, ndcg2, ndcg3,
-            latency))
+            latency) + (' %4d %9f' % (x['cache_hit'], x['saved_latency']) if cached else ''))
+        if cached:
+            hit_total += x['cache_hit']
+            saved_latency_total += x['saved_latency']
 
-    latency_total = sorted(latency_total)
+    num_queries = len(results)
+    latency_histogram = Histogram()
+    for latency in latency_total:
+        latency_histogram.record(latency)
 
+    # the latency column of the mean row is the median latency
     logger.info('mean %9f %9f %9f %9f %9f %9f %9f %9f %9f %9f %9f %9f %9f %9f %9f %9f' % \
-            (precision1_total / 50, precision2_total / 50, precision3_total / 50,
-            recall1_total / 50, recall2_total / 50, recall3_total / 50,
-            f_measure1_total / 50, f_measure2_total / 50, f_measure3_total / 50,
-            average_precision1_total / 50, average_precision2_total / 50, average_precision3_total / 50,
-            ndcg1_total / 50, ndcg2_total / 50, ndcg3_total / 50,
-            latency_total[23] + latency_total[24]))
-    logger.info('Query throughput: %9f', 50 / sum(latency_total))
+            (precision1_total / num_queries, precision2_total / num_queries, precision3_total / num_queries,
+            recall1_total / num_queries, recall2_total / num_queries, recall3_total / num_queries,
+            f_measure1_total / num_queries, f_measure2_total / num_queries, f_measure3_total / num_queries,
+            average_precision1_total / num_queries, average_precision2_total / num_queries, average_precision3_total / num_queries,
+            ndcg1_total / num_queries, ndcg2_total / num_queries, ndcg3_total / num_queries,
+            median(latency_total)) +
+            (' %4.2f %9f' % (hit_total / len(results), saved_latency_total / len(results)) if cached else ''))
+    logger.info('Latency p50: %9f p90: %9f p99: %9f' % \
+        (latency_histogram.percentile(50), latency_histogram.percentile(90), latency_histogram.percentile(99)))
+    logger.info('Query throughput: %9f', num_queries / sum(latency_total))
+    if cached:
+        logger.info('Cache hit ratio: %f, saved latency: %s seconds' % (hit_total / len(results), saved_latency_total))
+    if compared:
+        logger.info('Overlap with the exhaustive top %d: %f, median latency: %f seconds, exhaustive: %f seconds' % \
+            (max(CUTOFFS), sum(x['overlap'] for x in results.values()) / num_queries,
+            median(latency_total), median(x['exhaustive_latency'] for x in results.values())))
+
+
+def serve(indexer:Indexer, tokenizer:Tokenizer, use_bm:bool, pruning:bool, query_class:type,
+          address:str, workers:int, batch_wait:float) -> None:
+    """
+    Serve the queries over HTTP until interrupted, the index is kept in memory.
+    """
+    server = QueryServer(indexer, tokenizer, use_bm, workers, pruning=pruning, query_class=query_class,
+                         batch_wait=batch_wait / 1000)
+    try:
+        asyncio.run(server.serve(address))
+    except KeyboardInterrupt:
+        logger.info("Server stopped")
 
 
 def main(
@@ -196,43 +386,196 @@ def main(
     bm_k1:float,
     bm_b:float,
     query_file_path:str,
-    query_relevance_file_path:str
+    query_relevance_file_path:str,
+    workers:int,
+    memory_budget:int,
+    index_path_to_write:str,
+    index_path:str,
+    weight_bits:int,
+    pruning:bool,
+    engine:str,
+    batch:bool,
+    stem_cache_size:int,
+    update_file_paths:list,
+    k1_grid:list,
+    b_grid:list,
+    cache_size:int,
+    cache_memory:int,
+    eval_workers:int,
+    serve_address:str,
+    serve_workers:int,
+    batch_wait:float,
+    shards:int,
+    mode:str,
+    impact:bool,
+    champions:int,
+    compression:str,
+    prune_top:int,
+    prune_weight:float,
+    prune_relative:float
     ) -> None:
-    # read data file
-    corpus = CorpusReader(data_file_path)
+    # create query engine
+    if impact:
+        query_class = ImpactQuery
+    elif mode == "and":
+        query_class = ConjunctiveQuery
+    elif engine == "numpy":
+        query_class = NumpyQuery
+    else:
+        query_class = Query
 
     # create tokenizer
     if not improved_tokenizer:
         tokenizer = SimpleTokenizer()
     else:
-        tokenizer = ImprovedTokenizer()
+        tokenizer = ImprovedTokenizer(stem_cache_size)
+
+    # load a prebuilt index, the tokenizer and the method to rank must be the ones used to build it
+    if index_path:
+        start_time = time.perf_counter()
+        indexer = IndexReader(index_path)
+        logger.info("Loading Time: %s seconds" % (time.perf_counter() - start_time))
+
+        # the postings of a token are sorted by weight when it is first searched
+        if impact:
+            indexer = ImpactIndex(indexer, champions)
+
+        if query_file_path and query_relevance_file_path:
+            query_reader = QueryReader(query_file_path, query_relevance_file_path)
+            print_metrics(metrics(query_reader, indexer, tokenizer, use_bm, pruning, query_class, batch,
+                                  create_cache(indexer, tokenizer, query_class, cache_size, cache_memory), eval_workers, impact))
+        if serve_address:
+            serve(indexer, tokenizer, use_bm, pruning, query_class, serve_address, serve_workers, batch_wait)
+        return
+
+    # index the data file and then the updates, a document of an update replaces the one already indexed
+    # the weights are calculated at query time, so the sweep evaluates every grid point on this same index
+    if update_file_paths or k1_grid or b_grid:
+        if use_bm:
+            indexer = IncrementalIndexerBM25(tokenizer, bm_k1, bm_b)
+        else:
+            indexer = IncrementalIndexer(tokenizer)
+
+        for file_path in [data_file_path] + (update_file_paths or []):
+            start_time = time.perf_counter()
+            for all_files in CorpusReader(file_path).batches(1000):
+                indexer.add_documents(all_files)
+            indexer.wait_merges()
+            logger.info("Indexing Time of %s: %s seconds" % (file_path, time.perf_counter() - start_time))
+        logger.info("Indexed documents: %s" % indexer.number_of_docs)
+        if impact:
+            indexer = ImpactIndex(indexer, champions)
+
+        if k1_grid or b_grid:
+            query_reader = QueryReader(query_file_path, query_relevance_file_path)
+            grid = list(itertools.product(k1_grid or [bm_k1], b_grid or [bm_b]))
+            start_time = time.perf_counter()
+            print_sweep(sweep(query_reader, indexer, tokenizer, grid, workers, pruning, query_class, batch))
+            logger.info("Sweep Time: %s seconds" % (time.perf_counter() - start_time))
+        elif query_file_path and query_relevance_file_path:
+            query_reader = QueryReader(query_file_path, query_relevance_file_path)
+            print_metrics(metrics(query_reader, indexer, tokenizer, use_bm, pruning, query_class, batch,
+                                  create_cache(indexer, tokenizer, query_class, cache_size, cache_memory), eval_workers, impact))
+        if serve_address:
+            serve(indexer, tokenizer, use_bm, pruning, query_class, serve_address, serve_workers, batch_wait)
+        return
+
+    # split the collection in shards, every shard is indexed and searched by its own process
+    if shards > 1:
+        indexer = ShardedIndex(data_file_path, tokenizer, shards, use_bm, bm_k1, bm_b, workers, query_class)
+        try:
+            start_time = time.perf_counter()
+            indexer.indexing()
+            logger.info("Indexing Time: %s seconds" % (time.perf_counter() - start_time))
+            logger.info("Documents by shard: %s" % indexer.shard_sizes)
+
+            if query_file_path and query_relevance_file_path:
+                query_reader = QueryReader(query_file_path, query_relevance_file_path)
+                print_metrics(metrics(query_reader, indexer, tokenizer, use_bm, pruning, ShardedQuery, batch,
+                                      eval_workers=eval_workers))
+        finally:
+            indexer.close()
+        return
+
+    # read data file
+    corpus = CorpusReader(data_file_path)
 
     # create indexer
     if use_bm:
-        indexer = IndexerBM25(corpus, tokenizer, bm_k1, bm_b)
+        indexer = IndexerBM25(corpus, tokenizer, bm_k1, bm_b, workers)
     else:
-        indexer = Indexer(corpus, tokenizer)   
+        indexer = Indexer(corpus, tokenizer, workers)
+
+    # index in blocks straight to the index file
+    if memory_budget:
+        start_time = time.perf_counter()
+        indexer.block_indexing(file_to_write, memory_budget * 1024 * 1024)
+        logger.info("Indexing Time: %s seconds" % (time.perf_counter() - start_time))
+        process = psutil.Process(os.getpid())
+        logger.info("Collection memory size: %s bytes" % process.memory_info().rss)
+        # the peak memory of the blocks should not grow with the corpus, ru_maxrss is in kilobytes on Linux
+        if resource is not None:
+            logger.info("Peak memory size: %s bytes" % (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024))
+        return
 
     # start indexing
-    start_time = time.time()
+    start_time = time.perf_counter()
     indexer.indexing()
-    logger.info("Indexing Time: %s seconds" % (time.time() - start_time))   
+    logger.info("Indexing Time: %s seconds" % (time.perf_counter() - start_time))   
+    if improved_tokenizer:
+        logger.info("Stemmer cache: %s hits, %s misses" % (tokenizer.cache_hits, tokenizer.cache_misses))
 
     # assignment questions
     # questions(indexer)
 
+    # drop the postings of low weight, the queries are evaluated before and after to measure the change
+    unpruned = None
+    if prune_top is not None or prune_weight is not None or prune_relative is not None:
+        if query_file_path and query_relevance_file_path:
+            # the stages of the queries before pruning are kept apart from the stages of the queries after it
+            with timers.isolated() as unpruned_histograms:
+                unpruned = metrics(QueryReader(query_file_path, query_relevance_file_path), indexer, tokenizer, use_bm,
+                                   pruning, query_class, batch, eval_workers=eval_workers)
+        postings, size = postings_size(indexer)
+        start_time = time.perf_counter()
+        indexer.prune(prune_top, prune_weight, prune_relative)
+        logger.info("Pruning Time: %s seconds" % (time.perf_counter() - start_time))
+        pruned_postings, pruned_size = postings_size(indexer)
+        logger.info("Postings: %d -> %d (-%.1f%%), size: %d -> %d bytes" % (postings, pruned_postings,
+            (postings - pruned_postings) / postings * 100 if postings else 0, size, pruned_size))
+
     # write index
     if file_to_write: 
-        start_time = time.time()
-        indexer.write(file_to_write)
-        logger.info("Writing Time: %s seconds" % (time.time() - start_time))   
+        start_time = time.perf_counter()
+        indexer.write(file_to_write, compression)
+        logger.info("Writing Time: %s seconds" % (time.perf_counter() - start_time))   
+
+    # write binary index
+    if index_path_to_write:
+        start_time = time.perf_counter()
+        indexer.write_binary(index_path_to_write, weight_bits)
+        logger.info("Writing Time: %s seconds" % (time.perf_counter() - start_time))
+
+    # sort the postings of every token by weight
+    if impact:
+        start_time = time.perf_counter()
+        indexer = ImpactIndex(indexer, champions)
+        indexer.build()
+        logger.info("Impact Ordering Time: %s seconds" % (time.perf_counter() - start_time))
 
     if query_file_path and query_relevance_file_path:
         # read queries
         query_reader = QueryReader(query_file_path, query_relevance_file_path)
 
         # metrics
-        print_metrics(metrics(query_reader, indexer, tokenizer, use_bm))
+        results = metrics(query_reader, indexer, tokenizer, use_bm, pruning, query_class, batch,
+                          create_cache(indexer, tokenizer, query_class, cache_size, cache_memory), eval_workers, impact)
+        print_metrics(results)
+        if unpruned is not None:
+            print_pruning(unpruned, results, unpruned_histograms)
+
+    if serve_address:
+        serve(indexer, tokenizer, use_bm, pruning, query_class, serve_address, serve_workers, batch_wait)
 
 
 if __name__ == "__main__":
@@ -243,30 +586,227 @@ if __name__ == "__main__":
         python3 main.py -f data.csv -q queries.txt -qr queries.relevance.filtered.txt
     improved tokenizer:
         python3 main.py -f data.csv -t -q queries.txt -qr queries.relevance.filtered.txt
+    parallel indexing:
+        python3 main.py -f data.csv -t --workers 8 -q queries.txt -qr queries.relevance.filtered.txt
+    indexing with a memory budget of 512 MB:
+        python3 main.py -f data.csv -t -w index.txt --memory 512
+    keep the 1000 postings of highest weight of every term, and compare the queries before and after:
+        python3 main.py -f data.csv -b --prune-top 1000 -q queries.txt -qr queries.relevance.filtered.txt
+    drop the postings with less than a tenth of the max weight of their term:
+        python3 main.py -f data.csv -b --prune-relative 0.1 -w index.txt
+    write the index file with 8 processes, compressed with gzip:
+        python3 main.py -f data.csv -t --workers 8 -w index.txt.gz --compress gzip
+    build a binary index and query it later:
+        python3 main.py -f data.csv -t -wb index
+        python3 main.py -i index -t -q queries.txt -qr queries.relevance.filtered.txt
+    build a compressed binary index, with 8 bits weights:
+        python3 main.py -f data.csv -t -wb index --quantize 8
+    queries with MaxScore dynamic pruning:
+        python3 main.py -f data.csv -b --pruning -q queries.txt -qr queries.relevance.filtered.txt
+    queries scored with NumPy:
+        python3 main.py -f data.csv -b --engine numpy -q queries.txt -qr queries.relevance.filtered.txt
+    only the documents with all the query terms:
+        python3 main.py -f data.csv -b --mode and -q queries.txt -qr queries.relevance.filtered.txt
+    search the postings of highest weight first, and stop once the top 50 can not change:
+        python3 main.py -f data.csv -b --impact -q queries.txt -qr queries.relevance.filtered.txt
+    only search the 500 postings of highest weight of every term (champion lists):
+        python3 main.py -f data.csv -b --impact --champions 500 -q queries.txt -qr queries.relevance.filtered.txt
+    all queries searched at once:
+        python3 main.py -f data.csv -b --batch -q queries.txt -qr queries.relevance.filtered.txt
+    improved tokenizer with a cache of 500000 stems:
+        python3 main.py -f data.csv -t --stem-cache 500000 -q queries.txt -qr queries.relevance.filtered.txt
+    add the documents of newer releases to the index, without indexing it all again:
+        python3 main.py -f data.csv -b -u data_update1.csv data_update2.csv -q queries.txt -qr queries.relevance.filtered.txt
+    evaluate a grid of BM25 parameters on one index, 4 grid points at a time:
+        python3 main.py -f data.csv -b --sweep-k1 1.2 1.5 1.8 --sweep-b 0.25 0.5 0.75 --workers 4 -q queries.txt -qr queries.relevance.filtered.txt
+    cache the results of up to 5000 queries, using at most 64 MB:
+        python3 main.py -f data.csv -b --cache 5000 --cache-memory 64 -q queries.txt -qr queries.relevance.filtered.txt
+    evaluate a large set of queries in 8 processes:
+        python3 main.py -f data.csv -b --eval-workers 8 -q queries.txt -qr queries.relevance.filtered.txt
+    export the time percentiles of every stage in the Prometheus text format:
+        python3 main.py -f data.csv -b --timings timings.prom --timings-format prometheus -q queries.txt -qr queries.relevance.filtered.txt
+    serve the queries of a binary index on port 8080, scored in 4 processes, and load it with 32 clients:
+        python3 main.py -i index -t -b --serve localhost:8080 --serve-workers 4
+        python3 loadgen.py --url localhost:8080 -q queries.txt --concurrency 32 --duration 30
+    split the collection in 4 shards, indexed and searched by 4 processes:
+        python3 main.py -f data.csv -t -b --shards 4 -q queries.txt -qr queries.relevance.filtered.txt
     """
     parser = argparse.ArgumentParser()
-    parser.add_argument("-f", dest="data_file_path", required=True, help="Data file path")
+    parser.add_argument("-f", dest="data_file_path", required=False, help="Data file path")
     parser.add_argument("-t", dest="improved_tokenizer", required=False, help="Use improved tokenizer", default=False, action='store_true')
     parser.add_argument("-w", dest="indexer_file", required=False, help="Write index to file", default=None)
+    parser.add_argument("--compress", dest="compression", required=False, help="Compress the index file written with -w", choices=COMPRESSIONS, default=None)
+    parser.add_argument("-wb", dest="index_path_to_write", required=False, help="Write binary index to directory", default=None)
+    parser.add_argument("--quantize", dest="weight_bits", required=False, help="Compress the binary index, with weights of 8 or 16 bits", type=int, choices=[8, 16], default=0)
+    parser.add_argument("-u", dest="update_file_paths", required=False, help="Data files with documents to add or replace, after indexing -f", nargs="+", default=None)
+    parser.add_argument("-i", dest="index_path", required=False, help="Read binary index from directory", default=None)
+    parser.add_argument("--stem-cache", dest="stem_cache_size", required=False, help="Number of stems cached by the improved tokenizer", type=int, default=100000)
     parser.add_argument("-b", dest="bm25", required=False, help="Use the BM25 method to rank", default=False, action='store_true')
     parser.add_argument("--bk1", dest="bm25_k1_value", required=False, help="K value for the BM25 method", type=float, default=1.2)
     parser.add_argument("--bb", dest="bm25_b_value", required=False, help="B value for the BM25 method", type=float, default=0.75)  
+    parser.add_argument("--sweep-k1", dest="k1_grid", required=False, help="K values of the BM25 grid to evaluate", type=float, nargs="+", default=None)
+    parser.add_argument("--sweep-b", dest="b_grid", required=False, help="B values of the BM25 grid to evaluate", type=float, nargs="+", default=None)
     parser.add_argument("-q", dest="query_file_path", required=False, help="Queries file path")
     parser.add_argument("-qr", dest="query_relevance_file_path", required=False, help="Queries relevance file path")
+    parser.add_argument("--pruning", dest="pruning", required=False, help="Use MaxScore dynamic pruning on queries", default=False, action='store_true')
+    parser.add_argument("--engine", dest="engine", required=False, help="Engine used to score the queries", choices=["python", "numpy"], default="python")
+    parser.add_argument("--mode", dest="mode", required=False, help="Search the documents with any (or) or all (and) the query terms", choices=["or", "and"], default="or")
+    parser.add_argument("--impact", dest="impact", required=False, help="Search the postings in order of weight, stopping early, and compare with the exhaustive search", default=False, action='store_true')
+    parser.add_argument("--champions", dest="champions", required=False, help="Number of postings of highest weight searched for every term, with --impact", type=int, default=None)
+    parser.add_argument("--prune-top", dest="prune_top", required=False, help="Number of postings of highest weight kept of every term, after indexing", type=int, default=None)
+    parser.add_argument("--prune-weight", dest="prune_weight", required=False, help="Min weight of the postings kept, after indexing", type=float, default=None)
+    parser.add_argument("--prune-relative", dest="prune_relative", required=False, help="Min weight of the postings kept, relative to the max weight of their term", type=float, default=None)
+    parser.add_argument("--cache", dest="cache_size", required=False, help="Number of query results cached", type=int, default=0)
+    parser.add_argument("--cache-memory", dest="cache_memory", required=False, help="Memory budget in MB of the query results cached", type=int, default=None)
+    parser.add_argument("--batch", dest="batch", required=False, help="Search all the queries at once", default=False, action='store_true')
+    parser.add_argument("--workers", dest="workers", required=False, help="Number of processes used to index, or to evaluate the BM25 grid", type=int, default=1)
+    parser.add_argument("--eval-workers", dest="eval_workers", required=False, help="Number of processes used to evaluate the queries", type=int, default=1)
+    parser.add_argument("--timings", dest="timings_file", required=False, help="Write the time percentiles of every stage to file", default=None)
+    parser.add_argument("--timings-format", dest="timings_format", required=False, help="Format of the time percentiles file", choices=["json", "prometheus"], default="json")
+    parser.add_argument("--serve", dest="serve_address", required=False, help="Serve the queries over HTTP on host:port, or on a Unix socket path", default=None)
+    parser.add_argument("--serve-workers", dest="serve_workers", required=False, help="Number of processes used to score the queries served", type=int, default=2)
+    parser.add_argument("--batch-wait", dest="batch_wait", required=False, help="Time in ms a query served waits for others to be searched with it", type=float, default=2)
+    parser.add_argument("--shards", dest="shards", required=False, help="Number of shards the collection is split in, every shard has its own process", type=int, default=1)
+    parser.add_argument("--memory", dest="memory_budget", required=False, help="Memory budget in MB, index in blocks straight to the index file", type=int, default=None)
     args = parser.parse_args()
 
-    if not args.bm25 and (args.bm25_k1_value != 1.2 or args.bm25_b_value != 0.75):
+    if not args.data_file_path and not args.index_path:
+        parser.error("one of the flags -f or -i is required")
+    elif args.data_file_path and args.index_path:
+        parser.error("-f can not be used with -i")
+    elif args.index_path and (args.indexer_file or args.index_path_to_write or args.memory_budget):
+        parser.error("-i can not be used with -w, -wb or --memory")
+    elif args.update_file_paths and not args.data_file_path:
+        parser.error("-u requires the flag -f")
+    elif (args.update_file_paths or args.k1_grid or args.b_grid) and (args.indexer_file or args.index_path_to_write or args.memory_budget):
+        parser.error("-u, --sweep-k1 and --sweep-b can not be used with -w, -wb or --memory")
+    elif args.update_file_paths and args.workers != 1 and not (args.k1_grid or args.b_grid):
+        parser.error("-u can not be used with --workers")
+    elif (args.k1_grid or args.b_grid) and not (args.bm25 and args.data_file_path):
+        parser.error("--sweep-k1 and --sweep-b requires the flags -b and -f")
+    elif (args.k1_grid or args.b_grid) and not (args.query_file_path and args.query_relevance_file_path):
+        parser.error("--sweep-k1 and --sweep-b requires the flags -q and -qr")
+    elif args.k1_grid and not all(1 < k1 < 2 for k1 in args.k1_grid):
+        parser.error("K values of the BM25 grid must be greater than 1 and less than 2")
+    elif args.b_grid and not all(0 < b < 1 for b in args.b_grid):
+        parser.error("B values of the BM25 grid must be greater than 0 and less than 1")
+    elif not args.bm25 and (args.bm25_k1_value != 1.2 or args.bm25_b_value != 0.75):
         parser.error("--bk1 and --bb requires the flag -b")
     elif args.bm25_k1_value != 1.2 and not (1 < args.bm25_k1_value < 2):
         parser.error("K value for the BM25 method must be greater than 1 and less than 2")
     elif args.bm25_b_value != 0.75 and not (0 < args.bm25_b_value < 1):
         parser.error("B value for the BM25 method must be greater than 0 and less than 1")
+    elif args.stem_cache_size != 100000 and not args.improved_tokenizer:
+        parser.error("--stem-cache requires the flag -t")
+    elif args.stem_cache_size < 0:
+        parser.error("Number of stems cached must not be negative")
+    elif args.cache_size < 0:
+        parser.error("Number of query results cached must not be negative")
+    elif args.cache_memory is not None and args.cache_memory < 1:
+        parser.error("Memory budget of the query results cached must be greater than 0")
+    elif args.cache_memory and not args.cache_size:
+        parser.error("--cache-memory requires the flag --cache")
+    elif args.cache_size and args.batch:
+        parser.error("--cache can not be used with --batch")
+    elif args.workers < 1:
+        parser.error("Number of workers must be greater than 0")
+    elif args.timings_format != "json" and not args.timings_file:
+        parser.error("--timings-format requires the flag --timings")
+    elif args.eval_workers < 1:
+        parser.error("Number of evaluation workers must be greater than 0")
+    elif args.serve_address and (args.memory_budget or args.k1_grid or args.b_grid):
+        parser.error("--serve can not be used with --memory, --sweep-k1 or --sweep-b")
+    elif args.serve_address and args.cache_size:
+        parser.error("--serve can not be used with --cache, the queries are searched on the worker processes")
+    elif (args.serve_workers != 2 or args.batch_wait != 2) and not args.serve_address:
+        parser.error("--serve-workers and --batch-wait requires the flag --serve")
+    elif args.serve_workers < 1:
+        parser.error("Number of serve workers must be greater than 0")
+    elif args.batch_wait < 0:
+        parser.error("Batch wait must not be negative")
+    elif args.shards < 1:
+        parser.error("Number of shards must be greater than 0")
+    elif args.shards > 1 and not args.data_file_path:
+        parser.error("--shards requires the flag -f")
+    elif args.shards > 1 and (args.indexer_file or args.index_path_to_write or args.memory_budget or args.update_file_paths
+                              or args.k1_grid or args.b_grid or args.cache_size or args.serve_address):
+        parser.error("--shards can not be used with -w, -wb, --memory, -u, --sweep-k1, --sweep-b, --cache or --serve")
+    elif args.memory_budget is not None and args.memory_budget < 1:
+        parser.error("Memory budget must be greater than 0")
+    elif args.memory_budget and not args.indexer_file:
+        parser.error("--memory requires the flag -w")
+    elif args.compression and not args.indexer_file:
+        parser.error("--compress requires the flag -w")
+    elif args.compression and args.memory_budget:
+        parser.error("--compress can not be used with --memory")
+    elif args.compression == "zstd" and importlib.util.find_spec("zstandard") is None:
+        parser.error("--compress zstd requires the zstandard package")
+    elif args.weight_bits and not args.index_path_to_write:
+        parser.error("--quantize requires the flag -wb")
+    elif args.pruning and args.engine == "numpy":
+        parser.error("--pruning can not be used with --engine numpy")
+    elif args.mode == "and" and (args.pruning or args.engine == "numpy"):
+        parser.error("--mode and can not be used with --pruning or --engine numpy")
+    elif args.impact and (args.pruning or args.engine == "numpy" or args.mode == "and"):
+        parser.error("--impact can not be used with --pruning, --engine numpy or --mode and")
+    elif args.impact and (args.shards > 1 or args.k1_grid or args.b_grid):
+        parser.error("--impact can not be used with --shards, --sweep-k1 or --sweep-b")
+    elif args.champions is not None and not args.impact:
+        parser.error("--champions requires the flag --impact")
+    elif args.champions is not None and args.champions < 1:
+        parser.error("Number of champions must be greater than 0")
+    elif (args.prune_top is not None or args.prune_weight is not None or args.prune_relative is not None) and \
+            (args.index_path or args.update_file_paths or args.k1_grid or args.b_grid or args.shards > 1 or args.memory_budget):
+        parser.error("--prune-top, --prune-weight and --prune-relative can not be used with -i, -u, --sweep-k1, --sweep-b, --shards or --memory")
+    elif (args.prune_top is not None or args.prune_weight is not None or args.prune_relative is not None) and \
+            (args.cache_size or args.impact):
+        parser.error("--prune-top, --prune-weight and --prune-relative can not be used with --cache or --impact, the latencies are compared")
+    elif args.prune_top is not None and args.prune_top < 1:
+        parser.error("Number of postings kept of every term must be greater than 0")
+    elif args.prune_weight is not None and args.prune_weight <= 0:
+        parser.error("Min weight of the postings kept must be greater than 0")
+    elif args.prune_relative is not None and not (0 < args.prune_relative < 1):
+        parser.error("Min relative weight of the postings kept must be greater than 0 and less than 1")
+    elif args.memory_budget and args.index_path_to_write:
+        parser.error("--memory can not be used with -wb")
+    elif args.memory_budget and args.query_file_path:
+        parser.error("--memory can not be used with -q, the index is not kept in memory")
 
     main(args.data_file_path,
          args.improved_tokenizer,
          args.indexer_file, 
          args.bm25,
-         args.bm25_b_value,
          args.bm25_k1_value,
+         args.bm25_b_value,
          args.query_file_path,
-         args.query_relevance_file_path)
+         args.query_relevance_file_path,
+         args.workers,
+         args.memory_budget,
+         args.index_path_to_write,
+         args.index_path,
+         args.weight_bits,
+         args.pruning,
+         args.engine,
+         args.batch,
+         args.stem_cache_size,
+         args.update_file_paths,
+         args.k1_grid,
+         args.b_grid,
+         args.cache_size,
+         args.cache_memory,
+         args.eval_workers,
+         args.serve_address,
+         args.serve_workers,
+         args.batch_wait,
+         args.shards,
+         args.mode,
+         args.impact,
+         args.champions,
+         args.compression,
+         args.prune_top,
+         args.prune_weight,
+         args.prune_relative)
+
+    print_timers()
+    if args.timings_file:
+        write_timers(args.timings_file, args.timings_format)